@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+端到端基准测试 - 用固定的本地音频样本跑各条识别路径，统计实时率 (RTF)
+覆盖：speech2text.run_analysis / LocalFileRecognizer / ChunkedFileRecognizer / 实时识别器（文件喂入）
+每个用例在独立子进程中运行（独立工作目录），保证峰值内存互不干扰、输出文件不污染仓库
+
+用法：
+    python benchmark.py --fixtures bench_fixtures --models tiny base --backends openai faster
+    python benchmark.py --compare bench_results/旧.json bench_results/新.json
+    python benchmark.py --startup          # GUI 冷启动耗时
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 识别路径 -> 支持的后端
+PATHS = {
+    "run_analysis": ("openai", "faster"),
+    "local": ("openai", "faster"),
+    "local_stream": ("openai", "faster"),
+    "chunked": ("openai", "faster"),
+    "realtime": ("openai",),
+    "realtime_faster": ("faster",),
+}
+
+AUDIO_EXTS = {'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg', '.opus', '.mp4', '.mkv', '.mov'}
+
+
+def _peak_rss_mb():
+    """当前进程峰值常驻内存（MB）；ru_maxrss 在 macOS 上是字节，Linux 上是 KB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _split_audio(src, out_dir, segment_seconds, ext):
+    """用 ffmpeg 把样本切成编号从 1 开始的分段文件"""
+    os.makedirs(out_dir, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', src,
+        '-vn', '-ac', '1', '-ar', '16000',
+        '-f', 'segment', '-segment_time', str(segment_seconds),
+        '-segment_start_number', '1',
+        os.path.join(out_dir, f"%d{ext}")
+    ]
+    subprocess.run(cmd, check=True)
+    return sorted(
+        (os.path.join(out_dir, f) for f in os.listdir(out_dir)),
+        key=lambda p: int(os.path.splitext(os.path.basename(p))[0])
+    )
+
+
+def run_case(case):
+    """
+    在当前进程中执行一个用例（由子进程调用）
+    :param case: {"path", "model", "backend", "fixture"}
+    :return: 指标字典
+    """
+    sys.path.insert(0, REPO_DIR)
+    from local_file_recognition import probe_duration
+
+    path = case["path"]
+    model = case["model"]
+    backend = case["backend"]
+    fixture = case["fixture"]
+    audio_seconds = probe_duration(fixture)
+
+    # 准备输入（不计入耗时）
+    chunk_files = None
+    if path == "run_analysis":
+        job_name = "bench"
+        _split_audio(fixture, os.path.join("audio", "slice", job_name), 45, ".mp3")
+    elif path == "chunked":
+        chunk_files = _split_audio(fixture, "chunks", 60, ".wav")
+
+    # 模型加载
+    load_start = time.perf_counter()
+    if path == "run_analysis":
+        import speech2text
+        speech2text.load_whisper(model, backend=backend)
+    elif path in ("local", "local_stream"):
+        from local_file_recognition import LocalFileRecognizer
+        recognizer = LocalFileRecognizer(model_name=model, backend=backend,
+                                         streaming=(path == "local_stream"))
+        recognizer.load_model()
+    elif path == "chunked":
+        from chunked_file_recognition import ChunkedFileRecognizer
+        recognizer = ChunkedFileRecognizer(model_name=model, backend=backend)
+    elif path == "realtime":
+        from realtime_recognition import RealtimeRecognizer
+        # 文件一次性入队全部窗口，关闭积压合并，测的仍是逐窗口识别的开销
+        recognizer = RealtimeRecognizer(model_name=model, capture_audio=False, backlog_threshold=0)
+    elif path == "realtime_faster":
+        from realtime_recognition_faster import FasterRealtimeRecognizer
+        recognizer = FasterRealtimeRecognizer(model_name=model, capture_audio=False, backlog_threshold=0)
+    else:
+        raise ValueError(f"未知的识别路径: {path}")
+    load_time = time.perf_counter() - load_start
+
+    # 识别
+    cpu_start = _cpu_seconds()
+    wall_start = time.perf_counter()
+    if path == "run_analysis":
+        speech2text.run_analysis(job_name)
+    elif path in ("local", "local_stream"):
+        recognizer.process_file(fixture, save_to_file=False)
+    elif path == "chunked":
+        recognizer.process_chunks(chunk_files, save_to_file=False)
+    else:
+        recognizer.transcribe_file(fixture)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = _cpu_seconds() - cpu_start
+
+    # 提示词缓存：命中一次即省去一次提示词编码，按平均编码耗时折算到每个分片/窗口
+    from whisper_backend import prompt_cache_stats
+    prompt = prompt_cache_stats()
+    calls = prompt["hits"] + prompt["misses"]
+    encode_ms = prompt["encode_seconds"] * 1000 / prompt["misses"] if prompt["misses"] else 0.0
+
+    return {
+        "audio_seconds": audio_seconds,
+        "load_time": round(load_time, 3),
+        "wall_time": round(wall_time, 3),
+        "rtf": round(wall_time / audio_seconds, 4) if audio_seconds else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "cpu_time": round(cpu_time, 3),
+        # 平均占用核数，以及相对全部核心的利用率
+        "cpu_cores_used": round(cpu_time / wall_time, 2) if wall_time else None,
+        "cpu_utilization": round(cpu_time / wall_time / (os.cpu_count() or 1), 3) if wall_time else None,
+        "prompt_cache_hits": prompt["hits"],
+        "prompt_saved_ms_per_slice": round(encode_ms * prompt["hits"] / calls, 3) if calls else None,
+    }
+
+
+# 启动阶段不应加载的重依赖
+HEAVY_MODULES = ("torch", "whisper", "faster_whisper", "moviepy", "pydub", "numpy", "pyaudio")
+
+
+def run_startup():
+    """
+    测量 GUI 冷启动（由子进程调用）：导入 window_realtime 的耗时、窗口首帧显示的耗时，
+    以及启动阶段已加载的重依赖
+    :return: 指标字典
+    """
+    sys.path.insert(0, REPO_DIR)
+    import_start = time.perf_counter()
+    import window_realtime
+    import_time = time.perf_counter() - import_start
+
+    window_time = None
+    try:
+        import tkinter as tk
+        window_start = time.perf_counter()
+        root = tk.Tk()
+        window_realtime.Bili2TextGUI(root)
+        root.update()  # 首帧绘制完成
+        window_time = time.perf_counter() - window_start
+        root.destroy()
+    except Exception as e:
+        # 无图形环境时只统计导入耗时
+        print(f"跳过窗口测量: {e}", file=sys.stderr)
+
+    return {
+        "import_time": round(import_time, 3),
+        "window_time": round(window_time, 3) if window_time is not None else None,
+        "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules],
+    }
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value}s"
+
+
+def measure_startup(runs):
+    """多次冷启动 GUI（每次独立进程），输出各项耗时的中位数"""
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-startup"],
+            cwd=REPO_DIR, capture_output=True, text=True
+        )
+        total = time.perf_counter() - start
+        if proc.returncode != 0:
+            print(f"[{i + 1}] 失败: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else '子进程异常退出'}")
+            return 1
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        sample["process_time"] = round(total, 3)
+        samples.append(sample)
+        print(f"[{i + 1}] 进程总耗时={_seconds(sample['process_time'])}  导入={_seconds(sample['import_time'])}  "
+              f"窗口首帧={_seconds(sample['window_time'])}")
+
+    def median(key):
+        values = sorted(s[key] for s in samples if s[key] is not None)
+        return values[len(values) // 2] if values else None
+
+    print(f"\n中位数: 进程总耗时={_seconds(median('process_time'))}  导入={_seconds(median('import_time'))}  "
+          f"窗口首帧={_seconds(median('window_time'))}")
+    heavy = samples[-1]["heavy_modules"]
+    print(f"启动阶段加载的重依赖: {', '.join(heavy) if heavy else '无'}")
+    return 0
+
+
+def _spawn_case(case):
+    """在独立子进程 + 临时工作目录中运行用例"""
+    work_dir = tempfile.mkdtemp(prefix="b2t_bench_")
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+            cwd=work_dir, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "子进程异常退出"}
+        # 子进程最后一行输出为 JSON 结果
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=REPO_DIR, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _case_key(result):
+    return (result["path"], result["model"], result["backend"], os.path.basename(result["fixture"]))
+
+
+def run_suite(fixtures_dir, models, backends, paths, output):
+    """运行全部用例并写入 JSON 结果文件"""
+    fixtures = sorted(
+        os.path.join(fixtures_dir, f) for f in os.listdir(fixtures_dir)
+        if os.path.splitext(f)[1].lower() in AUDIO_EXTS
+    )
+    if not fixtures:
+        print(f"错误: {fixtures_dir} 中没有音频样本")
+        return 1
+
+    results = []
+    for fixture in fixtures:
+        for path in paths:
+            for backend in backends:
+                if backend not in PATHS[path]:
+                    continue
+                for model in models:
+                    case = {"path": path, "model": model, "backend": backend,
+                            "fixture": os.path.abspath(fixture)}
+                    print(f"[{len(results) + 1}] {path} / {backend} / {model} / {os.path.basename(fixture)} ...",
+                          flush=True)
+                    metrics = _spawn_case(case)
+                    if "error" in metrics:
+                        print(f"    失败: {metrics['error']}")
+                    else:
+                        print(f"    RTF={metrics['rtf']}  耗时={metrics['wall_time']}s  "
+                              f"峰值内存={metrics['peak_rss_mb']}MB  CPU={metrics['cpu_cores_used']}核  "
+                              f"提示词缓存节省={metrics['prompt_saved_ms_per_slice']}ms/片")
+                    results.append({**case, **metrics})
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": datetime.now().isoformat(timespec='seconds'),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    if output is None:
+        os.makedirs(os.path.join(REPO_DIR, "bench_results"), exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(REPO_DIR, "bench_results", f"bench_{report['meta']['commit'] or 'nogit'}_{timestamp}.json")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到: {output}")
+    return 0
+
+
+def compare(baseline_file, current_file, threshold):
+    """
+    对比两次基准结果，RTF 或峰值内存变差超过阈值视为回归
+    :return: 存在回归时返回 1
+    """
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = {_case_key(r): r for r in json.load(f)["results"] if "error" not in r}
+    with open(current_file, encoding='utf-8') as f:
+        current = [r for r in json.load(f)["results"] if "error" not in r]
+
+    regressions = 0
+    print(f"{'用例':<50} {'RTF':>16} {'峰值内存MB':>20}")
+    for result in current:
+        key = _case_key(result)
+        old = baseline.get(key)
+        if not old:
+            continue
+        flags = []
+        for metric in ("rtf", "peak_rss_mb"):
+            if old.get(metric) and result.get(metric) and result[metric] > old[metric] * (1 + threshold):
+                flags.append(metric)
+        regressions += bool(flags)
+        name = " / ".join(key)
+        mark = "  <-- 回归" if flags else ""
+        print(f"{name:<50} {str(old['rtf']):>7} -> {str(result['rtf']):<7} "
+              f"{str(old['peak_rss_mb']):>8} -> {str(result['peak_rss_mb']):<8}{mark}")
+
+    print(f"\n共 {regressions} 个用例回归（阈值 {threshold:.0%}）")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bili2text 端到端识别基准测试")
+    parser.add_argument("--fixtures", default=os.path.join(REPO_DIR, "bench_fixtures"),
+                        help="音频样本目录")
+    parser.add_argument("--models", nargs="+", default=["tiny", "base", "small"],
+                        help="模型列表")
+    parser.add_argument("--backends", nargs="+", default=["openai", "faster"],
+                        help="后端列表 (openai / faster)")
+    parser.add_argument("--paths", nargs="+", default=list(PATHS), choices=list(PATHS),
+                        help="识别路径列表")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 bench_results/bench_<commit>_<时间>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="对比两个结果文件")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="回归判定阈值（相对变化），默认 0.10")
+    parser.add_argument("--startup", type=int, nargs="?", const=5, metavar="RUNS",
+                        help="测量 GUI 冷启动耗时（默认 5 次取中位数）")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--run-startup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        result = run_case(json.loads(args.run_case))
+        print(json.dumps(result))
+        return 0
+
+    if args.run_startup:
+        print(json.dumps(run_startup()))
+        return 0
+
+    if args.startup:
+        return measure_startup(args.startup)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    return run_suite(args.fixtures, args.models, args.backends, args.paths, args.output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,20 +5,27 @@
 """
 
 import os
-import whisper
 from datetime import datetime
 from pathlib import Path
 
+from whisper_backend import BACKEND_OPENAI, BACKEND_FASTER, backend_from_label
+import model_cache
+import metrics
+import progress
+
 
 class ChunkedFileRecognizer:
-    def __init__(self, model_name="base", initial_prompt="", progress_callback=None):
+    def __init__(self, model_name="base", initial_prompt="", progress_callback=None,
+                 backend=BACKEND_OPENAI):
         """
         初始化分段识别器
         :param model_name: Whisper模型名称
         :param initial_prompt: 初始提示词
         :param progress_callback: 进度回调函数
+        :param backend: 识别后端 (openai / faster)，见 whisper_backend
         """
         self.model_name = model_name
+        self.backend = backend_from_label(backend)
         self.initial_prompt = initial_prompt or "以下是普通话的句子。"
         self.progress_callback = progress_callback
         self.model = None
@@ -30,9 +37,8 @@ class ChunkedFileRecognizer:
     def _load_model(self):
         """加载Whisper模型"""
         self._update_progress(f"正在加载{self.model_name}模型...")
-        device = "cuda" if whisper.torch.cuda.is_available() else "cpu"
-        self.model = whisper.load_model(self.model_name, device=device)
-        self._update_progress(f"模型加载完成 (设备: {device})")
+        self.model = model_cache.get(self.model_name, self.backend)
+        self._update_progress(f"模型加载完成 (后端: {self.backend}, 设备: {self.model.device})")
 
     def _update_progress(self, message):
         """更新进度信息"""
@@ -41,14 +47,15 @@ class ChunkedFileRecognizer:
             self.progress_callback(message)
 
     def process_chunks(self, chunk_files, save_to_file=True, delete_after=False,
-                       chunk_callback=None, frame_callback=None):
+                       chunk_callback=None, audio_progress_callback=None):
         """
         处理多个分段文件
         :param chunk_files: 文件路径列表或单个文件路径
         :param save_to_file: 是否保存到文件
         :param delete_after: 识别完成后是否删除分段文件
         :param chunk_callback: 每段识别后的回调 fn(idx, total, text) -> bool，返回 False 中止
-        :param frame_callback: 帧级进度回调 fn(chunk_idx, total_chunks, current_frames, total_frames)
+        :param audio_progress_callback: 进度回调 fn(done_seconds, total_seconds)，按已识别的音频秒数
+                                        （跨所有分段累计）上报，最高 10 Hz
         :return: 合并后的识别文本
         """
         # 确保是列表
@@ -68,66 +75,57 @@ class ChunkedFileRecognizer:
         all_results = []
         previous_text = ""  # 用于上下文传递
 
-        # 逐个识别每个分段
-        for i, chunk_path in enumerate(chunk_files, 1):
-            if not os.path.exists(chunk_path):
-                self._update_progress(f"警告: 文件不存在 {chunk_path}")
-                continue
-
-            file_name = os.path.basename(chunk_path)
-            self._update_progress(f"[{i}/{total_chunks}] 正在识别: {file_name}")
-
-            try:
-                # 使用前一段的末尾作为提示（改善上下文连贯性）
-                if previous_text:
-                    # 取前一段最后50个字符作为上下文
-                    context = previous_text[-100:].strip()
-                    prompt = f"{self.initial_prompt} {context}"
-                else:
-                    prompt = self.initial_prompt
-
-                # 识别当前分段（捕获 tqdm 帧级进度）
-                if frame_callback:
-                    import tqdm as _tqdm_mod
-                    from tqdm import tqdm as _orig_tqdm
-                    _chunk_i, _total_c = i, total_chunks
-
-                    class _ProgressTqdm(_orig_tqdm):
-                        def update(self, n=1):
-                            super().update(n)
-                            frame_callback(_chunk_i, _total_c, self.n, self.total)
-
-                    _saved_cls = _tqdm_mod.tqdm
-                    _tqdm_mod.tqdm = _ProgressTqdm
-                    try:
-                        result = self.model.transcribe(
-                            chunk_path, language="zh", initial_prompt=prompt,
-                            temperature=0.2, fp16=False, verbose=False)
-                    finally:
-                        _tqdm_mod.tqdm = _saved_cls
-                else:
-                    result = self.model.transcribe(
-                        chunk_path, language="zh", initial_prompt=prompt,
-                        temperature=0.2, fp16=False, verbose=False)
-
-                # 提取文本
-                text = result["text"].strip()
-                if text:
-                    all_results.append(text)
-                    previous_text = text
-
-                    # 计算进度百分比
-                    progress = int((i / total_chunks) * 100)
-                    self._update_progress(f"[{i}/{total_chunks}] 完成 {progress}% - {len(text)}字符")
-
-                    # 回调检查（重复检测等）
-                    if chunk_callback and not chunk_callback(i, total_chunks, text):
-                        self._update_progress("识别已中止")
-                        break
-
-            except Exception as e:
-                self._update_progress(f"识别失败 {file_name}: {str(e)}")
-                continue
+        # 进度按音频秒数上报：先探测各分段时长得到总时长
+        durations = [0.0] * total_chunks
+        if audio_progress_callback:
+            from local_file_recognition import probe_duration
+            durations = [probe_duration(p) or 0.0 for p in chunk_files]
+
+        with progress.report_progress(audio_progress_callback,
+                                      total_seconds=sum(durations) or None) as reporter:
+            # 逐个识别每个分段
+            for i, chunk_path in enumerate(chunk_files, 1):
+                if not os.path.exists(chunk_path):
+                    self._update_progress(f"警告: 文件不存在 {chunk_path}")
+                    continue
+
+                file_name = os.path.basename(chunk_path)
+                self._update_progress(f"[{i}/{total_chunks}] 正在识别: {file_name}")
+
+                try:
+                    # 使用前一段的末尾作为提示（改善上下文连贯性）
+                    if previous_text:
+                        # 取前一段最后50个字符作为上下文
+                        context = previous_text[-100:].strip()
+                        prompt = f"{self.initial_prompt} {context}"
+                    else:
+                        prompt = self.initial_prompt
+
+                    # 识别当前分段
+                    result = self._transcribe_chunk(chunk_path, prompt)
+                    if reporter:
+                        reporter.advance(result.get("duration") or durations[i - 1])
+
+                    # 提取文本
+                    text = result["text"].strip()
+                    if text:
+                        all_results.append(text)
+                        previous_text = text
+
+                        # 计算进度百分比
+                        percent = int((i / total_chunks) * 100)
+                        self._update_progress(f"[{i}/{total_chunks}] 完成 {percent}% - {len(text)}字符")
+
+                        # 回调检查（重复检测等）
+                        if chunk_callback and not chunk_callback(i, total_chunks, text):
+                            self._update_progress("识别已中止")
+                            break
+
+                except Exception as e:
+                    self._update_progress(f"识别失败 {file_name}: {str(e)}")
+                    if reporter:
+                        reporter.advance(durations[i - 1])
+                    continue
 
         # 合并所有结果
         self._update_progress("正在合并识别结果...")
@@ -150,6 +148,16 @@ class ChunkedFileRecognizer:
 
         return final_text
 
+    def _transcribe_chunk(self, chunk_path, prompt):
+        """识别单个分段，并记录 transcribe 阶段指标"""
+        with metrics.span("transcribe", file=os.path.basename(chunk_path), model=self.model_name,
+                          backend=self.backend, bytes_in=metrics.file_size(chunk_path)) as s:
+            result = self.model.transcribe(
+                chunk_path, language="zh", initial_prompt=prompt,
+                temperature=0.2, fp16=False, verbose=False)
+            s.set("audio_seconds", result.get("duration", 0))
+        return result
+
     def _save_result(self, text, first_file_path):
         """保存识别结果到文件"""
         output_dir = "outputs"
@@ -163,9 +171,13 @@ class ChunkedFileRecognizer:
         # 写入文件
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write(f"分段识别结果\n")
-            f.write(f"模型: {self.model_name}\n")
+            model_label = self.model_name
+            if self.backend == BACKEND_FASTER:
+                model_label += " (faster-whisper)"
+            segment_count = len(text.split('\n'))
+            f.write(f"模型: {model_label}\n")
             f.write(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"分段数: {len(text.split('\\n'))}段\n")
+            f.write(f"分段数: {segment_count}段\n")
             if self.initial_prompt and self.initial_prompt != "以下是普通话的句子。":
                 f.write(f"提示词: {self.initial_prompt}\n")
             f.write("=" * 50 + "\n\n")
@@ -1,16 +1,17 @@
-from moviepy.editor import VideoFileClip
-from pydub import AudioSegment
 import os
 import time
 import subprocess
 
+import metrics
+
 def check_video_integrity(file_path):
     """使用 FFmpeg 验证视频文件完整性"""
-    result = subprocess.run(
-        ['ffmpeg', '-v', 'error', '-i', file_path, '-f', 'null', '-'],
-        stderr=subprocess.PIPE,
-        text=True
-    )
+    with metrics.span("check_integrity", bytes_in=metrics.file_size(file_path)):
+        result = subprocess.run(
+            ['ffmpeg', '-v', 'error', '-i', file_path, '-f', 'null', '-'],
+            stderr=subprocess.PIPE,
+            text=True
+        )
     if result.stderr:
         print(f"视频文件可能损坏: {file_path}")
         print(f"FFmpeg 错误信息: {result.stderr}")
@@ -35,28 +36,39 @@ def convert_flv_to_mp3(name, target_name=None, folder='bilibili_video'):
     if not check_video_integrity(input_path):
         raise ValueError(f"视频文件损坏: {input_path}")
     # 提取视频中的音频并保存为 MP3 到 audio/conv 目录
-    clip = VideoFileClip(input_path)
-    audio = clip.audio
-    os.makedirs("audio/conv", exist_ok=True)
     output_name = target_name if target_name else name
-    audio.write_audiofile(f"audio/conv/{output_name}.mp3")
+    output_path = f"audio/conv/{output_name}.mp3"
+    from moviepy.editor import VideoFileClip  # moviepy 导入较慢，用到时再加载
+    with metrics.span("convert", bytes_in=metrics.file_size(input_path)) as s:
+        clip = VideoFileClip(input_path)
+        audio = clip.audio
+        os.makedirs("audio/conv", exist_ok=True)
+        audio.write_audiofile(output_path)
+        s.set("audio_seconds", audio.duration)
+        s.set("bytes_out", metrics.file_size(output_path))
 
 def split_mp3(filename, folder_name, slice_length=45000, target_folder="audio/slice"):
-    audio = AudioSegment.from_mp3(filename)
-    total_slices = (len(audio)+ slice_length - 1) // slice_length
-    target_dir = os.path.join(target_folder, folder_name)
-    os.makedirs(target_dir, exist_ok=True)
-    for i in range(total_slices):
-        start = i * slice_length
-        end = start + slice_length
-        slice_audio = audio[start:end]
-        slice_path = os.path.join(target_dir, f"{i+1}.mp3")
-        slice_audio.export(slice_path, format="mp3")
-        print(f"Slice {i+1} saved: {slice_path}")
+    from pydub import AudioSegment
+    with metrics.span("split", bytes_in=metrics.file_size(filename)) as s:
+        audio = AudioSegment.from_mp3(filename)
+        total_slices = (len(audio)+ slice_length - 1) // slice_length
+        target_dir = os.path.join(target_folder, folder_name)
+        os.makedirs(target_dir, exist_ok=True)
+        for i in range(total_slices):
+            start = i * slice_length
+            end = start + slice_length
+            slice_audio = audio[start:end]
+            slice_path = os.path.join(target_dir, f"{i+1}.mp3")
+            slice_audio.export(slice_path, format="mp3")
+            print(f"Slice {i+1} saved: {slice_path}")
+        s.set("audio_seconds", len(audio) / 1000)
+        s.set("slices", total_slices)
+        s.set("bytes_out", metrics.file_size(target_dir))
 
-def process_audio_split(name):
+def process_audio_split(name, folder_name=None):
     # 生成唯一文件夹名，并依次调用转换和分割函数
-    folder_name = time.strftime('%Y%m%d%H%M%S')
+    # folder_name: 指定文件夹名（并发任务各自传入，避免同一秒开始的任务共用目录）
+    folder_name = folder_name or time.strftime('%Y%m%d%H%M%S')
     convert_flv_to_mp3(name, target_name=folder_name)
     conv_path = f"audio/conv/{folder_name}.mp3"
     if not os.path.exists(conv_path):
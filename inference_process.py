@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+独立进程识别 - 模型在子进程中运行，采集线程和界面所在的进程不再与 transcribe 争抢 GIL
+- 音频经共享内存环形缓冲区传给子进程（只传起点和长度，不序列化采样数据）
+- 识别结果经队列返回
+- InferenceProcess.transcribe() 与模型的 transcribe 用法相同，可直接替换 RealtimeRecognizer 的模型
+
+用法：
+    model = InferenceProcess("medium")
+    model.start()            # 子进程加载模型，完成后返回
+    result = model.transcribe(audio_array, language="zh")
+    model.close()
+"""
+
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+import numpy as np
+
+from whisper_backend import BACKEND_OPENAI
+
+SAMPLE_RATE = 16000
+
+
+class SharedAudioRing:
+    """共享内存中的 float32 环形缓冲区，写入方和读取方各在一个进程中"""
+
+    def __init__(self, capacity, shm, consumed):
+        """
+        :param capacity: 容量（采样数）
+        :param shm: multiprocessing.shared_memory.SharedMemory
+        :param consumed: 读取方已读完的位置（multiprocessing.Value，单调递增）
+        """
+        self.capacity = capacity
+        self.shm = shm
+        self.consumed = consumed
+        self.written = 0  # 写入方已写到的位置（单调递增，只在写入进程中使用）
+        self.buffer = np.ndarray((capacity,), dtype=np.float32, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, seconds, ctx, rate=SAMPLE_RATE):
+        from multiprocessing import shared_memory
+
+        capacity = int(seconds * rate)
+        shm = shared_memory.SharedMemory(create=True, size=capacity * 4)
+        return cls(capacity, shm, ctx.Value('q', 0, lock=False))
+
+    @classmethod
+    def attach(cls, name, capacity, consumed):
+        from multiprocessing import shared_memory
+
+        return cls(capacity, shared_memory.SharedMemory(name=name), consumed)
+
+    def free(self):
+        """可写入的采样数"""
+        return self.capacity - (self.written - self.consumed.value)
+
+    def write(self, samples):
+        """
+        写入一段采样
+        :return: (起点, 长度)；空间不足时返回 None（不阻塞写入方）
+        """
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        length = len(samples)
+        if length > self.free():
+            return None
+        start = self.written
+        position = start % self.capacity
+        first = min(length, self.capacity - position)
+        self.buffer[position:position + first] = samples[:first]
+        self.buffer[:length - first] = samples[first:]
+        self.written += length
+        return start, length
+
+    def read(self, start, length):
+        """读出一段采样（复制）并释放其空间"""
+        position = start % self.capacity
+        first = min(length, self.capacity - position)
+        audio = np.concatenate([self.buffer[position:position + first], self.buffer[:length - first]])
+        self.consumed.value = start + length
+        return audio
+
+    def close(self, unlink=False):
+        # 先释放对共享内存的引用，否则 close 会报 BufferError
+        self.buffer = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _serve(shm_name, capacity, consumed, tasks, results, model_name, backend):
+    """子进程：加载模型，逐个处理识别请求"""
+    ring = SharedAudioRing.attach(shm_name, capacity, consumed)
+    try:
+        from whisper_backend import load_backend
+
+        model = load_backend(model_name, backend)
+    except Exception as e:
+        results.put(("ready", None, f"模型加载失败: {e}"))
+        ring.close()
+        return
+    results.put(("ready", None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, start, length, options = task
+        audio = ring.read(start, length)
+        started = time.perf_counter()
+        try:
+            result = model.transcribe(audio, **options)
+            # 只回传可序列化的主要字段
+            reply = {"text": result["text"], "segments": result.get("segments", []),
+                     "language": result.get("language"), "duration": result.get("duration"),
+                     "elapsed": time.perf_counter() - started}
+            results.put((request_id, reply, None))
+        except Exception as e:
+            results.put((request_id, None, str(e)))
+    ring.close()
+
+
+class InferenceProcess:
+    def __init__(self, model_name, backend=BACKEND_OPENAI, ring_seconds=120, start_timeout=1800):
+        """
+        :param model_name: 模型名称（在子进程中加载，不使用本进程的模型缓存）
+        :param backend: 识别后端 (openai / faster)
+        :param ring_seconds: 环形缓冲区容量（秒）
+        :param start_timeout: 等待子进程加载模型的最长时间（秒）
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.ring_seconds = ring_seconds
+        self.start_timeout = start_timeout
+        self.process = None
+        self._ring = None
+        self._tasks = None
+        self._results = None
+        self._ids = itertools.count()
+        self._lock = threading.Lock()  # 子进程串行处理，请求也串行发送
+
+    @property
+    def name(self):
+        return f"{self.model_name} (独立进程)"
+
+    def start(self):
+        """启动子进程并等待模型加载完成"""
+        if self.process is not None:
+            return self
+        # spawn：子进程不继承本进程的线程和 torch 状态
+        ctx = mp.get_context("spawn")
+        self._ring = SharedAudioRing.create(self.ring_seconds, ctx)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self.process = ctx.Process(
+            target=_serve,
+            args=(self._ring.shm.name, self._ring.capacity, self._ring.consumed,
+                  self._tasks, self._results, self.model_name, self.backend),
+            daemon=True,
+        )
+        self.process.start()
+        print(f"识别进程已启动 (pid {self.process.pid})，正在加载 {self.model_name} 模型...")
+        try:
+            _, _, error = self._wait_result("ready", self.start_timeout)
+        except Exception:
+            self.close()
+            raise
+        if error:
+            self.close()
+            raise Exception(error)
+        print(f"识别进程模型 {self.model_name} 加载完成")
+        return self
+
+    def transcribe(self, audio, **options):
+        """
+        在子进程中识别（阻塞等待结果，等待期间不占用 GIL）
+        :param audio: 16kHz float32 数组
+        :param options: 传给模型 transcribe 的参数
+        :return: 结果字典（text / segments / language / duration / elapsed）
+        """
+        if self.process is None:
+            self.start()
+        with self._lock:
+            slot = self._ring.write(audio)
+            if slot is None:
+                raise Exception(f"识别进程缓冲区已满（{self.ring_seconds} 秒）")
+            request_id = next(self._ids)
+            self._tasks.put((request_id, slot[0], slot[1], options))
+            _, reply, error = self._wait_result(request_id)
+        if error:
+            raise Exception(f"识别进程出错: {error}")
+        return reply
+
+    def _wait_result(self, request_id, timeout=None):
+        """等待指定请求的结果；子进程意外退出时抛出异常"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                item = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise Exception(f"识别进程已退出 (exitcode {self.process.exitcode})")
+                if deadline is not None and time.monotonic() > deadline:
+                    raise Exception("等待识别进程超时")
+                continue
+            if item[0] == request_id:
+                return item
+
+    def close(self):
+        """结束子进程并释放共享内存"""
+        if self.process is None:
+            return
+        try:
+            self._tasks.put(None)
+            self.process.join(timeout=5)
+        finally:
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            self._ring.close(unlink=True)
+            self.process = None
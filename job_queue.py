@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+持久化任务队列 - 任务状态保存在 SQLite（默认项目目录下 jobs.db），进程崩溃或被杀后可自动续做
+
+- 工作进程以租约方式领取任务，运行期间后台线程定期续租；进程退出后租约过期，任务可被重新领取
+- 已完成的分片结果写入数据库，续做时只识别剩余分片
+- 失败的任务按指数退避重试，超过 max_attempts 次后标记为 failed
+
+命令行：
+    python3 job_queue.py submit BV1xxx [--model large-v3 --backend faster]
+    python3 job_queue.py worker [--forever]   # 处理队列直到没有可执行的任务（--forever 持续等待新任务）
+    python3 job_queue.py list
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+from language_detect import resolve_language
+from mel_features import recording_features
+from speech2text import transcribe_slice
+from whisper_backend import BACKEND_OPENAI, backend_from_label
+
+DB_FILE = os.environ.get("B2T_JOB_DB", "jobs.db")
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_DOWNLOADING = "downloading"
+STATUS_EXTRACTING = "extracting"
+STATUS_TRANSCRIBING = "transcribing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+KIND_BV = "bv"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    model TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    prompt TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    folder TEXT,
+    language TEXT,
+    output_file TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+CREATE TABLE IF NOT EXISTS slices (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    text TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class LeaseLost(Exception):
+    """租约已过期并被其他工作进程领取"""
+
+
+class JobQueue:
+    def __init__(self, path=None, lease_seconds=120, backoff_base=30.0, backoff_max=1800.0):
+        """
+        :param path: 数据库文件路径，默认 DB_FILE
+        :param lease_seconds: 租约时长（秒）；工作进程每 lease_seconds/3 续租一次
+        :param backoff_base: 第一次重试前的等待（秒），之后每次翻倍
+        :param backoff_max: 重试等待上限（秒）
+        """
+        self.path = path or DB_FILE
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "language" not in columns:
+            # 旧版本创建的数据库没有 language 列
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN language TEXT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _transaction(self, fn):
+        """在 BEGIN IMMEDIATE 事务中执行 fn(conn)，多个进程同时领取任务时互斥"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    # ---- 提交与查询 ----
+
+    def submit(self, kind, source, model, backend=BACKEND_OPENAI, prompt="", max_attempts=3):
+        """
+        提交任务
+        :return: 任务 ID
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, source, model, backend, prompt, status, max_attempts, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, source, model, backend_from_label(backend), prompt or "",
+             STATUS_QUEUED, max_attempts, now, now))
+        return job_id
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, include_finished=True):
+        sql = "SELECT * FROM jobs"
+        if not include_finished:
+            sql += f" WHERE status NOT IN ('{STATUS_DONE}', '{STATUS_FAILED}')"
+        return [dict(row) for row in self._execute(sql + " ORDER BY created").fetchall()]
+
+    def counts(self):
+        """各状态任务数"""
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    # ---- 租约 ----
+
+    def claim(self, worker_id, job_id=None):
+        """
+        领取一个可执行的任务：未结束、租约为空或已过期、已过退避时间
+        租约过期的任务（上次执行中进程退出）保留原阶段和已完成分片，从中断处继续
+        :param worker_id: 工作进程标识
+        :param job_id: 只领取指定任务
+        :return: 任务字典，无可领取任务时返回 None
+        """
+        def claim_one(conn):
+            now = time.time()
+            sql = ("SELECT * FROM jobs WHERE status NOT IN (?, ?) AND not_before <= ?"
+                   " AND (lease_expires IS NULL OR lease_expires < ?)")
+            params = [STATUS_DONE, STATUS_FAILED, now, now]
+            if job_id is not None:
+                sql += " AND id = ?"
+                params.append(job_id)
+            while True:
+                row = conn.execute(sql + " ORDER BY created LIMIT 1", params).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] >= row["max_attempts"]:
+                    # 反复中断（如每次都 OOM）的任务不再重试
+                    conn.execute("UPDATE jobs SET status = ?, error = ?, lease_owner = NULL,"
+                                 " lease_expires = NULL, updated = ? WHERE id = ?",
+                                 (STATUS_FAILED, row["error"] or "重试次数已用尽", now, row["id"]))
+                    continue
+                conn.execute("UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1,"
+                             " updated = ? WHERE id = ?",
+                             (worker_id, now + self.lease_seconds, now, row["id"]))
+                job = dict(row)
+                job["attempts"] += 1
+                job["lease_owner"] = worker_id
+                return job
+
+        return self._transaction(claim_one)
+
+    def renew(self, job_id, worker_id):
+        """续租；租约已被他人领取时返回 False"""
+        cursor = self._execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND lease_owner = ?",
+            (time.time() + self.lease_seconds, time.time(), job_id, worker_id))
+        return cursor.rowcount == 1
+
+    def update(self, job_id, worker_id, **fields):
+        """更新任务字段（status / folder / output_file 等），仅租约持有者可更新"""
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        cursor = self._execute(f"UPDATE jobs SET {columns} WHERE id = ? AND lease_owner = ?",
+                               (*fields.values(), job_id, worker_id))
+        if cursor.rowcount != 1:
+            raise LeaseLost(f"任务 {job_id} 的租约已失效")
+
+    def complete(self, job_id, worker_id, output_file=None):
+        self.update(job_id, worker_id, status=STATUS_DONE, output_file=output_file, error=None,
+                    lease_owner=None, lease_expires=None)
+
+    def fail(self, job_id, worker_id, error):
+        """
+        记录一次失败：未超过重试次数时按指数退避重新排队（保留阶段和已完成分片），否则标记为 failed
+        :return: 是否还会重试
+        """
+        job = self.get(job_id)
+        if job is None:
+            return False
+        if job["attempts"] >= job["max_attempts"]:
+            self.update(job_id, worker_id, status=STATUS_FAILED, error=error,
+                        lease_owner=None, lease_expires=None)
+            return False
+        delay = min(self.backoff_base * 2 ** (job["attempts"] - 1), self.backoff_max)
+        self.update(job_id, worker_id, error=error, not_before=time.time() + delay,
+                    lease_owner=None, lease_expires=None)
+        return True
+
+    def release(self, job_id, worker_id):
+        """主动放弃租约（例如用户中断），任务保持原状态等待下次领取，不计入重试次数"""
+        self._execute("UPDATE jobs SET lease_owner = NULL, lease_expires = NULL,"
+                      " attempts = MAX(attempts - 1, 0) WHERE id = ? AND lease_owner = ?",
+                      (job_id, worker_id))
+
+    # ---- 分片 ----
+
+    def set_slices(self, job_id, paths):
+        """登记任务的分片（重复登记时保留已完成的结果）"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO slices (job_id, idx, path) VALUES (?, ?, ?)",
+                [(job_id, i, path) for i, path in enumerate(paths)])
+
+    def slices(self, job_id):
+        rows = self._execute("SELECT * FROM slices WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def complete_slice(self, job_id, idx, text):
+        self._execute("UPDATE slices SET done = 1, text = ? WHERE job_id = ? AND idx = ?",
+                      (text, job_id, idx))
+
+    def reset_slices(self, job_id):
+        self._execute("DELETE FROM slices WHERE job_id = ?", (job_id,))
+
+
+class _LeaseKeeper:
+    """任务执行期间在后台线程定期续租"""
+
+    def __init__(self, queue, job_id, worker_id):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                if not self.queue.renew(self.job_id, self.worker_id):
+                    self.lost = True
+                    return
+            except sqlite3.Error as e:
+                print(f"[job_queue] 续租失败: {e}")
+
+
+class JobWorker:
+    def __init__(self, queue, transcribe_options=None, worker_id=None, progress_callback=None,
+                 two_pass_policy=None):
+        """
+        :param queue: JobQueue
+        :param transcribe_options: 传给 transcribe 的参数（language / beam_size / vad_filter 等）
+        :param two_pass_policy: 两遍识别策略（见 two_pass），None 时每个分片直接用 transcribe_options 识别
+        :param worker_id: 工作进程标识，默认 主机名:进程号:随机串
+        :param progress_callback: fn(job, message)，阶段和分片进度
+        """
+        self.queue = queue
+        self.transcribe_options = transcribe_options or {}
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.progress_callback = progress_callback
+        self.two_pass_policy = two_pass_policy
+        if two_pass_policy is not None:
+            two_pass_policy.validate(self.transcribe_options)
+
+    def run(self, forever=False, poll_interval=5.0):
+        """
+        处理队列中的任务
+        :param forever: True 时队列为空也持续等待，否则处理完当前可执行任务即返回
+        :return: 处理的任务数
+        """
+        processed = 0
+        while True:
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                if not forever:
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            self.run_job(job)
+            processed += 1
+
+    def run_one(self, job_id):
+        """
+        领取并执行指定任务（交互式入口提交后立即执行）
+        :return: 结束后的任务字典；任务正被其他进程执行或处于退避期时返回当前状态
+        """
+        job = self.queue.claim(self.worker_id, job_id=job_id)
+        if job is not None:
+            self.run_job(job)
+        return self.queue.get(job_id)
+
+    def run_job(self, job):
+        job_id = job["id"]
+        if job["attempts"] > 1:
+            self._report(job, f"继续任务（第 {job['attempts']} 次尝试，阶段: {job['status']}）")
+        metrics.start_job(f"queue_{job_id}", source=job["source"], model=job["model"],
+                          backend=job["backend"], attempt=job["attempts"])
+        try:
+            with _LeaseKeeper(self.queue, job_id, self.worker_id) as keeper:
+                output_file = self._process(job, keeper)
+            self.queue.complete(job_id, self.worker_id, output_file)
+            metrics.finish_job()
+            self._report(job, f"完成: {output_file}")
+        except KeyboardInterrupt:
+            self.queue.release(job_id, self.worker_id)
+            metrics.finish_job(status="failed")
+            raise
+        except LeaseLost as e:
+            metrics.finish_job(status="failed")
+            print(f"[job_queue] {e}")
+        except Exception as e:
+            metrics.finish_job(status="failed")
+            try:
+                retry = self.queue.fail(job_id, self.worker_id, str(e))
+            except LeaseLost:
+                retry = True
+            self._report(job, f"失败{'，稍后重试' if retry else ''}: {e}")
+
+    def _process(self, job, keeper):
+        from exAudio import process_audio_split
+        from utils import download_bilibili
+        import model_cache
+
+        job_id = job["id"]
+        folder = job["folder"]
+        if folder and not os.path.isdir(f"audio/slice/{folder}"):
+            # 中间文件已被清理，从头开始
+            self.queue.reset_slices(job_id)
+            folder = None
+
+        if not folder:
+            self._set_status(job, STATUS_DOWNLOADING)
+            bv = os.path.basename(os.path.normpath(download_bilibili(job["source"])))
+            self._set_status(job, STATUS_EXTRACTING)
+            # 文件夹名带上任务 id，同一秒开始提取的多个工作进程不会共用分片目录
+            folder = process_audio_split(bv, folder_name=f"{time.strftime('%Y%m%d%H%M%S')}_{job_id}")
+            slice_dir = f"audio/slice/{folder}"
+            names = sorted(os.listdir(slice_dir), key=lambda x: int(os.path.splitext(x)[0]))
+            self.queue.set_slices(job_id, [os.path.join(slice_dir, n) for n in names])
+            self.queue.update(job_id, self.worker_id, folder=folder)
+            job["folder"] = folder
+
+        self._set_status(job, STATUS_TRANSCRIBING)
+        # 两遍识别的两个模型在任务期间固定在缓存中，任务结束后缓存回到 MAX_MODELS 以内
+        pinned = self.two_pass_policy.pinned_models() if self.two_pass_policy is not None else []
+        with model_cache.pinned(job["model"], *pinned, backend=job["backend"]):
+            self._transcribe_slices(job, keeper, folder)
+
+        # 按分片顺序整体写出，续做的任务也得到完整结果
+        os.makedirs("outputs", exist_ok=True)
+        output_file = f"outputs/{folder}.txt"
+        with open(output_file, "w", encoding="utf-8") as f:
+            for item in self.queue.slices(job_id):
+                f.write(item["text"] or "")
+                f.write("\n")
+        return output_file
+
+    def _transcribe_slices(self, job, keeper, folder):
+        """识别任务中尚未完成的分片，结果逐片写入数据库"""
+        import model_cache
+
+        job_id = job["id"]
+        model = model_cache.get(job["model"], job["backend"])
+        fast_model = None
+        if self.two_pass_policy is not None:
+            fast_model = self.two_pass_policy.load_fast_model(model, job["backend"])
+        slices = self.queue.slices(job_id)
+        options = dict(self.transcribe_options)
+        # 未指定语种时整个任务只检测一次；结果存入任务记录，续做时沿用，同一份转写不会混用两种语种
+        options["language"] = resolve_language(
+            model, [item["path"] for item in slices if not item["done"]],
+            override=options.get("language") or job.get("language"))
+        if options["language"] != job.get("language"):
+            self.queue.update(job_id, self.worker_id, language=options["language"])
+            job["language"] = options["language"]
+        # 整段录音的 mel 只计算一次（有磁盘缓存）；两遍识别和 VAD 需要原始音频
+        features = None
+        if self.two_pass_policy is None and not options.get("vad_filter"):
+            features = recording_features(folder, model)
+        for item in slices:
+            if item["done"]:
+                continue
+            if keeper.lost:
+                raise LeaseLost(f"任务 {job_id} 的租约已失效")
+            self._report(job, f"正在转换第{item['idx'] + 1}/{len(slices)}个音频...")
+            text, _ = transcribe_slice(model, item["path"], job["prompt"], features=features,
+                                       policy=self.two_pass_policy, fast_model=fast_model, **options)
+            print(text)
+            self.queue.complete_slice(job_id, item["idx"], text)
+
+    def _set_status(self, job, status):
+        self.queue.update(job["id"], self.worker_id, status=status)
+        job["status"] = status
+        self._report(job, status)
+
+    def _report(self, job, message):
+        print(f"[job_queue] {job['id']} {message}")
+        if self.progress_callback:
+            self.progress_callback(job, message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bili2text 持久化任务队列")
+    parser.add_argument("--db", default=None, help="数据库文件（默认 jobs.db 或 B2T_JOB_DB）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    submit = sub.add_parser("submit", help="提交 BV 任务")
+    submit.add_argument("source", help="BV 号或视频 URL")
+    submit.add_argument("--model", default="medium")
+    submit.add_argument("--backend", default=BACKEND_OPENAI)
+    submit.add_argument("--prompt", default="")
+    submit.add_argument("--max-attempts", type=int, default=3)
+
+    worker = sub.add_parser("worker", help="处理队列中的任务")
+    worker.add_argument("--forever", action="store_true", help="队列为空时继续等待新任务")
+
+    sub.add_parser("list", help="列出任务")
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    if args.command == "submit":
+        job_id = queue.submit(KIND_BV, args.source, args.model, args.backend, args.prompt, args.max_attempts)
+        print(job_id)
+    elif args.command == "worker":
+        processed = JobWorker(queue).run(forever=args.forever)
+        print(f"处理了 {processed} 个任务，当前队列: {queue.counts()}")
+    else:
+        for job in queue.list():
+            slices = queue.slices(job["id"])
+            done = sum(item["done"] for item in slices)
+            print(f"{job['id']}  {job['status']:<12} {done}/{len(slices)} 分片  "
+                  f"尝试 {job['attempts']}/{job['max_attempts']}  {job['source']}"
+                  + (f"  错误: {job['error']}" if job["error"] else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+语种检测 - 每个任务只检测一次，之后所有分片固定使用该语种
+不指定 language 时 Whisper 会对每个分片的前 30 秒单独做一次语种检测，
+200 个分片的视频就多了 199 次重复检测
+
+做法：从分片中均匀抽取几个，按能量找出语音最多的 30 秒窗口，
+对这些窗口做语种检测并按概率累加投票；结果记录为 language_detect 阶段，
+并写入任务报告的 meta.language
+
+用法：
+    language = resolve_language(model, slice_paths, override=None)
+    model.transcribe(path, language=language, ...)
+
+环境变量 B2T_LANGUAGE 可直接指定语种（如 zh / en），跳过检测
+"""
+
+import os
+
+import numpy as np
+
+import metrics
+
+SAMPLE_RATE = 16000
+# Whisper 语种检测只看前 30 秒
+WINDOW_SECONDS = 30
+
+
+def speech_windows(audio, count=1, frame_seconds=0.5, threshold=0.02):
+    """
+    按能量挑选语音最多的窗口
+    :param audio: 16kHz float32 数组
+    :param count: 最多返回的窗口数
+    :param frame_seconds: 计算能量的帧长（秒）
+    :param threshold: 帧 RMS 超过该值视为有声音
+    :return: [(有声帧比例, 窗口数组)]，按比例从高到低，不含静音窗口
+    """
+    window = WINDOW_SECONDS * SAMPLE_RATE
+    frame = int(frame_seconds * SAMPLE_RATE)
+    scored = []
+    for start in range(0, max(len(audio) - frame, 1), window):
+        chunk = audio[start:start + window]
+        frames = len(chunk) // frame
+        if frames == 0:
+            continue
+        rms = np.sqrt(np.mean(chunk[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+        voiced = float(np.mean(rms > threshold))
+        if voiced > 0:
+            scored.append((voiced, chunk))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored[:count]
+
+
+def detect_language(model, audios):
+    """
+    对多个窗口做语种检测，按概率累加投票
+    :param model: 具有 detect_language(audio) 的识别后端（见 whisper_backend）
+    :param audios: 16kHz float32 数组列表
+    :return: (语种代码, 平均概率)，没有可用窗口时返回 (None, 0.0)
+    """
+    votes = {}
+    for audio in audios:
+        language, probability = model.detect_language(audio)
+        votes[language] = votes.get(language, 0.0) + probability
+    if not votes:
+        return None, 0.0
+    language = max(votes, key=votes.get)
+    return language, votes[language] / len(audios)
+
+
+def resolve_language(model, paths, override=None, windows=3, min_probability=0.5):
+    """
+    确定整个任务使用的语种
+    :param model: 识别后端
+    :param paths: 分片路径列表（按顺序）
+    :param override: 明确指定的语种，优先于 B2T_LANGUAGE 和检测结果
+    :param windows: 参与检测的窗口数
+    :param min_probability: 检测概率低于该值时不固定语种（返回 None，仍由 Whisper 逐片检测）
+    :return: 语种代码或 None
+    """
+    override = override or os.environ.get("B2T_LANGUAGE") or None
+    job = metrics.current_job()
+    if override:
+        if job is not None:
+            job.meta["language"] = override
+            job.meta["language_source"] = "override"
+        return override
+    if not paths:
+        return None
+
+    from local_file_recognition import load_audio
+
+    with metrics.span("language_detect") as s:
+        # 均匀抽取分片，每个分片取语音最多的一个窗口
+        step = max(len(paths) // windows, 1)
+        candidates = []
+        for path in paths[::step][:windows * 2]:
+            try:
+                candidates.extend(speech_windows(load_audio(path)))
+            except Exception as e:
+                print(f"语种检测读取 {path} 失败: {e}")
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        audios = [audio for _, audio in candidates[:windows]]
+
+        language, probability = detect_language(model, audios)
+        s.set("language", language)
+        s.set("probability", round(probability, 3))
+        s.set("windows", len(audios))
+        s.set("audio_seconds", round(sum(len(a) for a in audios) / SAMPLE_RATE, 3))
+
+    if language is None or probability < min_probability:
+        print(f"语种检测结果不确定（{language}, {probability:.2f}），各分片单独检测")
+        language = None
+    else:
+        print(f"检测到语种：{language}（概率 {probability:.2f}，{len(audios)} 个窗口），所有分片沿用")
+    if job is not None:
+        job.meta["language"] = language
+        job.meta["language_source"] = "detected"
+    return language
@@ -5,28 +5,154 @@
 """
 
 import os
-import whisper
-import tempfile
 import subprocess
+import tempfile
+import numpy as np
 from datetime import datetime
 from pathlib import Path
 
+from whisper_backend import BACKEND_OPENAI, BACKEND_FASTER, backend_from_label
+import model_cache
+import mel_features
+import metrics
+import profiling
+import progress
+
+# Whisper 要求的输入采样率
+SAMPLE_RATE = 16000
+# Whisper mel 帧率（每秒帧数），与 transcribe 内部 tqdm 进度条单位一致
+FRAMES_PER_SECOND = 100
+
+
+def load_audio(file_path):
+    """
+    使用 ffmpeg 将音频/视频直接解码为 16kHz 单声道 float32 数组
+    PCM 数据走 stdout 管道读入内存，不再落地临时 WAV，也避免 transcribe 再解码一次
+    :param file_path: 文件路径
+    :return: numpy float32 数组（取值范围 -1.0 ~ 1.0）
+    """
+    cmd = [
+        'ffmpeg', '-nostdin',
+        '-threads', '0',
+        '-i', file_path,
+        '-vn',                    # 丢弃视频流
+        '-f', 's16le',            # 原始 PCM 输出
+        '-acodec', 'pcm_s16le',
+        '-ac', '1',               # 单声道
+        '-ar', str(SAMPLE_RATE),  # 16kHz 采样率
+        '-'                       # 输出到 stdout
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+    except FileNotFoundError:
+        raise Exception("未找到 ffmpeg，请先安装: brew install ffmpeg")
+
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='ignore')
+        raise Exception(f"音频解码失败: {stderr}")
+
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def probe_duration(file_path):
+    """
+    使用 ffprobe 获取媒体时长
+    :return: 时长（秒），获取失败返回 None
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        file_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        return float(result.stdout.strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def iter_audio_blocks(file_path, block_seconds=30):
+    """
+    流式解码：ffmpeg 持续输出 PCM，按固定大小分块读出
+    :param file_path: 文件路径
+    :param block_seconds: 每块时长（秒）
+    :return: 生成器，逐块产出 float32 数组
+    """
+    cmd = [
+        'ffmpeg', '-nostdin',
+        '-threads', '0',
+        '-i', file_path,
+        '-vn',
+        '-f', 's16le',
+        '-acodec', 'pcm_s16le',
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        '-'
+    ]
+
+    # stderr 写入临时文件：用管道的话 ffmpeg 输出大量警告时会阻塞，与读 stdout 互相等待
+    stderr = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+    except FileNotFoundError:
+        stderr.close()
+        raise Exception("未找到 ffmpeg，请先安装: brew install ffmpeg")
+
+    block_bytes = int(block_seconds * SAMPLE_RATE) * 2  # int16 每个采样 2 字节
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+        # 读完才检查退出码；调用方提前中止时走 finally，不算解码失败
+        if process.wait() != 0:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', errors='ignore')
+            raise Exception(f"音频解码失败: {message}")
+    finally:
+        # 提前中止时也要结束 ffmpeg 进程
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        stderr.close()
+
 
 class LocalFileRecognizer:
-    def __init__(self, model_name="base", initial_prompt="", progress_callback=None):
+    def __init__(self, model_name="base", initial_prompt="", progress_callback=None,
+                 streaming=None, stream_window=600, stream_threshold=3600,
+                 backend=BACKEND_OPENAI, audio_progress_callback=None, segment_callback=None):
         """
         初始化本地文件识别器
         :param model_name: whisper模型名称 (tiny, base, small, medium, large, large-v2, large-v3)
         :param initial_prompt: 初始提示词，用于提高识别准确度
         :param progress_callback: 进度回调函数，用于更新GUI
+        :param streaming: 流式识别开关；None 表示按时长自动判断，True/False 强制开关
+        :param stream_window: 流式识别每个窗口的时长（秒），决定内存上限
+        :param stream_threshold: 自动模式下，超过该时长（秒）的文件使用流式识别
+        :param backend: 识别后端 (openai / faster)，见 whisper_backend
+        :param audio_progress_callback: 识别进度回调 fn(done_seconds, total_seconds)，
+                                        按已识别的音频秒数上报，最高 10 Hz（可在工作线程中并发使用）
+        :param segment_callback: 分段回调 fn(segment)，流式识别时每个窗口识别完即回调该窗口的分段
         """
         self.model_name = model_name
+        self.backend = backend_from_label(backend)
         self.model = None
         self.initial_prompt = initial_prompt or "以下是普通话的句子。"
         self.progress_callback = progress_callback
+        self.audio_progress_callback = audio_progress_callback
+        self.segment_callback = segment_callback
         self.is_processing = False
         self.last_output_file = None
 
+        # 流式识别配置（超长文件避免整段波形 + mel 同时驻留内存）
+        self.streaming = streaming
+        self.stream_window = stream_window
+        self.stream_threshold = stream_threshold
+
         # 支持的文件格式
         self.audio_formats = {'.mp3', '.wav', '.m4a', '.flac', '.aac', '.ogg', '.wma', '.opus'}
         self.video_formats = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v'}
@@ -36,8 +162,8 @@ class LocalFileRecognizer:
         """加载Whisper模型"""
         if self.model is None:
             self._update_progress("正在加载模型...")
-            print(f"加载 Whisper {self.model_name} 模型...")
-            self.model = whisper.load_model(self.model_name)
+            print(f"加载 Whisper {self.model_name} 模型 (后端: {self.backend})...")
+            self.model = model_cache.get(self.model_name, self.backend)
             self._update_progress(f"模型 {self.model_name} 加载完成")
             print(f"模型 {self.model_name} 加载完成")
         return self.model
@@ -47,41 +173,28 @@ class LocalFileRecognizer:
         ext = Path(file_path).suffix.lower()
         return ext in self.supported_formats
 
-    def extract_audio_from_video(self, video_path):
-        """从视频文件提取音频"""
-        self._update_progress("正在从视频提取音频...")
-
-        # 创建临时音频文件
-        temp_audio = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        temp_audio_path = temp_audio.name
-        temp_audio.close()
-
-        try:
-            # 使用 ffmpeg 提取音频
-            cmd = [
-                'ffmpeg', '-i', video_path,
-                '-ar', '16000',  # 16kHz 采样率
-                '-ac', '1',      # 单声道
-                '-y',            # 覆盖输出文件
-                temp_audio_path
-            ]
-
-            result = subprocess.run(cmd, capture_output=True, text=True)
-
-            if result.returncode != 0:
-                raise Exception(f"音频提取失败: {result.stderr}")
-
-            self._update_progress("音频提取完成")
-            return temp_audio_path
+    def decode_audio(self, file_path):
+        """
+        解码音频/视频为 16kHz 单声道 float32 数组（见 load_audio）
+        :param file_path: 文件路径
+        :return: numpy float32 数组
+        """
+        is_video = Path(file_path).suffix.lower() in self.video_formats
+        self._update_progress("正在从视频提取音频..." if is_video else "正在解码音频...")
+        audio = load_audio(file_path)
+        self._update_progress("音频提取完成" if is_video else "音频解码完成")
+        return audio
 
-        except FileNotFoundError:
-            raise Exception("未找到 ffmpeg，请先安装: brew install ffmpeg")
+    def iter_audio_blocks(self, file_path, block_seconds=30):
+        """流式解码（见模块函数 iter_audio_blocks）"""
+        return iter_audio_blocks(file_path, block_seconds)
 
-    def process_file(self, file_path, save_to_file=True):
+    def process_file(self, file_path, save_to_file=True, streaming=None):
         """
         处理文件并转写
         :param file_path: 文件路径
         :param save_to_file: 是否保存到文件
+        :param streaming: 是否流式识别，None 时沿用构造参数
         :return: 识别的文本
         """
         if not os.path.exists(file_path):
@@ -91,7 +204,6 @@ class LocalFileRecognizer:
             raise ValueError(f"不支持的文件格式: {Path(file_path).suffix}")
 
         self.is_processing = True
-        temp_audio_path = None
 
         try:
             # 加载模型
@@ -99,28 +211,54 @@ class LocalFileRecognizer:
 
             # 获取文件信息
             file_name = Path(file_path).stem
-            file_ext = Path(file_path).suffix.lower()
 
-            # 如果是视频文件，先提取音频
-            if file_ext in self.video_formats:
-                temp_audio_path = self.extract_audio_from_video(file_path)
-                audio_path = temp_audio_path
+            # 判断是否需要流式识别
+            if streaming is None:
+                streaming = self.streaming
+            duration = None
+            if streaming is None:
+                duration = probe_duration(file_path)
+                streaming = duration is not None and duration > self.stream_threshold
+
+            if streaming:
+                # 超长文件：分窗口解码 + 识别，内存占用与文件时长无关
+                self._update_progress("正在流式识别音频内容...")
+                print(f"开始流式识别: {file_path}")
+                with metrics.span("transcribe", file=file_name, model=self.model_name,
+                                  backend=self.backend, streaming=True) as s, \
+                        progress.report_progress(self.audio_progress_callback, total_seconds=duration):
+                    result = self._transcribe_streaming(file_path, duration)
+                    s.set("audio_seconds", result["duration"])
             else:
-                audio_path = file_path
-
-            # 开始识别
-            self._update_progress("正在识别音频内容...")
-            print(f"开始识别: {file_path}")
-
-            # 使用 Whisper 识别
-            result = self.model.transcribe(
-                audio_path,
-                language="zh",
-                initial_prompt=self.initial_prompt,
-                temperature=0.0,  # 降低随机性
-                fp16=False,  # 兼容性更好
-                verbose=False  # 使用 tqdm 进度条
-            )
+                # 预计算的 mel 特征（重复识别同一文件时直接读缓存），否则解码为内存数组（ffmpeg 只跑一次）
+                features = self._load_features(file_path)
+                if features is not None:
+                    audio, mel = None, features.window()
+                    audio_seconds = features.duration
+                else:
+                    audio, mel = self.decode_audio(file_path), None
+                    audio_seconds = len(audio) / SAMPLE_RATE
+
+                # 开始识别
+                self._update_progress("正在识别音频内容...")
+                print(f"开始识别: {file_path}")
+
+                # 使用 Whisper 识别
+                with metrics.span("transcribe", file=file_name, model=self.model_name,
+                                  backend=self.backend, audio_seconds=audio_seconds), \
+                        progress.report_progress(self.audio_progress_callback, total_seconds=audio_seconds):
+                    result = self.model.transcribe(
+                        audio,
+                        mel=mel,
+                        language="zh",
+                        initial_prompt=self.initial_prompt,
+                        temperature=0.0,  # 降低随机性
+                        fp16=False,  # 兼容性更好
+                        verbose=False  # 使用 tqdm 进度条
+                    )
+                if self.segment_callback:
+                    for seg in result.get("segments", []):
+                        self.segment_callback(seg)
 
             # 提取文本
             text = result["text"].strip()
@@ -138,7 +276,7 @@ class LocalFileRecognizer:
 
                 with open(output_file, 'w', encoding='utf-8') as f:
                     f.write(f"文件: {file_path}\n")
-                    f.write(f"模型: {self.model_name}\n")
+                    f.write(f"模型: {self._model_label()}\n")
                     f.write(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                     if self.initial_prompt and self.initial_prompt != "以下是普通话的句子。":
                         f.write(f"提示词: {self.initial_prompt}\n")
@@ -160,12 +298,141 @@ class LocalFileRecognizer:
         finally:
             self.is_processing = False
 
-            # 清理临时文件
-            if temp_audio_path and os.path.exists(temp_audio_path):
-                try:
-                    os.remove(temp_audio_path)
-                except:
-                    pass
+    def _transcribe_streaming(self, file_path, duration=None):
+        """
+        滚动窗口流式识别
+        每次只保留一个窗口的音频在内存中；窗口末尾可能被截断的片段丢弃，
+        下一个窗口从该片段起点重新开始，保证时间戳连续、不截断句子
+        :param file_path: 文件路径
+        :param duration: 文件时长（秒），用于进度条，None 时自动探测
+        :return: 与 model.transcribe 相同结构的结果字典
+        """
+        import tqdm
+
+        # 特征缓存在磁盘上时按窗口读取 mel，不再解码音频；只在内存中保留时整段特征过大，不使用
+        features = None
+        if mel_features.CACHE_DIR != "off":
+            features = self._load_features(file_path)
+        if features is not None:
+            duration = features.duration
+        elif duration is None:
+            duration = probe_duration(file_path)
+
+        window_samples = int(self.stream_window * SAMPLE_RATE)
+        tail_margin = 2.0  # 距窗口末尾不足该秒数的片段视为可能被截断
+
+        blocks = self.iter_audio_blocks(file_path) if features is None else None
+        buffer = np.zeros(0, dtype=np.float32)
+        offset = 0.0  # buffer[0] 在整段音频中的时间（秒）
+        eof = False
+        segments = []
+        texts = []
+        previous_text = ""
+
+        total_frames = int(duration * FRAMES_PER_SECOND) if duration else None
+        # 控制台进度条以整段文件为单位，窗口内的 transcribe 关闭自身进度条
+        with tqdm.tqdm(total=total_frames, unit="frames") as pbar:
+            while True:
+                if features is not None:
+                    # 直接取窗口对应的预计算 mel
+                    window_len = min(self.stream_window, features.duration - offset)
+                    if window_len <= 0:
+                        break
+                    is_last = offset + window_len >= features.duration
+                    window, mel = None, features.window(offset, offset + window_len)
+                else:
+                    # 补齐一个窗口的音频
+                    if not eof and len(buffer) < window_samples:
+                        pending = [buffer]
+                        filled = len(buffer)
+                        while filled < window_samples:
+                            block = next(blocks, None)
+                            if block is None:
+                                eof = True
+                                break
+                            pending.append(block)
+                            filled += len(block)
+                        buffer = np.concatenate(pending)
+
+                    if len(buffer) == 0:
+                        break
+
+                    window, mel = buffer[:window_samples], None
+                    window_len = len(window) / SAMPLE_RATE
+                    is_last = eof and len(buffer) <= window_samples
+
+                # 使用前一窗口末尾作为提示，保持上下文连贯
+                if previous_text:
+                    prompt = f"{self.initial_prompt} {previous_text[-100:].strip()}"
+                else:
+                    prompt = self.initial_prompt
+
+                result = self.model.transcribe(
+                    window,
+                    mel=mel,
+                    language="zh",
+                    initial_prompt=prompt,
+                    temperature=0.0,
+                    fp16=False,
+                    verbose=None  # 关闭窗口内进度条和逐句输出
+                )
+                window_segments = result.get("segments", [])
+
+                # 计算本窗口实际消费的时长
+                cut = window_len
+                if not is_last and window_segments:
+                    last = window_segments[-1]
+                    if last['end'] > window_len - tail_margin and last['start'] > window_len / 2:
+                        cut = last['start']
+                        window_segments = window_segments[:-1]
+
+                for seg in window_segments:
+                    seg = dict(seg)
+                    seg['id'] = len(segments)
+                    seg['start'] = seg['start'] + offset
+                    seg['end'] = min(seg['end'], cut) + offset
+                    segments.append(seg)
+                    if self.segment_callback:
+                        self.segment_callback(seg)
+                    seg_text = seg.get('text', '').strip()
+                    if seg_text:
+                        texts.append(seg_text)
+                        previous_text = seg_text
+
+                pbar.update(int(cut * FRAMES_PER_SECOND))
+                # 窗口内的进度由识别后端相对窗口起点上报，窗口结束后起点后移
+                reporter = progress.current()
+                if reporter is not None:
+                    reporter.advance(cut)
+                buffer = buffer[int(cut * SAMPLE_RATE):]
+                offset += cut
+
+                if is_last:
+                    break
+
+        if blocks is not None:
+            blocks.close()
+        return {"text": "".join(texts), "segments": segments, "language": "zh", "duration": offset}
+
+    def _load_features(self, file_path):
+        """
+        整段文件的预计算 mel 特征（见 mel_features）
+        :return: MelFeatures，未开启、后端不支持或计算失败时返回 None
+        """
+        if not mel_features.enabled() or not hasattr(self.model, "mel_filters"):
+            return None
+        try:
+            self._update_progress("正在计算 mel 特征...")
+            return mel_features.load_features(file_path, self.model)
+        except Exception as e:
+            print(f"mel 特征计算失败，改为直接识别音频: {e}")
+            return None
+
+    def _model_label(self):
+        """输出文件中记录的模型名（非默认后端时附带后端名）"""
+        if self.backend == BACKEND_FASTER:
+            return f"{self.model_name} (faster-whisper)"
+        return self.model_name
 
     def _format_result(self, text, segments):
         """格式化识别结果"""
@@ -213,6 +480,7 @@ class LocalFileRecognizer:
 
 def main():
     """测试函数"""
+    profiling.start_from_env("local_file_recognition")
     print("本地文件识别测试")
     print("=" * 50)
 
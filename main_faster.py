@@ -4,39 +4,58 @@ Bili2text 主程序 - 使用 faster-whisper + large-v3
 高准确度版本，专门针对财经等专业内容优化
 """
 
-from utils import download_bilibili
 from exAudio import *
 import shutil
 from realtime_recognition_faster import FasterRealtimeRecognizer
+from job_queue import JobQueue, JobWorker, KIND_BV, STATUS_DONE
+from whisper_backend import BACKEND_FASTER
+from two_pass import TwoPassPolicy
 import time
+import profiling
+
+# faster-whisper large-v3 识别参数（高准确度）
+MODEL_NAME = "large-v3"
+TRANSCRIBE_OPTIONS = dict(
+    language="zh",
+    beam_size=5,
+    best_of=5,
+    temperature=0.0,
+    vad_filter=True,
+    vad_parameters=dict(
+        threshold=0.5,
+        min_silence_duration_ms=500,
+        speech_pad_ms=400
+    )
+)
+
+
+def _job_worker(queue):
+    # 默认两遍识别：先贪心解码，只对低置信度分段使用束搜索（B2T_TWO_PASS=off 关闭）
+    return JobWorker(queue, transcribe_options=TRANSCRIBE_OPTIONS,
+                     two_pass_policy=TwoPassPolicy.from_env(default=TwoPassPolicy()))
+
+
+def resume_unfinished_jobs():
+    """继续上次中断（崩溃、被杀）的任务，已完成的分片不会重新识别"""
+    queue = JobQueue()
+    unfinished = queue.list(include_finished=False)
+    if not unfinished:
+        return
+    print(f"\n发现 {len(unfinished)} 个未完成的任务，继续处理...")
+    _job_worker(queue).run()
+    waiting = queue.list(include_finished=False)
+    if waiting:
+        print(f"仍有 {len(waiting)} 个任务等待重试，可稍后运行: python3 job_queue.py worker")
+
 
 def bilibili_mode():
     """B站视频识别模式（使用faster-whisper）"""
     print("\n注意：本版本使用 faster-whisper，首次运行需要下载模型")
 
     av = input("请输入BV号：")
-    folder = download_bilibili(av)
-
     bv = av if av.startswith('BV') else f"BV{av}"
     bv = bv.split('/')[-1]
 
-    foldername = process_audio_split(bv)
-
-    # 使用 faster-whisper
-    from faster_whisper import WhisperModel
-    print("\n加载 faster-whisper large-v3 模型...")
-
-    # 检测设备
-    import torch
-    if torch.cuda.is_available():
-        device = "cuda"
-        compute_type = "float16"
-    else:
-        device = "cpu"
-        compute_type = "int8"
-
-    model = WhisperModel("large-v3", device=device, compute_type=compute_type)
-
     # 询问是否需要自定义 prompt
     custom_prompt = input("需要添加关键词提示吗？(直接回车跳过): ").strip()
 
@@ -45,45 +64,18 @@ def bilibili_mode():
     else:
         initial_prompt = "以下是普通话的句子。"
 
-    # 开始识别
-    print("正在识别音频...")
-    audio_list = os.listdir(f"audio/slice/{foldername}")
-    audio_files = sorted(audio_list, key=lambda x: int(os.path.splitext(x)[0]))
-
-    os.makedirs("outputs", exist_ok=True)
-
-    i = 1
-    for fn in audio_files:
-        print(f"正在转换第{i}/{len(audio_files)}个音频... {fn}")
-
-        # 使用 faster-whisper 识别
-        segments, info = model.transcribe(
-            f"audio/slice/{foldername}/{fn}",
-            language="zh",
-            initial_prompt=initial_prompt,
-            beam_size=5,
-            best_of=5,
-            temperature=0.0,
-            vad_filter=True,
-            vad_parameters=dict(
-                threshold=0.5,
-                min_silence_duration_ms=500,
-                speech_pad_ms=400
-            )
-        )
-
-        # 提取文本
-        text = ""
-        for segment in segments:
-            text += segment.text
+    # 任务登记在持久化队列中：进程中断后再次启动会从已完成的分片处继续
+    queue = JobQueue()
+    job_id = queue.submit(KIND_BV, av, MODEL_NAME, BACKEND_FASTER, initial_prompt)
+    print(f"\n任务 {job_id} 已加入队列，加载 faster-whisper {MODEL_NAME} 模型并开始识别...")
+    job = _job_worker(queue).run_one(job_id)
 
-        print(text)
-
-        with open(f"outputs/{foldername}.txt", "a", encoding="utf-8") as f:
-            f.write(text)
-            f.write("\n")
-        i += 1
+    if job["status"] != STATUS_DONE:
+        print(f"\n任务未完成（{job['status']}）: {job['error'] or ''}")
+        print("稍后会自动重试，也可运行: python3 job_queue.py worker")
+        return
 
+    foldername = job["folder"]
     output_path = f"outputs/{foldername}.txt"
     print(f"\n转换完成！文件保存在: {output_path}")
 
@@ -203,6 +195,8 @@ def main():
     print("    Powered by faster-whisper + large-v3")
     print("="*60)
 
+    resume_unfinished_jobs()
+
     while True:
         print("\n请选择模式:")
         print("1. B站视频识别")
@@ -238,4 +232,5 @@ def main():
 
 
 if __name__ == "__main__":
+    profiling.start_from_env("main_faster")
     main()
\ No newline at end of file
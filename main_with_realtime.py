@@ -9,28 +9,37 @@ from speech2text import *
 import shutil
 from realtime_recognition import RealtimeRecognizer
 import time
+import metrics
 
 def bilibili_mode():
     """B站视频识别模式"""
     av = input("请输入BV号：")
-    folder = download_bilibili(av)
+    metrics.start_job(f"bv_{av.strip().split('/')[-1]}", source=av, model="medium")
 
-    bv = av if av.startswith('BV') else f"BV{av}"
-    bv = bv.split('/')[-1]
+    try:
+        folder = download_bilibili(av)
 
-    foldername = process_audio_split(bv)
+        bv = av if av.startswith('BV') else f"BV{av}"
+        bv = bv.split('/')[-1]
 
-    load_whisper("medium")
+        foldername = process_audio_split(bv)
 
-    # 询问是否需要自定义 prompt
-    custom_prompt = input("需要添加关键词提示吗？(直接回车跳过): ").strip()
+        load_whisper("medium")
 
-    if custom_prompt:
-        run_analysis(foldername, prompt=custom_prompt)
-        print(f"使用自定义提示: {custom_prompt}")
-    else:
-        run_analysis(foldername)
-        print("使用默认设置")
+        # 询问是否需要自定义 prompt
+        custom_prompt = input("需要添加关键词提示吗？(直接回车跳过): ").strip()
+
+        if custom_prompt:
+            run_analysis(foldername, prompt=custom_prompt)
+            print(f"使用自定义提示: {custom_prompt}")
+        else:
+            run_analysis(foldername)
+            print("使用默认设置")
+    except Exception:
+        metrics.finish_job(status="failed")
+        raise
+
+    metrics.finish_job()
 
     output_path = f"outputs/{foldername}.txt"
     print(f"\n转换完成！文件保存在: {output_path}")
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+log-mel 特征 - 整段录音只计算一次，之后各分片/窗口直接取预计算的 mel 交给模型
+- 流式计算：ffmpeg 分块解码，逐块做 STFT（分块边界处的帧只算一次，与整段计算结果一致）
+- 磁盘缓存：按 文件路径 + 大小 + 修改时间 + n_mels 缓存，换用其他大小的模型（n_mels 相同）时跳过特征提取
+- window(): 取某一时间段的 mel，按 Whisper 的方式归一化并在末尾补 30 秒静音帧
+
+缓存保存的是归一化之前的 log10 能量（按时间优先存储，便于追加写入），
+Whisper 的归一化（以本段最大值为基准截断到 8 以内）依赖所取的时间段，取窗口时再做
+
+环境变量：
+    B2T_MEL_FEATURES=off  关闭预计算，各分片照常由模型自行解码和计算特征
+    B2T_MEL_CACHE         缓存目录，默认 cache/mel；设为 off 时只在内存中保留
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import metrics
+
+SAMPLE_RATE = 16000
+N_FFT = 400
+HOP_LENGTH = 160
+FRAMES_PER_SECOND = SAMPLE_RATE // HOP_LENGTH
+# 模型每次处理 30 秒（3000 帧），transcribe 会在音频末尾补同样长度的静音
+N_FRAMES = 30 * FRAMES_PER_SECOND
+# log10(1e-10)：静音帧的 log 能量
+SILENCE = -10.0
+
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get("B2T_MEL_CACHE", os.path.join("cache", "mel"))
+
+
+def enabled():
+    """是否使用预计算的 mel 特征"""
+    return os.environ.get("B2T_MEL_FEATURES", "").strip().lower() != "off"
+
+
+class StreamingLogMel:
+    """逐块计算 log-mel（与 Whisper 相同：hann 窗、n_fft=400、hop=160、两端反射填充、丢弃最后一帧）"""
+
+    def __init__(self, filters):
+        """
+        :param filters: mel 滤波器组，形状 (n_mels, N_FFT // 2 + 1)
+        """
+        self.filters = np.asarray(filters, dtype=np.float32)
+        # torch.hann_window 默认为周期窗
+        self.window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+        self.samples = 0  # 已输入的采样数
+        self.frames = 0  # 已输出的帧数
+        self._buffer = np.zeros(0, dtype=np.float32)  # 填充后信号中尚未用完的部分
+        self._buffer_start = 0  # _buffer[0] 在填充后信号中的位置
+        self._head = []  # 开头不足以做反射填充时暂存的数据
+        self._started = False
+
+    def feed(self, samples):
+        """
+        输入一段采样
+        :return: 新得到的完整帧，形状 (帧数, n_mels)
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        self.samples += len(samples)
+        if not self._started:
+            self._head.append(samples)
+            head = np.concatenate(self._head)
+            if len(head) <= N_FFT // 2:
+                return self._empty()
+            # 开头反射填充 N_FFT // 2 个采样
+            self._head = []
+            self._started = True
+            samples = np.concatenate([head[1:N_FFT // 2 + 1][::-1], head])
+        self._buffer = np.concatenate([self._buffer, samples])
+        return self._emit(self._buffer_start + len(self._buffer))
+
+    def finish(self):
+        """
+        输入结束，末尾反射填充后输出剩余的帧
+        :return: 剩余帧，形状 (帧数, n_mels)
+        """
+        total = self.samples // HOP_LENGTH
+        if not self._started:
+            head = np.concatenate(self._head) if self._head else np.zeros(0, dtype=np.float32)
+            if len(head) == 0:
+                return self._empty()
+            # 极短音频无法反射填充，改用零填充
+            self._buffer = np.pad(head, N_FFT // 2)
+            self._buffer_start = 0
+            self._started = True
+        else:
+            tail = self._buffer[-(N_FFT // 2 + 1):-1][::-1]
+            self._buffer = np.concatenate([self._buffer, tail])
+        frames = self._emit(self._buffer_start + len(self._buffer), limit=total)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        return frames
+
+    def _emit(self, available, limit=None):
+        """计算所有数据已齐全的帧（available 为填充后信号中已有的采样数）"""
+        count = (available - N_FFT) // HOP_LENGTH + 1 - self.frames
+        if limit is not None:
+            count = min(count, limit - self.frames)
+        if count <= 0:
+            return self._empty()
+        offset = self.frames * HOP_LENGTH - self._buffer_start
+        strided = np.lib.stride_tricks.sliding_window_view(
+            self._buffer[offset:offset + (count - 1) * HOP_LENGTH + N_FFT], N_FFT)[::HOP_LENGTH]
+        power = np.abs(np.fft.rfft(strided * self.window, axis=1)) ** 2
+        log_mel = np.log10(np.maximum(power.astype(np.float32) @ self.filters.T, 1e-10))
+        self.frames += count
+        # 丢弃之后不再需要的采样
+        consumed = self.frames * HOP_LENGTH - self._buffer_start
+        self._buffer = self._buffer[consumed:]
+        self._buffer_start += consumed
+        return log_mel.astype(np.float32)
+
+    def _empty(self):
+        return np.zeros((0, len(self.filters)), dtype=np.float32)
+
+
+class MelFeatures:
+    """一段录音的 log-mel 特征（按时间优先，形状 (帧数, n_mels)，可以是磁盘上的 memmap）"""
+
+    def __init__(self, frames, source=None):
+        """
+        :param frames: 归一化之前的 log10 能量，形状 (帧数, n_mels)
+        :param source: 来源文件（用于日志）
+        """
+        self.frames = frames
+        self.source = source
+
+    @property
+    def n_mels(self):
+        return self.frames.shape[1]
+
+    @property
+    def duration(self):
+        """时长（秒）"""
+        return len(self.frames) / FRAMES_PER_SECOND
+
+    def window(self, start=0.0, end=None):
+        """
+        取 [start, end) 秒的 mel，与对这段音频单独调用 transcribe 时模型内部得到的特征一致
+        :return: float32 数组，形状 (n_mels, 帧数 + N_FRAMES)
+        """
+        first = int(round(start * FRAMES_PER_SECOND))
+        last = len(self.frames) if end is None else min(int(round(end * FRAMES_PER_SECOND)), len(self.frames))
+        mel = np.full((self.n_mels, max(last - first, 0) + N_FRAMES), SILENCE, dtype=np.float32)
+        mel[:, :max(last - first, 0)] = self.frames[first:last].T
+        mel = np.maximum(mel, mel.max() - 8.0)
+        return (mel + 4.0) / 4.0
+
+
+def compute(file_path, filters, block_seconds=30, on_frames=None):
+    """
+    流式计算整段录音的 log-mel
+    :param file_path: 音频/视频文件
+    :param filters: mel 滤波器组
+    :param on_frames: fn(frames)，每得到一批帧回调一次；None 时返回全部帧
+    :return: on_frames 为 None 时返回 (帧数, n_mels) 数组，否则返回总帧数
+    """
+    from local_file_recognition import iter_audio_blocks
+
+    mel = StreamingLogMel(filters)
+    chunks = []
+    emit = on_frames or chunks.append
+    for block in iter_audio_blocks(file_path, block_seconds):
+        frames = mel.feed(block)
+        if len(frames):
+            emit(frames)
+    frames = mel.finish()
+    if len(frames):
+        emit(frames)
+    if on_frames is not None:
+        return mel.frames
+    return np.concatenate(chunks) if chunks else mel._empty()
+
+
+def _check_frames(file_path, frames, tolerance=1.0):
+    """
+    核对解码得到的帧数与文件时长，解码失败或中途停止时不能把静音/截断的特征当作结果
+    :param tolerance: 允许的时长误差（秒），另外放宽时长的 1%（mp3 等格式的时长是估算值）
+    """
+    from local_file_recognition import probe_duration
+
+    seconds = frames / FRAMES_PER_SECOND
+    if frames == 0:
+        raise Exception(f"mel 特征计算失败，未解码出音频: {file_path}")
+    duration = probe_duration(file_path)
+    if duration is not None and abs(seconds - duration) > max(tolerance, duration * 0.01):
+        raise Exception(f"mel 特征计算失败，解码时长 {seconds:.1f} 秒与文件时长 {duration:.1f} 秒不符: {file_path}")
+
+
+def _cache_key(file_path, n_mels):
+    stat = os.stat(file_path)
+    raw = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{n_mels}|{CACHE_VERSION}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def load_features(file_path, model, cache_dir=None):
+    """
+    取整段录音的 mel 特征：命中磁盘缓存直接读取，否则流式计算（并写入缓存）
+    :param file_path: 音频/视频文件
+    :param model: 识别后端（提供 n_mels 和 mel_filters()）
+    :param cache_dir: 缓存目录，None 时取 B2T_MEL_CACHE；"off" 表示不使用磁盘缓存
+    :return: MelFeatures
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    n_mels = model.n_mels
+    name = os.path.basename(file_path)
+
+    if cache_dir == "off":
+        with metrics.span("mel_features", file=name, cached=False) as s:
+            frames = compute(file_path, model.mel_filters())
+            _check_frames(file_path, len(frames))
+            s.set("audio_seconds", len(frames) / FRAMES_PER_SECOND)
+        return MelFeatures(frames, file_path)
+
+    key = _cache_key(file_path, n_mels)
+    data_path = os.path.join(cache_dir, f"{key}.f32")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+
+    if os.path.exists(meta_path) and os.path.exists(data_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        with metrics.span("mel_features", file=name, cached=True):
+            frames = np.memmap(data_path, dtype=np.float32, mode="r", shape=(meta["frames"], n_mels))
+        print(f"使用缓存的 mel 特征: {name}（{meta['frames'] / FRAMES_PER_SECOND:.0f} 秒）")
+        return MelFeatures(frames, file_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{data_path}.tmp"
+    with metrics.span("mel_features", file=name, cached=False) as s:
+        try:
+            with open(tmp_path, "wb") as out:
+                total = compute(file_path, model.mel_filters(), on_frames=lambda frames: out.write(frames.tobytes()))
+            _check_frames(file_path, total)
+        except BaseException:
+            # 不完整的特征不能留下来被当作缓存
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, data_path)
+        s.set("audio_seconds", total / FRAMES_PER_SECOND)
+        s.set("bytes_out", metrics.file_size(data_path))
+    # 元数据最后写入，只有完整的特征文件才会被当作缓存命中
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.abspath(file_path), "n_mels": n_mels, "frames": total}, f)
+    print(f"mel 特征已缓存: {name}（{total / FRAMES_PER_SECOND:.0f} 秒）")
+    return MelFeatures(np.memmap(data_path, dtype=np.float32, mode="r", shape=(total, n_mels)), file_path)
+
+
+def recording_features(folder, model):
+    """
+    B 站任务分片对应的整段录音（audio/conv/{folder}.mp3）的 mel 特征
+    :param folder: 分片目录名
+    :param model: 识别后端
+    :return: MelFeatures，未开启、后端不支持或整段录音不存在时返回 None
+    """
+    path = f"audio/conv/{folder}.mp3"
+    if not enabled() or not hasattr(model, "mel_filters") or not os.path.exists(path):
+        return None
+    try:
+        return load_features(path, model)
+    except Exception as e:
+        print(f"mel 特征计算失败，各分片单独计算: {e}")
+        return None
+
+
+def slice_window(features, slice_path, slice_seconds=45.0):
+    """
+    分片 {序号}.mp3（exAudio.split_mp3 按固定时长切分，序号从 1 开始）对应的 mel
+    :return: mel 数组，features 为 None 时返回 None
+    """
+    if features is None:
+        return None
+    index = int(os.path.splitext(os.path.basename(slice_path))[0]) - 1
+    return features.window(index * slice_seconds, (index + 1) * slice_seconds)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+轻量级阶段计时与指标模块
+- span(): 记录一个处理阶段的耗时、输入/输出字节数、处理的音频秒数等
+- start_job() / finish_job(): 以"任务"为单位收集各阶段数据，结束时输出 JSON 报告到 outputs/reports/
+- 进程级累计指标可导出为 Prometheus 文本格式（文件或 HTTP 端点）
+
+环境变量：
+    B2T_METRICS_FILE  每个任务结束时把 Prometheus 文本写入该文件（node_exporter textfile 方式）
+    B2T_METRICS_PORT  在该端口启动 HTTP 端点，GET /metrics 返回 Prometheus 文本
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = os.path.join("outputs", "reports")
+
+# span 可累加的数值字段
+COUNTER_FIELDS = ("bytes_in", "bytes_out", "audio_seconds")
+
+_lock = threading.Lock()
+_local = threading.local()
+_exporter_started = False
+
+# 进程级累计：stage -> {"count", "seconds", "bytes_in", "bytes_out", "audio_seconds"}
+_stage_totals = {}
+_job_counts = {}
+
+# span 开始/结束监听器 fn(event, span)，event 为 "start" / "end"（供 profiling 打阶段标记）
+_listeners = []
+
+
+class Span:
+    """一个处理阶段的记录"""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set(self, key, value):
+        """设置属性（如 model、file）"""
+        self.attrs[key] = value
+
+    def add(self, key, amount):
+        """累加数值属性（如 bytes_out、audio_seconds）"""
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def to_dict(self, job_start=None):
+        data = {
+            "name": self.name,
+            "start": round(self.start - job_start, 3) if job_start else self.start,
+            "duration": round(self.duration, 3) if self.duration is not None else None,
+        }
+        data.update(self.attrs)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class Job:
+    """一次完整任务（例如一个 BV 号的下载 + 识别）"""
+
+    def __init__(self, name, meta):
+        self.name = name
+        self.meta = dict(meta)
+        self.start = time.time()
+        self.spans = []
+        self.report_file = None
+
+    def totals(self):
+        """按阶段汇总耗时和计数"""
+        totals = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] = round(entry["seconds"] + (s.duration or 0), 3)
+            for key in COUNTER_FIELDS:
+                if key in s.attrs:
+                    entry[key] = entry.get(key, 0) + s.attrs[key]
+        return totals
+
+
+def current_job():
+    """当前线程正在进行的任务（没有则返回 None）"""
+    return getattr(_local, "job", None)
+
+
+@contextmanager
+def bind_job(job):
+    """
+    在其他线程中把 span 记录到指定任务（任务是线程局部的，新建的工作线程默认没有任务）
+    用法：
+        job = metrics.current_job()
+        def worker():
+            with metrics.bind_job(job):
+                ...
+    """
+    previous = current_job()
+    _local.job = job
+    try:
+        yield job
+    finally:
+        _local.job = previous
+
+
+def start_job(name, **meta):
+    """
+    开始一个任务，之后本线程内的 span 都会记录到该任务
+    :param name: 任务名（用于报告文件名）
+    :param meta: 附加信息（BV号、模型等）
+    :return: Job 对象
+    """
+    _maybe_start_exporter()
+    job = Job(name, meta)
+    _local.job = job
+    return job
+
+
+def finish_job(job=None, status="done"):
+    """
+    结束任务并写出 JSON 报告
+    :param job: 任务对象，None 时取当前线程的任务
+    :param status: 任务状态 (done / failed)
+    :return: 报告文件路径
+    """
+    job = job or current_job()
+    if job is None:
+        return None
+    if current_job() is job:
+        _local.job = None
+
+    finished = time.time()
+    totals = job.totals()
+    audio_seconds = sum(t.get("audio_seconds", 0) for name, t in totals.items() if name == "transcribe")
+
+    report = {
+        "job": job.name,
+        "status": status,
+        "started": datetime.fromtimestamp(job.start).isoformat(timespec='seconds'),
+        "finished": datetime.fromtimestamp(finished).isoformat(timespec='seconds'),
+        "duration": round(finished - job.start, 3),
+        "meta": job.meta,
+        "stages": totals,
+        "spans": [s.to_dict(job.start) for s in job.spans],
+    }
+    if audio_seconds:
+        transcribe_seconds = totals["transcribe"]["seconds"]
+        report["audio_seconds"] = round(audio_seconds, 3)
+        report["rtf"] = round(transcribe_seconds / audio_seconds, 4)
+        if "retranscribe" in totals:
+            # 两遍识别：需要第二遍（大模型/束搜索）的音频比例
+            report["retranscribe_fraction"] = round(
+                totals["retranscribe"].get("audio_seconds", 0) / audio_seconds, 4)
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    timestamp = datetime.fromtimestamp(job.start).strftime('%Y%m%d_%H%M%S')
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in job.name)
+    report_file = os.path.join(REPORT_DIR, f"{safe_name}_{timestamp}.json")
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    job.report_file = report_file
+
+    with _lock:
+        _job_counts[status] = _job_counts.get(status, 0) + 1
+
+    prom_file = os.environ.get("B2T_METRICS_FILE")
+    if prom_file:
+        write_prometheus(prom_file)
+
+    print(f"[metrics] 任务报告: {report_file}")
+    return report_file
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    记录一个处理阶段
+    用法：
+        with metrics.span("split", bytes_in=size) as s:
+            ...
+            s.add("bytes_out", n)
+    """
+    s = Span(name, attrs)
+    _notify("start", s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        s.duration = time.time() - s.start
+        _record(s)
+        _notify("end", s)
+
+
+def add_listener(fn):
+    """注册 span 监听器 fn(event, span)"""
+    _listeners.append(fn)
+
+
+def remove_listener(fn):
+    """移除 span 监听器"""
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def _notify(event, s):
+    """通知监听器；监听器出错不影响业务流程"""
+    for fn in list(_listeners):
+        try:
+            fn(event, s)
+        except Exception as e:
+            print(f"[metrics] 监听器出错: {e}")
+
+
+def _record(s):
+    """把结束的 span 计入当前任务和进程级累计"""
+    job = current_job()
+    if job is not None:
+        job.spans.append(s)
+
+    with _lock:
+        entry = _stage_totals.setdefault(s.name, {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += s.duration
+        for key in COUNTER_FIELDS:
+            value = s.attrs.get(key)
+            if isinstance(value, (int, float)):
+                entry[key] = entry.get(key, 0) + value
+
+
+def file_size(path):
+    """文件或目录的总字节数（不存在返回 0）"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def prometheus_text():
+    """进程级累计指标的 Prometheus 文本格式"""
+    with _lock:
+        stages = {k: dict(v) for k, v in _stage_totals.items()}
+        jobs = dict(_job_counts)
+
+    lines = [
+        "# HELP b2t_stage_seconds_total Total time spent in each pipeline stage.",
+        "# TYPE b2t_stage_seconds_total counter",
+    ]
+    for stage, entry in sorted(stages.items()):
+        lines.append(f'b2t_stage_seconds_total{{stage="{stage}"}} {entry["seconds"]:.6f}')
+
+    lines += [
+        "# HELP b2t_stage_runs_total Number of times each pipeline stage ran.",
+        "# TYPE b2t_stage_runs_total counter",
+    ]
+    for stage, entry in sorted(stages.items()):
+        lines.append(f'b2t_stage_runs_total{{stage="{stage}"}} {entry["count"]}')
+
+    for key, help_text in (("bytes_in", "Bytes read by each stage."),
+                           ("bytes_out", "Bytes written by each stage."),
+                           ("audio_seconds", "Seconds of audio processed by each stage.")):
+        metric = f"b2t_stage_{key}_total"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for stage, entry in sorted(stages.items()):
+            if key in entry:
+                lines.append(f'{metric}{{stage="{stage}"}} {entry[key]}')
+
+    lines += [
+        "# HELP b2t_jobs_total Finished jobs by status.",
+        "# TYPE b2t_jobs_total counter",
+    ]
+    for status, count in sorted(jobs.items()):
+        lines.append(f'b2t_jobs_total{{status="{status}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """原子写入 Prometheus 文本文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def start_http_exporter(port, host="0.0.0.0"):
+    """在后台线程启动 /metrics HTTP 端点"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"[metrics] Prometheus 端点: http://{host}:{port}/metrics")
+    return server
+
+
+def _maybe_start_exporter():
+    """按环境变量按需启动一次 HTTP 端点"""
+    global _exporter_started
+    port = os.environ.get("B2T_METRICS_PORT")
+    with _lock:
+        if _exporter_started or not port:
+            return
+        _exporter_started = True
+    try:
+        start_http_exporter(int(port))
+    except Exception as e:
+        print(f"[metrics] 启动 Prometheus 端点失败: {e}")
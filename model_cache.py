@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+模型缓存 - 按 (模型名, 后端) 缓存已加载的识别后端，进程内各功能共享
+- get(): 取模型；已缓存直接返回，其他线程正在加载同一模型时等待其完成，不重复加载
+- prewarm(): 在后台线程预加载（GUI 选择模型后调用），加载过程不阻塞界面
+- pin() / unpin() / pinned(): 一个任务需要同时使用两个模型（两遍识别、双模型实时识别）时在任务期间固定，
+  固定的模型不会被换出，可以暂时超出 MAX_MODELS；全部解除后缓存回到 MAX_MODELS 以内
+"""
+
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import metrics
+from whisper_backend import BACKEND_OPENAI, backend_from_label, load_backend
+
+# 同时常驻内存的模型数（large 模型约 3GB，默认只保留最近使用的一个）
+MAX_MODELS = 1
+
+_lock = threading.Lock()
+_load_lock = threading.Lock()  # 串行加载，避免同时加载多个大模型
+_models = OrderedDict()  # (模型名, 后端) -> 后端对象
+_loading = {}  # (模型名, 后端) -> threading.Event
+_wanted = None  # 最近一次预热请求的 key，过期的预热直接跳过
+_pins = Counter()  # (模型名, 后端) -> 固定次数
+
+
+def _key(model_name, backend):
+    return model_name, backend_from_label(backend)
+
+
+def _evict(limit):
+    """释放最久未用的未固定模型，直到缓存中不超过 limit 个（调用方持有 _lock）"""
+    while len(_models) > limit:
+        victim = next((key for key in _models if key not in _pins), None)
+        if victim is None:
+            return
+        del _models[victim]
+
+
+def pin(model_name, backend=BACKEND_OPENAI):
+    """
+    固定模型：在对应的 unpin() 之前不会被换出缓存（可以在加载之前固定）；可重复固定，需成对解除
+    """
+    with _lock:
+        _pins[_key(model_name, backend)] += 1
+
+
+def unpin(model_name, backend=BACKEND_OPENAI):
+    """解除一次固定；超出 MAX_MODELS 的部分立即释放"""
+    key = _key(model_name, backend)
+    with _lock:
+        _pins[key] -= 1
+        if _pins[key] <= 0:
+            del _pins[key]
+        _evict(MAX_MODELS)
+
+
+@contextmanager
+def pinned(*model_names, backend=BACKEND_OPENAI):
+    """在 with 块内固定多个模型（同一后端）"""
+    for name in model_names:
+        pin(name, backend)
+    try:
+        yield
+    finally:
+        for name in model_names:
+            unpin(name, backend)
+
+
+def is_loaded(model_name, backend=BACKEND_OPENAI):
+    """模型是否已在缓存中"""
+    with _lock:
+        return _key(model_name, backend) in _models
+
+
+def get(model_name, backend=BACKEND_OPENAI, _only_if_wanted=False):
+    """
+    获取已加载的识别后端，未缓存时在当前线程加载
+    :param model_name: 模型名称
+    :param backend: 后端标识 (openai / faster) 或 GUI 显示名
+    :return: 后端对象（见 whisper_backend.load_backend）
+    """
+    key = _key(model_name, backend)
+    while True:
+        with _lock:
+            if key in _models:
+                _models.move_to_end(key)
+                return _models[key]
+            event = _loading.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                _loading[key] = event
+
+        if not owner:
+            # 其他线程正在加载同一模型；若其失败，下一轮由本线程重新加载
+            event.wait()
+            continue
+
+        try:
+            with _load_lock:
+                if _only_if_wanted and _wanted != key:
+                    return None
+                with _lock:
+                    # 先释放最久未用的模型，避免新旧模型同时占用内存（固定的模型除外）
+                    _evict(MAX_MODELS - 1)
+                with metrics.span("model_load", model=model_name, backend=key[1]):
+                    model = load_backend(model_name, backend=key[1])
+            with _lock:
+                _models[key] = model
+            return model
+        finally:
+            with _lock:
+                _loading.pop(key, None)
+            event.set()
+
+
+def prewarm(model_name, backend=BACKEND_OPENAI, callback=None):
+    """
+    在后台线程预加载模型；连续多次调用时只加载最后请求的模型
+    :param model_name: 模型名称
+    :param backend: 后端标识或 GUI 显示名
+    :param callback: 完成回调 fn(model_name, backend, error)，在后台线程中调用；
+                     被更新的请求取代时不回调
+    """
+    global _wanted
+    key = _key(model_name, backend)
+    with _lock:
+        _wanted = key
+
+    def worker():
+        try:
+            model = get(model_name, key[1], _only_if_wanted=True)
+        except Exception as e:
+            print(f"预加载模型 {model_name} 失败: {e}")
+            if callback:
+                callback(model_name, key[1], e)
+            return
+        if model is not None and callback:
+            callback(model_name, key[1], None)
+
+    threading.Thread(target=worker, name=f"prewarm-{model_name}", daemon=True).start()
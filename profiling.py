@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+性能剖析工具 - 给任意入口加上 cProfile / 采样调用栈 / tracemalloc / torch profiler
+结果写入每次运行独立的目录（默认 outputs/profiles/<入口>_<时间>/），
+metrics.span 的阶段边界会作为标记写入 markers.jsonl，并出现在采样调用栈的最外层
+
+用法一（命令行包装任意脚本）：
+    python profiling.py --mode cprofile,stack main.py
+    python profiling.py --mode tracemalloc local_file_recognition.py
+
+用法二（环境变量，各入口启动时自动开启）：
+    B2T_PROFILE=cprofile,stack python window_realtime.py
+    B2T_PROFILE_DIR=/tmp/prof B2T_PROFILE=torch python main_faster.py
+    （B2T_PROFILE_TORCH_CALLS 设置 torch 模式剖析的识别次数，默认 3）
+
+模式说明：
+    cprofile     确定性函数级剖析（主线程 + 之后启动的线程）-> cprofile.prof / cprofile.txt
+    stack        定时采样所有线程调用栈 -> stacks.folded（flamegraph.pl / speedscope 可直接打开）
+    tracemalloc  内存分配 Top N，并在每个阶段结束时记录当前/峰值内存 -> tracemalloc.txt
+    torch        在 transcribe 阶段内开启 torch.profiler -> torch_transcribe_N.json (chrome trace)
+"""
+
+import argparse
+import atexit
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+MODES = ("cprofile", "stack", "tracemalloc", "torch")
+DEFAULT_DIR = os.path.join("outputs", "profiles")
+
+
+class ProfileSession:
+    """一次剖析会话：按模式启动各剖析器，结束时把结果写入会话目录"""
+
+    def __init__(self, modes, name="run", output_dir=None, sample_interval=0.005, torch_calls=3):
+        """
+        :param modes: 模式列表（见 MODES）
+        :param name: 会话名（入口名），用于目录命名
+        :param output_dir: 结果根目录
+        :param sample_interval: stack 模式的采样间隔（秒）
+        :param torch_calls: torch 模式最多剖析的 transcribe 次数
+        """
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise ValueError(f"未知的剖析模式: {', '.join(sorted(unknown))}")
+
+        self.modes = list(modes)
+        self.name = name
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.run_dir = os.path.join(output_dir or DEFAULT_DIR, f"{name}_{timestamp}")
+        self.sample_interval = sample_interval
+        self.torch_calls = torch_calls
+
+        self._t0 = None
+        self._stopped = False
+        self._markers = []
+        self._active_stages = {}  # 线程 id -> 当前阶段名栈
+        self._lock = threading.Lock()
+
+        # cprofile
+        self._profilers = []
+        # stack
+        self._sampler = None
+        self._sampling = False
+        self._stack_counts = {}
+        # torch
+        self._torch_prof = None
+        self._torch_owner = None
+        self._torch_done = 0
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        self._t0 = time.perf_counter()
+        metrics.add_listener(self._on_span)
+
+        if "tracemalloc" in self.modes:
+            import tracemalloc
+            tracemalloc.start(10)
+
+        if "stack" in self.modes:
+            self._sampling = True
+            self._sampler = threading.Thread(target=self._sample_loop, name="b2t-profiler", daemon=True)
+            self._sampler.start()
+
+        if "cprofile" in self.modes:
+            import cProfile
+            main_prof = cProfile.Profile()
+            self._profilers.append(main_prof)
+            main_prof.enable()
+            # 之后启动的线程（GUI/识别线程）各自挂一个 profiler
+            threading.setprofile(self._thread_profile_bootstrap)
+
+        print(f"[profiling] 已开启 {','.join(self.modes)}，结果目录: {self.run_dir}")
+        return self
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        metrics.remove_listener(self._on_span)
+
+        if "cprofile" in self.modes:
+            self._dump_cprofile()
+        if "stack" in self.modes:
+            self._sampling = False
+            self._sampler.join(timeout=1)
+            self._dump_stacks()
+        if "tracemalloc" in self.modes:
+            self._dump_tracemalloc()
+        if self._torch_prof is not None:
+            self._stop_torch()
+
+        with open(os.path.join(self.run_dir, "markers.jsonl"), 'w', encoding='utf-8') as f:
+            for marker in self._markers:
+                f.write(json.dumps(marker, ensure_ascii=False) + "\n")
+
+        print(f"[profiling] 剖析结果已保存到: {self.run_dir}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    # ---- 阶段标记 ----
+
+    def _on_span(self, event, span):
+        tid = threading.get_ident()
+        marker = {
+            "t": round(time.perf_counter() - self._t0, 6),
+            "event": event,
+            "stage": span.name,
+            "thread": threading.current_thread().name,
+        }
+
+        with self._lock:
+            stages = self._active_stages.setdefault(tid, [])
+            if event == "start":
+                stages.append(span.name)
+            elif stages:
+                stages.pop()
+
+        if event == "end":
+            marker["duration"] = round(span.duration, 6)
+            if "tracemalloc" in self.modes:
+                import tracemalloc
+                current, peak = tracemalloc.get_traced_memory()
+                marker["mem_current_mb"] = round(current / 1024 / 1024, 2)
+                marker["mem_peak_mb"] = round(peak / 1024 / 1024, 2)
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+
+        self._markers.append(marker)
+
+        if "torch" in self.modes and span.name == "transcribe":
+            if event == "start":
+                self._start_torch(tid)
+            elif self._torch_owner == tid:
+                self._stop_torch()
+
+    # ---- cprofile ----
+
+    def _thread_profile_bootstrap(self, frame, event, arg):
+        """新线程的第一次 profile 回调：为该线程创建并启用独立的 cProfile"""
+        import cProfile
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+ 的 cProfile 基于 sys.monitoring，同一时间只能有一个 profiler
+            threading.setprofile(None)
+            sys.setprofile(None)
+            print("[profiling] 当前 Python 不支持多线程 cProfile，仅剖析主线程（可改用 stack 模式）")
+            return
+        with self._lock:
+            self._profilers.append(prof)
+
+    def _dump_cprofile(self):
+        import pstats
+        import io
+
+        threading.setprofile(None)
+        stats = None
+        for prof in self._profilers:
+            prof.disable()
+            if stats is None:
+                stats = pstats.Stats(prof)
+            else:
+                stats.add(prof)
+
+        stats.dump_stats(os.path.join(self.run_dir, "cprofile.prof"))
+        buf = io.StringIO()
+        stats.stream = buf
+        stats.sort_stats("cumulative").print_stats(60)
+        with open(os.path.join(self.run_dir, "cprofile.txt"), 'w', encoding='utf-8') as f:
+            f.write(buf.getvalue())
+
+    # ---- stack 采样 ----
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while self._sampling:
+            frames = sys._current_frames()
+            with self._lock:
+                stages = {tid: list(s) for tid, s in self._active_stages.items()}
+            for tid, frame in frames.items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                # 阶段标记放在最外层，火焰图中按阶段分组
+                prefix = [f"[stage:{name}]" for name in stages.get(tid, [])]
+                key = ";".join(prefix + stack)
+                self._stack_counts[key] = self._stack_counts.get(key, 0) + 1
+            time.sleep(self.sample_interval)
+
+    def _dump_stacks(self):
+        with open(os.path.join(self.run_dir, "stacks.folded"), 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self._stack_counts.items(), key=lambda x: -x[1]):
+                f.write(f"{stack} {count}\n")
+
+    # ---- tracemalloc ----
+
+    def _dump_tracemalloc(self, limit=30):
+        import tracemalloc
+
+        snapshot = tracemalloc.take_snapshot()
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with open(os.path.join(self.run_dir, "tracemalloc.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"当前: {current / 1024 / 1024:.2f} MB  峰值（最后一个阶段以来）: {peak / 1024 / 1024:.2f} MB\n\n")
+            f.write(f"Top {limit} 分配位置（按行）:\n")
+            for stat in snapshot.statistics('lineno')[:limit]:
+                f.write(f"{stat}\n")
+            f.write(f"\nTop 10 分配调用栈:\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+    # ---- torch profiler ----
+
+    def _start_torch(self, tid):
+        # torch.profiler 是进程级的，同一时间只剖析一个 transcribe
+        if self._torch_prof is not None or self._torch_done >= self.torch_calls:
+            return
+        try:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_prof = torch.profiler.profile(activities=activities, record_shapes=True)
+            self._torch_prof.__enter__()
+            self._torch_owner = tid
+        except ImportError:
+            print("[profiling] 未安装 torch，跳过 torch 模式")
+            self.modes.remove("torch")
+
+    def _stop_torch(self):
+        prof = self._torch_prof
+        self._torch_prof = None
+        self._torch_owner = None
+        prof.__exit__(None, None, None)
+        self._torch_done += 1
+
+        base = os.path.join(self.run_dir, f"torch_transcribe_{self._torch_done}")
+        prof.export_chrome_trace(f"{base}.json")
+        with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+            f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=40))
+
+
+def parse_modes(value):
+    """解析逗号分隔的模式字符串"""
+    return [m.strip() for m in (value or "").split(",") if m.strip()]
+
+
+def start_from_env(name):
+    """
+    入口处调用：若设置了 B2T_PROFILE 则开启剖析，并在进程退出时自动保存
+    :param name: 入口名
+    :return: ProfileSession 或 None
+    """
+    modes = parse_modes(os.environ.get("B2T_PROFILE"))
+    if not modes:
+        return None
+    session = ProfileSession(modes, name=name, output_dir=os.environ.get("B2T_PROFILE_DIR"),
+                             torch_calls=int(os.environ.get("B2T_PROFILE_TORCH_CALLS", 3)))
+    session.start()
+    atexit.register(session.stop)
+    return session
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用剖析器包装运行任意 Bili2text 入口脚本")
+    parser.add_argument("--mode", default="cprofile",
+                        help=f"剖析模式，逗号分隔: {','.join(MODES)}")
+    parser.add_argument("--dir", default=None, help=f"结果根目录，默认 {DEFAULT_DIR}")
+    parser.add_argument("--interval", type=float, default=0.005, help="stack 模式采样间隔（秒）")
+    parser.add_argument("--torch-calls", type=int, default=3, help="torch 模式最多剖析的 transcribe 次数")
+    parser.add_argument("script", help="入口脚本，如 main.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="传给脚本的参数")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.script))[0]
+    session = ProfileSession(parse_modes(args.mode), name=name, output_dir=args.dir,
+                             sample_interval=args.interval, torch_calls=args.torch_calls)
+
+    # 让脚本看到自己的 argv，且能 import 同目录模块
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+
+    with session:
+        try:
+            runpy.run_path(args.script, run_name="__main__")
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+识别进度 - 以"已处理音频秒数"上报识别进度
+
+上报器登记在线程本地，多个识别任务并发时互不干扰；回调频率默认限制在 10 Hz
+- 识别后端（whisper_backend）在一次 transcribe 内调用 report()：faster-whisper 每得到一个分段上报一次，
+  openai-whisper 没有逐窗口的回调，整次识别结束时上报
+- 调用方识别多段音频（分片、流式窗口）时，每段结束调用 reporter.advance(该段秒数)，后续进度从此累加
+
+用法：
+    with progress.report_progress(lambda done, total: ..., total_seconds=duration) as reporter:
+        for piece in pieces:
+            model.transcribe(piece)
+            reporter.advance(piece_seconds)
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class ProgressReporter:
+    """线程内的进度上报器：限频，并在结束时保证上报最终值"""
+
+    def __init__(self, callback, total_seconds=None, min_interval=0.1):
+        """
+        :param callback: fn(done_seconds, total_seconds)，total_seconds 未知时为 None
+        :param total_seconds: 音频总时长（秒），None 时取第一次识别上报的总长
+        :param min_interval: 两次回调的最小间隔（秒）
+        """
+        self.callback = callback
+        self.total_seconds = total_seconds
+        self.min_interval = min_interval
+        self.offset = 0.0  # 当前这段音频之前已完成的秒数（多段识别时累加）
+        self.done = 0.0
+        self._last_emit = 0.0
+
+    def update(self, done_seconds, force=False):
+        """更新已处理秒数（限频，只增不减：流式窗口末尾被丢弃重识的片段不会让进度倒退）"""
+        done_seconds = max(done_seconds, self.done)
+        self.done = done_seconds
+        now = time.monotonic()
+        if force or now - self._last_emit >= self.min_interval:
+            self._last_emit = now
+            self.callback(done_seconds, self.total_seconds)
+
+    def advance(self, seconds):
+        """一段音频处理完成：后续进度从此处累加"""
+        self.offset += seconds
+        self.update(self.offset, force=True)
+
+
+def current():
+    """本线程登记的上报器（没有则返回 None）"""
+    return getattr(_local, "reporter", None)
+
+
+def report(seconds, total_seconds=None, force=False):
+    """
+    识别后端在一次识别内上报进度（本线程没有登记上报器时什么也不做）
+    :param seconds: 本次识别已处理到的位置（相对本次识别音频的起点，秒）
+    :param total_seconds: 本次识别的音频时长；上报器不知道总时长时用作总长
+    :param force: 不受限频影响（识别结束时的最终值）
+    """
+    reporter = current()
+    if reporter is None:
+        return
+    if reporter.total_seconds is None and total_seconds:
+        reporter.total_seconds = total_seconds
+    reporter.update(reporter.offset + seconds, force=force)
+
+
+@contextmanager
+def report_progress(callback, total_seconds=None, min_interval=0.1):
+    """
+    在本线程内登记进度回调，期间的识别进度以秒数上报
+    :param callback: fn(done_seconds, total_seconds)；None 时不做任何事
+    :param total_seconds: 音频总时长（秒）
+    :param min_interval: 最小回调间隔（秒），默认 10 Hz
+    :return: ProgressReporter（多段识别时用 advance() 累加已完成时长）
+    """
+    if callback is None:
+        yield None
+        return
+
+    previous = current()
+    reporter = ProgressReporter(callback, total_seconds, min_interval)
+    _local.reporter = reporter
+    try:
+        yield reporter
+    finally:
+        _local.reporter = previous
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+实时识别负载控制 - RealtimeRecognizer / FasterRealtimeRecognizer 共用
+- WindowController: 持续统计每个窗口的识别耗时，在上下限之间调整录音窗口长度，
+  使实时率（识别耗时 / 窗口时长）接近目标值，同时限制单个窗口的延迟
+- ModelGovernor: 跟踪字幕延迟，所选模型跟不上时在后台加载更小的模型并在识别线程中无缝切换，
+  延迟恢复后逐级换回（不超过所选模型）
+
+小模型识别很快时缩短窗口以降低延迟；识别跟不上时加长窗口，摊薄每次调用的固定开销
+"""
+
+import threading
+import time
+
+# 从小到大；large / large-v2 / large-v3 同级，降级都先到 medium
+MODEL_LADDER = ["tiny", "base", "small", "medium", "large"]
+
+
+def model_rank(model_name):
+    """
+    模型在 MODEL_LADDER 中的级别
+    :return: 0 起的级别，不认识的模型返回 None
+    """
+    name = model_name.split(".")[0]  # medium.en 等英文模型按同级处理
+    for rank, base in enumerate(MODEL_LADDER):
+        if name == base or name.startswith(base + "-"):
+            return rank
+    return None
+
+
+class WindowController:
+    def __init__(self, initial=5.0, min_seconds=1.0, max_seconds=10.0, target_rtf=0.5,
+                 max_latency=12.0, smoothing=0.3, step=1.25, tolerance=0.2, settle=2):
+        """
+        :param initial: 初始窗口长度（秒）
+        :param min_seconds: 窗口下限（秒）
+        :param max_seconds: 窗口上限（秒）
+        :param target_rtf: 目标实时率，留出余量给静音检测、写文件和界面更新
+        :param max_latency: 单个窗口从开始录音到出结果的最长时间（秒），即 窗口 × (1 + 实时率)
+        :param smoothing: 实时率指数平滑系数（越大越看重最近的窗口）
+        :param step: 每次调整的倍数
+        :param tolerance: 实时率偏离目标的容忍比例，范围内不调整
+        :param settle: 调整后至少观察多少个窗口再次调整，避免来回振荡
+        """
+        self.window = float(initial)
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.target_rtf = target_rtf
+        self.max_latency = max_latency
+        self.smoothing = smoothing
+        self.step = step
+        self.tolerance = tolerance
+        self.settle = settle
+        self.rtf = None
+        self._since_change = 0
+
+    def reset(self):
+        """清除实测数据（例如换了模型）"""
+        self.rtf = None
+        self._since_change = 0
+
+    def observe(self, window_seconds, inference_seconds):
+        """
+        记录一个窗口的识别耗时，必要时调整窗口长度
+        :param window_seconds: 该窗口的音频时长
+        :param inference_seconds: 识别耗时
+        :return: 窗口长度是否改变
+        """
+        if window_seconds <= 0:
+            return False
+        rtf = inference_seconds / window_seconds
+        if self.rtf is None:
+            self.rtf = rtf
+        else:
+            self.rtf = (1 - self.smoothing) * self.rtf + self.smoothing * rtf
+        self._since_change += 1
+        if self._since_change < self.settle:
+            return False
+
+        window = self.window
+        if self.rtf > self.target_rtf * (1 + self.tolerance):
+            window *= self.step
+        elif self.rtf < self.target_rtf * (1 - self.tolerance):
+            window /= self.step
+        # 延迟上限：窗口越长，出结果越晚
+        upper = max(min(self.max_seconds, self.max_latency / (1 + self.rtf)), self.min_seconds)
+        window = round(min(max(window, self.min_seconds), upper), 1)
+        if window == self.window:
+            return False
+        self.window = window
+        self._since_change = 0
+        return True
+
+    def describe(self):
+        """状态栏显示的文本"""
+        if self.rtf is None:
+            return f"窗口 {self.window:g} 秒"
+        return f"窗口 {self.window:g} 秒 · 实时率 {self.rtf:.2f}"
+
+
+class ModelGovernor:
+    def __init__(self, selected, model, loader, release=None, downgrade_lag=15.0, upgrade_lag=3.0,
+                 upgrade_after=60.0, cooldown=30.0):
+        """
+        :param selected: 用户所选的模型名（换回时的上限）
+        :param model: 已加载的所选模型
+        :param loader: fn(model_name) -> 模型，在后台线程中调用
+        :param release: fn(model)，释放不再使用的模型（如关闭识别进程），None 表示交给垃圾回收
+        :param downgrade_lag: 延迟超过该值（秒）时换用更小一级的模型
+        :param upgrade_lag: 延迟低于该值（秒）视为有余量
+        :param upgrade_after: 持续有余量多少秒后换回更大一级的模型
+        :param cooldown: 两次切换之间至少间隔多少秒（新模型需要时间消化积压）
+        """
+        if model_rank(selected) is None:
+            raise ValueError(f"不支持自动切换的模型: {selected}")
+        self.selected = selected
+        self.current = selected
+        self.model = model
+        self.loader = loader
+        self.release = release
+        self.downgrade_lag = downgrade_lag
+        self.upgrade_lag = upgrade_lag
+        self.upgrade_after = upgrade_after
+        self.cooldown = cooldown
+        self.lag = 0.0
+        self.loading = None  # 正在后台加载的模型名
+        self._loaded = None  # 加载完成、等待切换的 (模型名, 模型)
+        self._failed = set()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._last_switch = time.monotonic()
+        self._calm_since = None
+
+    def observe(self, lag):
+        """
+        记录当前延迟（识别线程每处理完一批窗口调用一次），必要时开始后台加载，加载完成后切换
+        :param lag: 最新识别结果对应的音频采集结束到现在的秒数
+        :return: 是否已切换（切换后 self.model / self.current 为新模型）
+        """
+        self.lag = lag
+        now = time.monotonic()
+        with self._lock:
+            loaded, self._loaded = self._loaded, None
+            busy = self.loading is not None
+        if loaded is not None:
+            # 在识别线程中切换：旧模型此时没有在识别，可以直接释放
+            old = self.model
+            self.current, self.model = loaded
+            self._last_switch = now
+            self._calm_since = None
+            if self.release is not None:
+                self.release(old)
+            return True
+        if busy:
+            return False
+
+        if lag < self.upgrade_lag:
+            if self._calm_since is None:
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        if now - self._last_switch < self.cooldown:
+            return False
+
+        rank = model_rank(self.current)
+        if lag > self.downgrade_lag and rank > 0:
+            self._load(MODEL_LADDER[rank - 1])
+        elif self._calm_since is not None and now - self._calm_since >= self.upgrade_after \
+                and rank < model_rank(self.selected):
+            self._load(self.selected if rank + 1 == model_rank(self.selected) else MODEL_LADDER[rank + 1])
+        return False
+
+    def _load(self, model_name):
+        """后台加载模型，完成后由下一次 observe 切换"""
+        if model_name in self._failed:
+            return
+        self.loading = model_name
+        print(f"识别延迟 {self.lag:.1f} 秒，后台加载 {model_name} 模型...")
+
+        def run():
+            try:
+                model = self.loader(model_name)
+            except Exception as e:
+                print(f"加载 {model_name} 模型失败，不再自动切换到该模型: {e}")
+                with self._lock:
+                    self._failed.add(model_name)
+                    self.loading = None
+                return
+            with self._lock:
+                self.loading = None
+                if not self._closed:
+                    self._loaded = (model_name, model)
+                    return
+            # 识别已结束，加载好的模型用不上了
+            if self.release is not None:
+                self.release(model)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        """识别结束：释放已加载但还没切换的模型（仍在加载的模型在加载完成后释放）"""
+        with self._lock:
+            self._closed = True
+            loaded, self._loaded = self._loaded, None
+        if loaded is not None and self.release is not None:
+            self.release(loaded[1])
+
+    def describe(self):
+        """状态栏显示的文本"""
+        if self.loading:
+            return f"模型 {self.current}（正在加载 {self.loading}）"
+        return f"模型 {self.current}"
@@ -8,12 +8,18 @@ import wave
 from datetime import datetime
 import os
 
+from realtime_control import ModelGovernor, WindowController, model_rank
+
 class RealtimeRecognizer:
     def __init__(self, model_name="base", device_name=None, initial_prompt="",
                  enable_hallucination_filter=True,
                  silence_warning_threshold=None, silence_stop_threshold=None,
                  on_silence_warning=None, on_silence_stop=None, on_speech_resumed=None,
-                 level_callback=None):
+                 level_callback=None, capture_audio=True, model=None, text_callback=None,
+                 final_model=None, final_batch_seconds=15, provisional_callback=None, final_callback=None,
+                 isolate_inference=False, adaptive_window=True, min_window=1.0, max_window=10.0,
+                 target_rtf=0.5, status_callback=None, backlog_threshold=2, max_batch_seconds=30,
+                 auto_switch=False, downgrade_lag=15.0, upgrade_lag=3.0, model_loader=None):
         """
         初始化实时识别器
         :param model_name: whisper模型名称 (tiny, base, small, medium, large)
@@ -25,9 +31,52 @@ class RealtimeRecognizer:
         :param on_silence_warning: 静音警告回调 fn(duration)
         :param on_silence_stop: 静音自动停止回调 fn(duration)
         :param on_speech_resumed: 声音恢复回调 fn()
+        :param capture_audio: 是否打开声卡采集；False 时只能通过 transcribe_file 喂入文件（基准测试用）
+        :param model: 已加载的 whisper 模型（如 GUI 预热缓存中的），None 时自行加载
+        :param text_callback: 识别出新句子时的回调 fn(line)（在识别线程中调用）；
+                              设置后不再写入 text_queue，get_latest_text 也就不需要轮询
+        :param final_model: 双模型模式下用于定稿的大模型（已加载的 whisper 模型或模型名），
+                            None 时为单模型模式。双模型模式下 model 只生成临时预览，
+                            输出文件中只写入大模型的结果
+        :param final_batch_seconds: 定稿时合并多少秒的窗口一起识别（上下文更完整）
+        :param provisional_callback: 临时预览回调 fn(window_id, line)，line 为 None 表示该窗口无预览文本
+        :param final_callback: 定稿回调 fn(window_ids, line)，替换这些窗口的预览；line 为 None 表示无文本。
+                               未设置时定稿结果交给 text_callback / text_queue
+        :param isolate_inference: 在独立子进程中运行模型（见 inference_process），音频经共享内存传递；
+                                  采集线程和界面不再与识别争抢 GIL。此时忽略 model，按 model_name 在子进程中加载，
+                                  final_model 为模型名时同样放到独立进程
+        :param adaptive_window: 按实测识别速度自动调整窗口长度（见 realtime_control.WindowController），
+                                小模型用短窗口降低延迟，大模型跟不上时加长窗口
+        :param min_window: 窗口长度下限（秒）
+        :param max_window: 窗口长度上限（秒）
+        :param target_rtf: 目标实时率（识别耗时 / 窗口时长）
+        :param status_callback: 识别状态回调 fn(status)，status 如 "窗口 2.5 秒 · 实时率 0.42"（在识别线程中调用）
+        :param backlog_threshold: 识别跟不上、队列中积压的窗口达到该数量时，把积压的窗口合并为一次识别，
+                                  结果按时间拆回各窗口；0 或 None 表示不合并
+        :param max_batch_seconds: 合并识别的音频时长上限（秒，约数）
+        :param auto_switch: 识别延迟过大时自动换用更小的模型（后台加载，不中断录音），延迟恢复后逐级换回，
+                            不超过 model_name（见 realtime_control.ModelGovernor）；双模型模式下只调整预览模型
+        :param downgrade_lag: 延迟超过该值（秒）时降级
+        :param upgrade_lag: 延迟持续低于该值（秒）时升级
+        :param model_loader: fn(model_name) -> 模型，自动切换时加载其他大小的模型（如 GUI 的模型缓存），
+                             None 时按 whisper.load_model 加载（独立进程模式下在新的识别进程中加载）
         """
-        self.model = whisper.load_model(model_name)
-        self.p = pyaudio.PyAudio()
+        self._processes = []
+        if isolate_inference:
+            from inference_process import InferenceProcess
+            try:
+                model = InferenceProcess(model_name).start()
+                self._processes.append(model)
+                if isinstance(final_model, str):
+                    final_model = InferenceProcess(final_model).start()
+                    self._processes.append(final_model)
+            except Exception:
+                for process in self._processes:
+                    process.close()
+                raise
+        self.model = model if model is not None else whisper.load_model(model_name)
+        self.capture_audio = capture_audio
+        self.p = pyaudio.PyAudio() if capture_audio else None
         self.stream = None
         self.is_recording = False
         self.audio_queue = queue.Queue()
@@ -41,7 +90,25 @@ class RealtimeRecognizer:
         self.CHANNELS = 2
         self.RATE = 16000
         self.CHUNK = 1024 * 2
-        self.RECORD_SECONDS = 5  # 每5秒处理一次
+        self.RECORD_SECONDS = 5  # 初始每5秒处理一次，开启 adaptive_window 时随识别速度调整
+        self.window_controller = None
+        if adaptive_window:
+            self.window_controller = WindowController(self.RECORD_SECONDS, min_window, max_window, target_rtf)
+        self.status_callback = status_callback
+        self.backlog_threshold = backlog_threshold
+        self.max_batch_seconds = max_batch_seconds
+
+        # 自动切换模型
+        self.governor = None
+        if auto_switch and model_rank(model_name) is None:
+            print(f"{model_name} 模型不支持自动切换，保持使用该模型")
+        elif auto_switch:
+            release = None
+            if model_loader is None and isolate_inference:
+                model_loader = self._start_process
+                release = lambda process: process.close()
+            self.governor = ModelGovernor(model_name, self.model, model_loader or whisper.load_model,
+                                          release=release, downgrade_lag=downgrade_lag, upgrade_lag=upgrade_lag)
 
         # 幻觉检测参数
         self.enable_hallucination_filter = enable_hallucination_filter
@@ -64,28 +131,52 @@ class RealtimeRecognizer:
         self._silence_start_time = None
         self._silence_warning_sent = False
         self.level_callback = level_callback
+        self.text_callback = text_callback
+
+        # 双模型：小模型即时预览，大模型在后台对同一段音频重新识别后替换预览
+        if isinstance(final_model, str):
+            final_model = whisper.load_model(final_model)
+        self.final_model = final_model
+        self.final_batch_seconds = final_batch_seconds
+        self.provisional_callback = provisional_callback
+        self.final_callback = final_callback
+        self.final_queue = queue.Queue()
+        self.final_recent_texts = []  # 定稿文本单独去重，预览和定稿内容相同不算重复
+        self._window_id = 0
 
         # 查找BlackHole设备
-        self.find_blackhole_device()
+        if capture_audio:
+            self.find_blackhole_device()
+
+    def _start_process(self, model_name):
+        """自动切换（独立进程模式）：在新的识别进程中加载模型"""
+        from inference_process import InferenceProcess
+
+        process = InferenceProcess(model_name).start()
+        self._processes.append(process)
+        return process
 
     def is_silence(self, audio_array):
         """检测音频是否为静音"""
         energy = np.sum(audio_array ** 2) / len(audio_array)
         return energy < self.energy_threshold
 
-    def is_hallucination(self, text):
-        """检测是否为幻觉文本"""
+    def is_hallucination(self, text, recent_texts=None):
+        """检测是否为幻觉文本（recent_texts 默认为最近的识别结果）"""
         if not text or len(text.strip()) < 2:
             return True
 
+        if recent_texts is None:
+            recent_texts = self.recent_texts
+
         # 检查是否为重复文本
-        if self.recent_texts:
+        if recent_texts:
             # 如果与最近的文本完全相同
-            if text in self.recent_texts:
+            if text in recent_texts:
                 return True
             # 如果连续3个文本都很相似（编辑距离很小）
-            if len(self.recent_texts) >= 2:
-                similar_count = sum(1 for recent in self.recent_texts[-2:]
+            if len(recent_texts) >= 2:
+                similar_count = sum(1 for recent in recent_texts[-2:]
                                   if self.similarity(text, recent) > 0.8)
                 if similar_count >= 2:
                     return True
@@ -173,14 +264,7 @@ class RealtimeRecognizer:
         print(f"\n开始录音，使用设备索引: {self.device_index}")
         self.is_recording = True
 
-        # 创建输出目录
-        os.makedirs("outputs", exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.output_file = f"outputs/realtime_{timestamp}.txt"
-        self.clean_output_file = f"outputs/realtime_{timestamp}_clean.txt"
-
-        # 用于存储所有识别的文本（干净版本）
-        self.all_texts = []
+        self._prepare_output_files()
 
         # 打开音频流
         try:
@@ -208,15 +292,57 @@ class RealtimeRecognizer:
             print(f"无法打开音频流: {e}")
             self.is_recording = False
 
+    def _prepare_output_files(self):
+        """生成本次会话的输出文件路径"""
+        # 创建输出目录
+        os.makedirs("outputs", exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_file = f"outputs/realtime_{timestamp}.txt"
+        self.clean_output_file = f"outputs/realtime_{timestamp}_clean.txt"
+
+        # 用于存储所有识别的文本（干净版本）
+        self.all_texts = []
+
+    def transcribe_file(self, file_path):
+        """
+        从音频文件喂入数据（不经过声卡），按录音线程相同的窗口切分后走完整识别流程
+        主要用于基准测试和离线复现问题
+        :param file_path: 音频/视频文件路径
+        :return: 识别出的完整文本（干净版本）
+        """
+        from local_file_recognition import load_audio
+
+        audio = load_audio(file_path)
+        # 还原成与声卡采集一致的格式：float32 交错多声道字节流
+        if self.CHANNELS > 1:
+            audio = np.repeat(audio, self.CHANNELS)
+        window_frames = int(self.RATE / self.CHUNK * self.RECORD_SECONDS) * self.CHUNK
+        window_size = window_frames * self.CHANNELS
+
+        self._prepare_output_files()
+        # 采集时间按窗口在文件中的位置推算
+        started = time.time()
+        for start in range(0, len(audio), window_size):
+            capture_time = started + start / self.CHANNELS / self.RATE
+            self.audio_queue.put((capture_time, audio[start:start + window_size].tobytes()))
+
+        # is_recording 为 False 时识别线程处理完队列即退出
+        self._recognize_audio()
+
+        full_text = ''.join(self.all_texts)
+        with open(self.clean_output_file, 'w', encoding='utf-8') as f:
+            f.write(full_text)
+        return full_text
+
     def _record_audio(self):
         """录音线程"""
-        frames = []
-        chunk_frames = int(self.RATE / self.CHUNK * self.RECORD_SECONDS)
-
         while self.is_recording:
             try:
+                # 每个窗口开始时重新计算长度（识别线程可能已调整 RECORD_SECONDS）
+                chunk_frames = max(1, int(self.RATE / self.CHUNK * self.RECORD_SECONDS))
                 # 收集音频数据
                 current_frames = []
+                capture_time = time.time()
                 for _ in range(chunk_frames):
                     if not self.is_recording:
                         break
@@ -231,9 +357,9 @@ class RealtimeRecognizer:
                         self.level_callback(audio_array)
 
                 if current_frames:
-                    # 将音频数据加入队列
+                    # 将音频数据连同开始采集的时间加入队列（积压时时间戳仍对应采集时刻）
                     audio_data = b''.join(current_frames)
-                    self.audio_queue.put(audio_data)
+                    self.audio_queue.put((capture_time, audio_data))
 
             except Exception as e:
                 print(f"录音错误: {e}")
@@ -244,108 +370,327 @@ class RealtimeRecognizer:
         # 初始化带时间戳的文件
         with open(self.output_file, 'w', encoding='utf-8') as f:
             f.write(f"实时识别开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            if self.final_model is not None:
+                f.write("双模型模式: 以下为定稿模型的识别结果\n")
+            if self.window_controller is not None:
+                f.write(f"识别窗口: 按识别速度自动调整（{self.window_controller.min_seconds:g}-"
+                        f"{self.window_controller.max_seconds:g} 秒）\n")
+            if self.governor is not None:
+                f.write(f"自动切换模型: 所选 {self.governor.selected}，延迟超过 {self.governor.downgrade_lag:g} 秒"
+                        f"换用更小的模型，低于 {self.governor.upgrade_lag:g} 秒时逐级换回；切换记录见正文\n")
             f.write("=" * 50 + "\n\n")
 
         # 初始化干净版本文件
         with open(self.clean_output_file, 'w', encoding='utf-8') as f:
             f.write("")  # 创建空文件
 
+        final_thread = None
+        if self.final_model is not None:
+            final_thread = threading.Thread(target=self._finalize_audio, daemon=True)
+            final_thread.start()
+
+        try:
+            self._recognize_loop()
+        finally:
+            if final_thread is not None:
+                # 等待定稿线程处理完已排队的音频，输出文件最终都是大模型的结果
+                self.final_queue.put(None)
+                final_thread.join()
+
+    def _recognize_loop(self):
         while self.is_recording or not self.audio_queue.empty():
             try:
-                # 从队列获取音频数据
-                audio_data = self.audio_queue.get(timeout=1)
-
-                # 转换为numpy数组
-                audio_array = np.frombuffer(audio_data, dtype=np.float32)
-
-                # 如果是双声道，转换为单声道
-                if self.CHANNELS == 2:
-                    audio_array = audio_array.reshape(-1, 2).mean(axis=1)
-
-                # 归一化音频
-                if np.max(np.abs(audio_array)) > 0:
-                    audio_array = audio_array / np.max(np.abs(audio_array))
-
-                # 检测是否为静音（仅在启用过滤时）
-                if self.enable_hallucination_filter and self.is_silence(audio_array):
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到静音，跳过...")
-
-                    # 静音时长追踪（如果启用了静音检测）
-                    if self.silence_warning_threshold and self.silence_stop_threshold:
-                        if self._silence_start_time is None:
-                            self._silence_start_time = time.time()
-                        silence_duration = time.time() - self._silence_start_time
-
-                        if silence_duration >= self.silence_stop_threshold:
-                            if self.on_silence_stop:
-                                self.on_silence_stop(silence_duration)
-                            return  # 退出识别循环
-                        elif silence_duration >= self.silence_warning_threshold and not self._silence_warning_sent:
-                            if self.on_silence_warning:
-                                self.on_silence_warning(silence_duration)
-                            self._silence_warning_sent = True
-
-                    continue
-                else:
-                    # 非静音：如果之前发过警告，触发恢复回调并重置
-                    if self._silence_warning_sent and self.on_speech_resumed:
-                        self.on_speech_resumed()
-                    self._silence_start_time = None
-                    self._silence_warning_sent = False
-
-                # 使用Whisper识别
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在识别音频片段...")
-
-                if self.enable_hallucination_filter:
-                    # 启用幻觉过滤时，使用优化参数
-                    result = self.model.transcribe(
-                        audio_array,
-                        language="zh",
-                        initial_prompt=self.initial_prompt,
-                        temperature=0.0,  # 降低随机性，减少幻觉
-                        no_speech_threshold=0.6,  # 提高静音阈值
-                        logprob_threshold=-1.0,  # 过滤低置信度结果
-                        compression_ratio_threshold=2.4,  # 过滤重复内容
-                        condition_on_previous_text=False  # 不依赖前文，减少错误传播
-                    )
-                else:
-                    # 不启用过滤时，使用默认参数
-                    result = self.model.transcribe(
-                        audio_array,
-                        language="zh",
-                        initial_prompt=self.initial_prompt
-                    )
-
-                text = result["text"].strip()
-
-                # 检测是否为幻觉文本（仅在启用过滤时）
-                if text and (not self.enable_hallucination_filter or not self.is_hallucination(text)):
-                    timestamp = datetime.now().strftime('%H:%M:%S')
-                    output_line = f"[{timestamp}] {text}"
-                    print(f"识别结果: {text}")
-
-                    # 更新最近识别的文本列表
-                    self.recent_texts.append(text)
-                    if len(self.recent_texts) > self.max_recent_texts:
-                        self.recent_texts.pop(0)
-
-                    # 保存带时间戳版本
-                    with open(self.output_file, 'a', encoding='utf-8') as f:
-                        f.write(output_line + "\n")
-
-                    # 保存到干净版本（不换行，连续文本）
-                    self.all_texts.append(text)
-
-                    # 加入文本队列（供UI使用）
-                    self.text_queue.put(output_line)
-                elif text:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到幻觉内容，已过滤: {text[:30]}...")
+                # 从队列获取音频数据（积压时一并取出）
+                batch = self._take_batch(self.audio_queue.get(timeout=1))
+
+                windows = []
+                stop = False
+                for capture_time, audio_data in batch:
+                    audio_array = self._prepare_audio(audio_data)
+                    state = self._silence_state(audio_array)
+                    if state == "stop":
+                        stop = True
+                        break
+                    if state is None:
+                        windows.append((capture_time, audio_array))
+
+                if windows:
+                    self._recognize_windows(windows)
+                if stop:
+                    return  # 退出识别循环
 
             except queue.Empty:
                 continue
             except Exception as e:
                 print(f"识别错误: {e}")
 
+    def _take_batch(self, item):
+        """
+        识别跟不上时（队列中积压的窗口达到 backlog_threshold），把积压的窗口一并取出合并识别
+        :param item: 已取出的 (采集时间, 音频字节)
+        :return: [(采集时间, 音频字节), ...]
+        """
+        batch = [item]
+        if not self.backlog_threshold or self.audio_queue.qsize() < self.backlog_threshold:
+            return batch
+        limit = self.max_batch_seconds * self.RATE * self.CHANNELS * 4  # float32 字节数
+        size = len(item[1])
+        while size < limit:
+            try:
+                item = self.audio_queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def _silence_state(self, audio_array):
+        """
+        静音检测（仅在启用过滤时）与静音计时
+        :return: None 有声音；"skip" 静音，跳过该窗口；"stop" 静音超时，应停止识别
+        """
+        if not (self.enable_hallucination_filter and self.is_silence(audio_array)):
+            # 非静音：如果之前发过警告，触发恢复回调并重置
+            if self._silence_warning_sent and self.on_speech_resumed:
+                self.on_speech_resumed()
+            self._silence_start_time = None
+            self._silence_warning_sent = False
+            return None
+
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到静音，跳过...")
+
+        # 静音时长追踪（如果启用了静音检测）
+        if self.silence_warning_threshold and self.silence_stop_threshold:
+            if self._silence_start_time is None:
+                self._silence_start_time = time.time()
+            silence_duration = time.time() - self._silence_start_time
+
+            if silence_duration >= self.silence_stop_threshold:
+                if self.on_silence_stop:
+                    self.on_silence_stop(silence_duration)
+                return "stop"
+            elif silence_duration >= self.silence_warning_threshold and not self._silence_warning_sent:
+                if self.on_silence_warning:
+                    self.on_silence_warning(silence_duration)
+                self._silence_warning_sent = True
+        return "skip"
+
+    def _recognize_windows(self, windows):
+        """
+        识别一个或多个（积压合并的）窗口，逐个窗口输出
+        :param windows: [(采集时间, 单声道音频), ...]
+        """
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在识别音频片段...")
+        started = time.perf_counter()
+        if len(windows) == 1:
+            texts = [self._transcribe(self.model, windows[0][1])]
+        else:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 识别积压 {len(windows)} 个窗口，合并为一次识别")
+            texts = self._transcribe_batch(self.model, [audio for _, audio in windows])
+        self._observe_window(sum(len(audio) for _, audio in windows) / self.RATE,
+                             time.perf_counter() - started)
+
+        for (capture_time, audio_array), text in zip(windows, texts):
+            timestamp = datetime.fromtimestamp(capture_time).strftime('%H:%M:%S')
+            if self.final_model is not None:
+                # 同一段音频交给定稿线程，预览只推送给界面
+                window_id = self._window_id
+                self._window_id += 1
+                self.final_queue.put((window_id, timestamp, audio_array))
+                self._emit_provisional(window_id, timestamp, text)
+            else:
+                self._emit_text(timestamp, text)
+
+        self._observe_lag(windows[-1])
+
+    def _prepare_audio(self, audio_data):
+        """声卡字节流 -> 归一化的单声道 float32 数组"""
+        # 转换为numpy数组
+        audio_array = np.frombuffer(audio_data, dtype=np.float32)
+
+        # 如果是双声道，转换为单声道
+        if self.CHANNELS == 2:
+            audio_array = audio_array.reshape(-1, 2).mean(axis=1)
+
+        # 归一化音频
+        if np.max(np.abs(audio_array)) > 0:
+            audio_array = audio_array / np.max(np.abs(audio_array))
+        return audio_array
+
+    def _transcribe(self, model, audio_array):
+        """识别一段音频，返回去除首尾空白的文本"""
+        return self._transcribe_result(model, audio_array)["text"].strip()
+
+    def _transcribe_batch(self, model, audios):
+        """
+        把多个窗口拼接后识别一次，再按分段的中点时间把文本拆回各窗口
+        :return: 每个窗口的文本
+        """
+        result = self._transcribe_result(model, np.concatenate(audios))
+        bounds = np.cumsum([len(audio) for audio in audios]) / self.RATE
+        texts = [""] * len(audios)
+        for segment in result.get("segments", []):
+            middle = (segment["start"] + segment["end"]) / 2
+            index = min(int(np.searchsorted(bounds, middle, side="right")), len(audios) - 1)
+            texts[index] += segment["text"]
+        return [text.strip() for text in texts]
+
+    def _transcribe_result(self, model, audio_array):
+        """识别一段音频，返回模型的完整结果（text / segments）"""
+        if self.enable_hallucination_filter:
+            # 启用幻觉过滤时，使用优化参数
+            result = model.transcribe(
+                audio_array,
+                language="zh",
+                initial_prompt=self.initial_prompt,
+                temperature=0.0,  # 降低随机性，减少幻觉
+                no_speech_threshold=0.6,  # 提高静音阈值
+                logprob_threshold=-1.0,  # 过滤低置信度结果
+                compression_ratio_threshold=2.4,  # 过滤重复内容
+                condition_on_previous_text=False  # 不依赖前文，减少错误传播
+            )
+        else:
+            # 不启用过滤时，使用默认参数
+            result = model.transcribe(
+                audio_array,
+                language="zh",
+                initial_prompt=self.initial_prompt
+            )
+        return result
+
+    def _observe_window(self, window_seconds, elapsed):
+        """记录一个窗口的识别耗时，按实测速度调整之后的窗口长度，并上报状态"""
+        controller = self.window_controller
+        if controller is not None and controller.observe(window_seconds, elapsed):
+            self.RECORD_SECONDS = controller.window
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 调整识别窗口: {controller.describe()}")
+        self._report_status()
+
+    def _observe_lag(self, window):
+        """
+        记录字幕延迟（最新窗口采集结束到现在），必要时自动切换模型
+        :param window: 最新识别的 (采集时间, 单声道音频)
+        """
+        if self.governor is None:
+            return
+        capture_time, audio_array = window
+        lag = time.time() - capture_time - len(audio_array) / self.RATE
+        previous = self.governor.current
+        if not self.governor.observe(lag):
+            return
+        self.model = self.governor.model
+        # 新模型的识别速度不同，窗口长度重新适应
+        if self.window_controller is not None:
+            self.window_controller.reset()
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] [模型切换] {previous} -> {self.governor.current}（延迟 {lag:.0f} 秒）"
+        print(line)
+        with open(self.output_file, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+        self._report_status()
+
+    def _report_status(self):
+        """把当前模型、窗口长度和实时率交给 status_callback（状态栏）"""
+        if not self.status_callback:
+            return
+        parts = []
+        if self.governor is not None:
+            parts.append(self.governor.describe())
+        if self.window_controller is not None:
+            parts.append(self.window_controller.describe())
+        if parts:
+            self.status_callback(" · ".join(parts))
+
+    def _accept_text(self, text, recent_texts):
+        """幻觉过滤（仅在启用过滤时）；通过的文本记入 recent_texts"""
+        if not text:
+            return False
+        if self.enable_hallucination_filter and self.is_hallucination(text, recent_texts):
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到幻觉内容，已过滤: {text[:30]}...")
+            return False
+
+        # 更新最近识别的文本列表
+        recent_texts.append(text)
+        if len(recent_texts) > self.max_recent_texts:
+            recent_texts.pop(0)
+        return True
+
+    def _emit_text(self, timestamp, text):
+        """写入输出文件并推送给界面"""
+        if not self._accept_text(text, self.recent_texts):
+            return
+        output_line = f"[{timestamp}] {text}"
+        print(f"识别结果: {text}")
+        self._write_line(output_line, text)
+
+        # 推送给UI（回调优先，否则加入文本队列供轮询）
+        if self.text_callback:
+            self.text_callback(output_line)
+        else:
+            self.text_queue.put(output_line)
+
+    def _write_line(self, output_line, text):
+        # 保存带时间戳版本
+        with open(self.output_file, 'a', encoding='utf-8') as f:
+            f.write(output_line + "\n")
+
+        # 保存到干净版本（不换行，连续文本）
+        self.all_texts.append(text)
+
+    def _emit_provisional(self, window_id, timestamp, text):
+        """双模型模式：小模型的临时结果只推送给界面，不写文件"""
+        line = None
+        if self._accept_text(text, self.recent_texts):
+            line = f"[{timestamp}] {text}"
+            print(f"预览结果: {text}")
+        if self.provisional_callback:
+            self.provisional_callback(window_id, line)
+
+    def _finalize_audio(self):
+        """定稿线程：合并若干窗口，用大模型重新识别后替换预览"""
+        batch_samples = int(self.final_batch_seconds * self.RATE)
+        wait = self.RECORD_SECONDS * 2
+        done = False
+        while not done:
+            item = self.final_queue.get()
+            if item is None:
+                break
+            batch = [item]
+            samples = len(item[2])
+            # 凑够 final_batch_seconds 再识别；停顿（静音窗口不入队）时不再等待
+            while samples < batch_samples:
+                try:
+                    item = self.final_queue.get(timeout=wait)
+                except queue.Empty:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+                samples += len(item[2])
+
+            window_ids = [w[0] for w in batch]
+            timestamp = batch[0][1]
+            try:
+                audio = np.concatenate([w[2] for w in batch])
+                text = self._transcribe(self.final_model, audio)
+            except Exception as e:
+                print(f"定稿识别错误: {e}")
+                text = ""
+
+            line = None
+            if self._accept_text(text, self.final_recent_texts):
+                line = f"[{timestamp}] {text}"
+                print(f"定稿结果: {text}")
+                self._write_line(line, text)
+
+            if self.final_callback:
+                self.final_callback(window_ids, line)
+            elif line:
+                if self.text_callback:
+                    self.text_callback(line)
+                else:
+                    self.text_queue.put(line)
+
     def stop_recording(self):
         """停止录音"""
         if not self.is_recording:
@@ -379,7 +724,13 @@ class RealtimeRecognizer:
     def cleanup(self):
         """清理资源"""
         self.stop_recording()
-        self.p.terminate()
+        if self.p:
+            self.p.terminate()
+        if self.governor is not None:
+            self.governor.close()
+        for process in self._processes:
+            process.close()
+        self._processes = []
 
     def get_latest_text(self):
         """获取最新的识别文本（供UI调用）"""
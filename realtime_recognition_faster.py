@@ -8,16 +8,36 @@ import wave
 from datetime import datetime
 import os
 import torch
+from whisper_backend import prompt_tokens
+from realtime_control import ModelGovernor, WindowController, model_rank
 
 class FasterRealtimeRecognizer:
-    def __init__(self, model_name="large-v3", device_name=None, initial_prompt="", enable_hallucination_filter=True):
+    def __init__(self, model_name="large-v3", device_name=None, initial_prompt="", enable_hallucination_filter=True,
+                 capture_audio=True, text_callback=None, adaptive_window=True, min_window=1.0, max_window=10.0,
+                 target_rtf=0.5, status_callback=None, backlog_threshold=2, max_batch_seconds=30,
+                 auto_switch=False, downgrade_lag=15.0, upgrade_lag=3.0):
         """
         初始化实时识别器（使用 faster-whisper）
         :param model_name: whisper模型名称 (tiny, base, small, medium, large-v2, large-v3)
         :param device_name: 音频设备名称，如果为None则自动检测
         :param initial_prompt: 初始提示词，用于提高识别准确度
         :param enable_hallucination_filter: 是否启用幻觉过滤
+        :param capture_audio: 是否打开声卡采集；False 时只能通过 transcribe_file 喂入文件（基准测试用）
+        :param text_callback: 识别出新句子时的回调 fn(line)（在识别线程中调用），设置后不再写入 text_queue
+        :param adaptive_window: 按实测识别速度自动调整窗口长度（见 realtime_control.WindowController）
+        :param min_window: 窗口长度下限（秒）
+        :param max_window: 窗口长度上限（秒）
+        :param target_rtf: 目标实时率（识别耗时 / 窗口时长）
+        :param status_callback: 识别状态回调 fn(status)，status 如 "窗口 2.5 秒 · 实时率 0.42"（在识别线程中调用）
+        :param backlog_threshold: 识别跟不上、队列中积压的窗口达到该数量时，把积压的窗口合并为一次识别，
+                                  结果按时间拆回各窗口；0 或 None 表示不合并
+        :param max_batch_seconds: 合并识别的音频时长上限（秒，约数）
+        :param auto_switch: 识别延迟过大时自动换用更小的模型（后台加载，不中断录音），延迟恢复后逐级换回，
+                            不超过 model_name（见 realtime_control.ModelGovernor）
+        :param downgrade_lag: 延迟超过该值（秒）时降级
+        :param upgrade_lag: 延迟持续低于该值（秒）时升级
         """
+        self.text_callback = text_callback
         # 检测设备类型
         if torch.cuda.is_available():
             device = "cuda"
@@ -30,18 +50,12 @@ class FasterRealtimeRecognizer:
             compute_type = "int8"
 
         print(f"使用设备: {device}, 计算类型: {compute_type}")
-        print(f"加载模型: {model_name} (首次需要下载，请耐心等待)")
-
-        # 加载 faster-whisper 模型
-        self.model = WhisperModel(
-            model_name,
-            device=device,
-            compute_type=compute_type,
-            cpu_threads=8,  # 使用多线程加速
-            num_workers=2
-        )
+        self.device = device
+        self.compute_type = compute_type
+        self.model = self._load_model(model_name)
 
-        self.p = pyaudio.PyAudio()
+        self.capture_audio = capture_audio
+        self.p = pyaudio.PyAudio() if capture_audio else None
         self.stream = None
         self.is_recording = False
         self.audio_queue = queue.Queue()
@@ -55,7 +69,22 @@ class FasterRealtimeRecognizer:
         self.CHANNELS = 2
         self.RATE = 16000
         self.CHUNK = 1024 * 2
-        self.RECORD_SECONDS = 5  # 每5秒处理一次
+        self.RECORD_SECONDS = 5  # 初始每5秒处理一次，开启 adaptive_window 时随识别速度调整
+        self.window_controller = None
+        if adaptive_window:
+            self.window_controller = WindowController(self.RECORD_SECONDS, min_window, max_window, target_rtf)
+        self.status_callback = status_callback
+        self.backlog_threshold = backlog_threshold
+        self.max_batch_seconds = max_batch_seconds
+
+        # 自动切换模型
+        self.governor = None
+        if auto_switch and model_rank(model_name) is None:
+            print(f"{model_name} 模型不支持自动切换，保持使用该模型")
+        elif auto_switch:
+            self.governor = ModelGovernor(model_name, self.model, self._load_model,
+                                          downgrade_lag=downgrade_lag, upgrade_lag=upgrade_lag)
+        self.model_name = model_name
 
         # 幻觉检测参数
         self.enable_hallucination_filter = enable_hallucination_filter
@@ -70,7 +99,19 @@ class FasterRealtimeRecognizer:
             self.hallucination_keywords = [w for w in words if len(w) > 2]
 
         # 查找音频设备
-        self.find_audio_device()
+        if capture_audio:
+            self.find_audio_device()
+
+    def _load_model(self, model_name):
+        """加载 faster-whisper 模型（初始化和自动切换时调用）"""
+        print(f"加载模型: {model_name} (首次需要下载，请耐心等待)")
+        return WhisperModel(
+            model_name,
+            device=self.device,
+            compute_type=self.compute_type,
+            cpu_threads=8,  # 使用多线程加速
+            num_workers=2
+        )
 
     def is_silence(self, audio_array):
         """检测音频是否为静音"""
@@ -175,14 +216,7 @@ class FasterRealtimeRecognizer:
         print(f"\n开始录音，使用设备索引: {self.device_index}")
         self.is_recording = True
 
-        # 创建输出目录
-        os.makedirs("outputs", exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        self.output_file = f"outputs/realtime_{timestamp}.txt"
-        self.clean_output_file = f"outputs/realtime_{timestamp}_clean.txt"
-
-        # 用于存储所有识别的文本（干净版本）
-        self.all_texts = []
+        self._prepare_output_files()
 
         # 打开音频流
         try:
@@ -210,15 +244,57 @@ class FasterRealtimeRecognizer:
             print(f"无法打开音频流: {e}")
             self.is_recording = False
 
+    def _prepare_output_files(self):
+        """生成本次会话的输出文件路径"""
+        # 创建输出目录
+        os.makedirs("outputs", exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.output_file = f"outputs/realtime_{timestamp}.txt"
+        self.clean_output_file = f"outputs/realtime_{timestamp}_clean.txt"
+
+        # 用于存储所有识别的文本（干净版本）
+        self.all_texts = []
+
+    def transcribe_file(self, file_path):
+        """
+        从音频文件喂入数据（不经过声卡），按录音线程相同的窗口切分后走完整识别流程
+        主要用于基准测试和离线复现问题
+        :param file_path: 音频/视频文件路径
+        :return: 识别出的完整文本（干净版本）
+        """
+        from local_file_recognition import load_audio
+
+        audio = load_audio(file_path)
+        # 还原成与声卡采集一致的格式：float32 交错多声道字节流
+        if self.CHANNELS > 1:
+            audio = np.repeat(audio, self.CHANNELS)
+        window_frames = int(self.RATE / self.CHUNK * self.RECORD_SECONDS) * self.CHUNK
+        window_size = window_frames * self.CHANNELS
+
+        self._prepare_output_files()
+        # 采集时间按窗口在文件中的位置推算
+        started = time.time()
+        for start in range(0, len(audio), window_size):
+            capture_time = started + start / self.CHANNELS / self.RATE
+            self.audio_queue.put((capture_time, audio[start:start + window_size].tobytes()))
+
+        # is_recording 为 False 时识别线程处理完队列即退出
+        self._recognize_audio()
+
+        full_text = ''.join(self.all_texts)
+        with open(self.clean_output_file, 'w', encoding='utf-8') as f:
+            f.write(full_text)
+        return full_text
+
     def _record_audio(self):
         """录音线程"""
-        frames = []
-        chunk_frames = int(self.RATE / self.CHUNK * self.RECORD_SECONDS)
-
         while self.is_recording:
             try:
+                # 每个窗口开始时重新计算长度（识别线程可能已调整 RECORD_SECONDS）
+                chunk_frames = max(1, int(self.RATE / self.CHUNK * self.RECORD_SECONDS))
                 # 收集音频数据
                 current_frames = []
+                capture_time = time.time()
                 for _ in range(chunk_frames):
                     if not self.is_recording:
                         break
@@ -226,9 +302,9 @@ class FasterRealtimeRecognizer:
                     current_frames.append(data)
 
                 if current_frames:
-                    # 将音频数据加入队列
+                    # 将音频数据连同开始采集的时间加入队列（积压时时间戳仍对应采集时刻）
                     audio_data = b''.join(current_frames)
-                    self.audio_queue.put(audio_data)
+                    self.audio_queue.put((capture_time, audio_data))
 
             except Exception as e:
                 print(f"录音错误: {e}")
@@ -239,7 +315,13 @@ class FasterRealtimeRecognizer:
         # 初始化带时间戳的文件
         with open(self.output_file, 'w', encoding='utf-8') as f:
             f.write(f"实时识别开始时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"使用模型: faster-whisper large-v3\n")
+            f.write(f"使用模型: faster-whisper {self.model_name}\n")
+            if self.window_controller is not None:
+                f.write(f"识别窗口: 按识别速度自动调整（{self.window_controller.min_seconds:g}-"
+                        f"{self.window_controller.max_seconds:g} 秒）\n")
+            if self.governor is not None:
+                f.write(f"自动切换模型: 所选 {self.governor.selected}，延迟超过 {self.governor.downgrade_lag:g} 秒"
+                        f"换用更小的模型，低于 {self.governor.upgrade_lag:g} 秒时逐级换回；切换记录见正文\n")
             f.write("=" * 50 + "\n\n")
 
         # 初始化干净版本文件
@@ -248,81 +330,170 @@ class FasterRealtimeRecognizer:
 
         while self.is_recording or not self.audio_queue.empty():
             try:
-                # 从队列获取音频数据
-                audio_data = self.audio_queue.get(timeout=1)
+                # 从队列获取音频数据（积压时一并取出）
+                batch = self._take_batch(self.audio_queue.get(timeout=1))
+
+                windows = []
+                for capture_time, audio_data in batch:
+                    # 转换为numpy数组
+                    audio_array = np.frombuffer(audio_data, dtype=np.float32)
 
-                # 转换为numpy数组
-                audio_array = np.frombuffer(audio_data, dtype=np.float32)
+                    # 如果是双声道，转换为单声道
+                    if self.CHANNELS == 2:
+                        audio_array = audio_array.reshape(-1, 2).mean(axis=1)
 
-                # 如果是双声道，转换为单声道
-                if self.CHANNELS == 2:
-                    audio_array = audio_array.reshape(-1, 2).mean(axis=1)
+                    # 归一化音频
+                    if np.max(np.abs(audio_array)) > 0:
+                        audio_array = audio_array / np.max(np.abs(audio_array))
 
-                # 归一化音频
-                if np.max(np.abs(audio_array)) > 0:
-                    audio_array = audio_array / np.max(np.abs(audio_array))
+                    # 检测是否为静音（仅在启用过滤时）
+                    if self.enable_hallucination_filter and self.is_silence(audio_array):
+                        print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到静音，跳过...")
+                        continue
+                    windows.append((capture_time, audio_array))
 
-                # 检测是否为静音（仅在启用过滤时）
-                if self.enable_hallucination_filter and self.is_silence(audio_array):
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到静音，跳过...")
+                if not windows:
                     continue
 
                 # 使用faster-whisper识别
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在识别音频片段...")
-
-                # 设置识别参数（针对中文优化）
-                segments, info = self.model.transcribe(
-                    audio_array,
-                    language="zh",
-                    initial_prompt=self.initial_prompt,
-                    beam_size=5,  # 使用束搜索提高准确度
-                    best_of=5,  # 采样5个候选
-                    temperature=0.0 if self.enable_hallucination_filter else 0.2,
-                    vad_filter=True,  # 启用VAD过滤静音
-                    vad_parameters=dict(
-                        threshold=0.5,
-                        min_silence_duration_ms=500,
-                        speech_pad_ms=400
-                    ),
-                    word_timestamps=False,  # 不需要词级时间戳
-                    condition_on_previous_text=False if self.enable_hallucination_filter else True
-                )
-
-                # 提取识别文本
-                text = ""
-                for segment in segments:
-                    text += segment.text
-
-                text = text.strip()
-
-                # 检测是否为幻觉文本（仅在启用过滤时）
-                if text and (not self.enable_hallucination_filter or not self.is_hallucination(text)):
-                    timestamp = datetime.now().strftime('%H:%M:%S')
-                    output_line = f"[{timestamp}] {text}"
-                    print(f"识别结果: {text}")
-
-                    # 更新最近识别的文本列表
-                    self.recent_texts.append(text)
-                    if len(self.recent_texts) > self.max_recent_texts:
-                        self.recent_texts.pop(0)
-
-                    # 保存带时间戳版本
-                    with open(self.output_file, 'a', encoding='utf-8') as f:
-                        f.write(output_line + "\n")
-
-                    # 保存到干净版本（不换行，连续文本）
-                    self.all_texts.append(text)
-
-                    # 加入文本队列（供UI使用）
-                    self.text_queue.put(output_line)
-                elif text and self.enable_hallucination_filter:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到幻觉内容，已过滤: {text[:30]}...")
+                audios = [audio for _, audio in windows]
+                if len(audios) > 1:
+                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 识别积压 {len(audios)} 个窗口，合并为一次识别")
+                started = time.perf_counter()
+                segments = self._transcribe_segments(np.concatenate(audios))
+                self._observe_window(sum(len(audio) for audio in audios) / self.RATE,
+                                     time.perf_counter() - started)
+
+                for (capture_time, _), text in zip(windows, self._split_segments(segments, audios)):
+                    self._emit_text(datetime.fromtimestamp(capture_time).strftime('%H:%M:%S'), text)
+                self._observe_lag(windows[-1])
 
             except queue.Empty:
                 continue
             except Exception as e:
                 print(f"识别错误: {e}")
 
+    def _take_batch(self, item):
+        """
+        识别跟不上时（队列中积压的窗口达到 backlog_threshold），把积压的窗口一并取出合并识别
+        :param item: 已取出的 (采集时间, 音频字节)
+        :return: [(采集时间, 音频字节), ...]
+        """
+        batch = [item]
+        if not self.backlog_threshold or self.audio_queue.qsize() < self.backlog_threshold:
+            return batch
+        limit = self.max_batch_seconds * self.RATE * self.CHANNELS * 4  # float32 字节数
+        size = len(item[1])
+        while size < limit:
+            try:
+                item = self.audio_queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    def _transcribe_segments(self, audio_array):
+        """识别一段音频，返回分段列表（segments 是惰性生成器，遍历完才算识别结束）"""
+        # 设置识别参数（针对中文优化）
+        segments, info = self.model.transcribe(
+            audio_array,
+            language="zh",
+            initial_prompt=prompt_tokens(self.model, self.initial_prompt),  # 提示词只编码一次
+            beam_size=5,  # 使用束搜索提高准确度
+            best_of=5,  # 采样5个候选
+            temperature=0.0 if self.enable_hallucination_filter else 0.2,
+            vad_filter=True,  # 启用VAD过滤静音
+            vad_parameters=dict(
+                threshold=0.5,
+                min_silence_duration_ms=500,
+                speech_pad_ms=400
+            ),
+            word_timestamps=False,  # 不需要词级时间戳
+            condition_on_previous_text=False if self.enable_hallucination_filter else True
+        )
+        return list(segments)
+
+    def _split_segments(self, segments, audios):
+        """按分段的中点时间把文本拆回拼接前的各窗口（VAD 过滤后的时间戳仍对应原始音频）"""
+        bounds = np.cumsum([len(audio) for audio in audios]) / self.RATE
+        texts = [""] * len(audios)
+        for segment in segments:
+            middle = (segment.start + segment.end) / 2
+            index = min(int(np.searchsorted(bounds, middle, side="right")), len(audios) - 1)
+            texts[index] += segment.text
+        return [text.strip() for text in texts]
+
+    def _emit_text(self, timestamp, text):
+        """幻觉过滤后写入输出文件并推送给界面"""
+        # 检测是否为幻觉文本（仅在启用过滤时）
+        if text and (not self.enable_hallucination_filter or not self.is_hallucination(text)):
+            output_line = f"[{timestamp}] {text}"
+            print(f"识别结果: {text}")
+
+            # 更新最近识别的文本列表
+            self.recent_texts.append(text)
+            if len(self.recent_texts) > self.max_recent_texts:
+                self.recent_texts.pop(0)
+
+            # 保存带时间戳版本
+            with open(self.output_file, 'a', encoding='utf-8') as f:
+                f.write(output_line + "\n")
+
+            # 保存到干净版本（不换行，连续文本）
+            self.all_texts.append(text)
+
+            # 推送给UI（回调优先，否则加入文本队列供轮询）
+            if self.text_callback:
+                self.text_callback(output_line)
+            else:
+                self.text_queue.put(output_line)
+        elif text and self.enable_hallucination_filter:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 检测到幻觉内容，已过滤: {text[:30]}...")
+
+    def _observe_window(self, window_seconds, elapsed):
+        """记录一个窗口的识别耗时，按实测速度调整之后的窗口长度，并上报状态"""
+        controller = self.window_controller
+        if controller is not None and controller.observe(window_seconds, elapsed):
+            self.RECORD_SECONDS = controller.window
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 调整识别窗口: {controller.describe()}")
+        self._report_status()
+
+    def _observe_lag(self, window):
+        """
+        记录字幕延迟（最新窗口采集结束到现在），必要时自动切换模型
+        :param window: 最新识别的 (采集时间, 单声道音频)
+        """
+        if self.governor is None:
+            return
+        capture_time, audio_array = window
+        lag = time.time() - capture_time - len(audio_array) / self.RATE
+        previous = self.governor.current
+        if not self.governor.observe(lag):
+            return
+        self.model = self.governor.model
+        # 新模型的识别速度不同，窗口长度重新适应
+        if self.window_controller is not None:
+            self.window_controller.reset()
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] [模型切换] {previous} -> {self.governor.current}（延迟 {lag:.0f} 秒）"
+        print(line)
+        with open(self.output_file, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+        self._report_status()
+
+    def _report_status(self):
+        """把当前模型、窗口长度和实时率交给 status_callback（状态栏）"""
+        if not self.status_callback:
+            return
+        parts = []
+        if self.governor is not None:
+            parts.append(self.governor.describe())
+        if self.window_controller is not None:
+            parts.append(self.window_controller.describe())
+        if parts:
+            self.status_callback(" · ".join(parts))
+
     def stop_recording(self):
         """停止录音"""
         if not self.is_recording:
@@ -356,7 +527,10 @@ class FasterRealtimeRecognizer:
     def cleanup(self):
         """清理资源"""
         self.stop_recording()
-        self.p.terminate()
+        if self.p:
+            self.p.terminate()
+        if self.governor is not None:
+            self.governor.close()
 
     def get_latest_text(self):
         """获取最新的识别文本（供UI调用）"""
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+无界面转写服务 - 常驻进程保持模型预热，其他工具通过 HTTP 提交任务
+
+    python3 service.py --model base --backend faster --port 8765
+
+接口：
+    POST /jobs                 JSON {"bv": "BV..."} 或 {"path": "/服务器上的/文件.mp4"}，可选 model / backend / prompt
+    POST /jobs/upload          multipart 上传文件（字段 file），可选表单字段 model / backend / prompt
+    GET  /jobs                 任务列表
+    GET  /jobs/{id}            任务状态、进度和结果
+    GET  /jobs/{id}/events     SSE 事件流：status / progress / segment / done（连接时先重放已有事件）
+    GET  /metrics              Prometheus 指标（各阶段累计 + 队列长度、吞吐）
+    GET  /healthz              存活检查
+
+模型经由 model_cache 共享加载，所有任务的识别串行执行（whisper 模型非线程安全），
+下载和音频提取可与其他任务的识别并行
+"""
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+import metrics
+import model_cache
+import progress
+from whisper_backend import BACKEND_OPENAI, backend_from_label
+
+UPLOAD_DIR = "uploads"
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_DOWNLOADING = "downloading"
+STATUS_EXTRACTING = "extracting"
+STATUS_TRANSCRIBING = "transcribing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+KIND_BV = "bv"
+KIND_FILE = "file"
+
+
+class ServiceJob:
+    """一个转写任务及其事件记录（SSE 连接时重放）"""
+
+    def __init__(self, kind, source, model, backend, prompt=""):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.source = source
+        self.model = model
+        self.backend = backend
+        self.prompt = prompt
+        self.status = STATUS_QUEUED
+        self.done_seconds = 0.0
+        self.total_seconds = None
+        self.text = ""
+        self.output_file = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self.cond = threading.Condition()
+
+    def emit(self, event, **data):
+        with self.cond:
+            self.events.append((event, data))
+            self.cond.notify_all()
+
+    def set_status(self, status):
+        self.status = status
+        self.emit("status", status=status)
+
+    def finish(self, status, **data):
+        """结束任务：状态和 done 事件一起写入，SSE 读到结束状态时不会漏掉 done"""
+        with self.cond:
+            self.finished = time.time()
+            self.status = status
+            self.events.append(("status", {"status": status}))
+            self.events.append(("done", dict(status=status, **data)))
+            self.cond.notify_all()
+
+    def wait_events(self, start, timeout):
+        """
+        等待 start 之后的新事件
+        :return: (新事件列表, 任务是否已结束)
+        """
+        with self.cond:
+            if len(self.events) <= start and self.status not in FINAL_STATUSES:
+                self.cond.wait(timeout)
+            return self.events[start:], self.status in FINAL_STATUSES
+
+    def to_dict(self, with_text=False):
+        data = {
+            "id": self.id,
+            "kind": self.kind,
+            "source": self.source,
+            "model": self.model,
+            "backend": self.backend,
+            "status": self.status,
+            "done_seconds": round(self.done_seconds, 1),
+            "total_seconds": self.total_seconds,
+            "output_file": self.output_file,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if with_text:
+            data["text"] = self.text
+        return data
+
+
+class TranscriptionService:
+    def __init__(self, model="base", backend=BACKEND_OPENAI, workers=2, max_jobs=1000):
+        """
+        :param model: 默认模型（启动时预热）
+        :param backend: 默认后端 (openai / faster)
+        :param workers: 任务工作线程数（识别仍串行，其余阶段可并行）
+        :param max_jobs: 内存中保留的任务数，超过时移除最早结束的任务
+        """
+        self.model = model
+        self.backend = backend_from_label(backend)
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._infer_lock = threading.Lock()
+        self._running = 0
+        self._audio_seconds = 0.0
+        self._started = time.time()
+
+    def start(self):
+        """预热默认模型并启动工作线程"""
+        model_cache.prewarm(self.model, self.backend, callback=self._on_prewarmed)
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"service-worker-{i}", daemon=True).start()
+
+    @staticmethod
+    def _on_prewarmed(model, backend, error):
+        if error is None:
+            print(f"[service] 模型已预热: {model} ({backend})")
+        else:
+            print(f"[service] 模型预热失败: {error}")
+
+    def submit(self, kind, source, model=None, backend=None, prompt=""):
+        """
+        提交任务
+        :param kind: bv / file
+        :param source: BV 号或服务器上的文件路径
+        :return: ServiceJob
+        """
+        job = ServiceJob(kind, source, model or self.model,
+                         backend_from_label(backend) if backend else self.backend, prompt)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._trim_jobs()
+        job.emit("status", status=job.status)
+        self._queue.put(job)
+        return job
+
+    def _trim_jobs(self):
+        finished = [j for j in self.jobs.values() if j.status in FINAL_STATUSES]
+        for job in sorted(finished, key=lambda j: j.finished)[:max(len(self.jobs) - self.max_jobs, 0)]:
+            del self.jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    # ---- 执行 ----
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _run(self, job):
+        job.started = time.time()
+        metrics.start_job(f"service_{job.id}", source=job.source, model=job.model, backend=job.backend)
+        try:
+            if job.kind == KIND_BV:
+                self._run_bv(job)
+            else:
+                self._run_file(job)
+        except Exception as e:
+            job.error = str(e)
+            metrics.finish_job(status="failed")
+            job.finish(STATUS_FAILED, error=job.error)
+            print(f"[service] 任务 {job.id} 失败: {e}")
+            return
+
+        metrics.finish_job()
+        with self._lock:
+            self._audio_seconds += job.total_seconds or job.done_seconds
+        job.finish(STATUS_DONE, output_file=job.output_file)
+
+    @staticmethod
+    def _progress_callback(job, min_interval=1.0):
+        """识别进度回调；事件会保留用于重放，推送频率限制为每秒一次"""
+        last = [0.0]
+
+        def callback(done, total):
+            job.done_seconds = done
+            if total:
+                job.total_seconds = round(total, 1)
+            now = time.monotonic()
+            if now - last[0] >= min_interval or (total and done >= total):
+                last[0] = now
+                job.emit("progress", done_seconds=round(done, 1), total_seconds=job.total_seconds)
+        return callback
+
+    def _run_bv(self, job):
+        from utils import download_bilibili
+        from exAudio import process_audio_split
+        from language_detect import resolve_language
+        from local_file_recognition import probe_duration
+        from mel_features import recording_features
+        from speech2text import transcribe_slice
+
+        job.set_status(STATUS_DOWNLOADING)
+        bv = os.path.basename(os.path.normpath(download_bilibili(job.source)))
+
+        job.set_status(STATUS_EXTRACTING)
+        # 按任务 ID 命名目录：时间戳只精确到秒，并发任务可能同一秒开始
+        folder = process_audio_split(bv, folder_name=f"{time.strftime('%Y%m%d%H%M%S')}_{job.id}")
+        slice_dir = f"audio/slice/{folder}"
+        slices = sorted(os.listdir(slice_dir), key=lambda x: int(os.path.splitext(x)[0]))
+        paths = [os.path.join(slice_dir, fn) for fn in slices]
+        durations = [probe_duration(p) or 0.0 for p in paths]
+
+        job.set_status(STATUS_TRANSCRIBING)
+        os.makedirs("outputs", exist_ok=True)
+        job.output_file = f"outputs/{folder}.txt"
+        texts = []
+        offset = 0.0
+        # 整个任务的识别都在锁内（与 _run_file 相同），模型也在锁内获取：
+        # MAX_MODELS=1 时使用其他模型的任务不会在识别中途把它换出缓存，也不会逐片交替重新加载
+        with self._infer_lock, \
+                progress.report_progress(self._progress_callback(job), total_seconds=sum(durations) or None) as reporter:
+            model = model_cache.get(job.model, job.backend)
+            # 与 run_analysis 相同：整个任务只检测一次语种，整段录音的 mel 只计算一次
+            language = resolve_language(model, paths)
+            features = recording_features(folder, model)
+            for path, duration in zip(paths, durations):
+                text, result = transcribe_slice(model, path, job.prompt, language, features, verbose=False)
+                for seg in result.get("segments", []):
+                    job.emit("segment", start=round(seg["start"] + offset, 2),
+                             end=round(seg["end"] + offset, 2), text=seg["text"])
+                texts.append(text)
+                with open(job.output_file, "a", encoding="utf-8") as f:
+                    f.write(text)
+                    f.write("\n")
+                offset += result.get("duration", duration)
+                reporter.advance(duration)
+        job.text = "\n".join(texts)
+
+    def _run_file(self, job):
+        from local_file_recognition import LocalFileRecognizer
+
+        def on_segment(seg):
+            job.emit("segment", start=round(seg["start"], 2), end=round(seg["end"], 2), text=seg["text"])
+
+        # 流式窗口识别：每个窗口完成即可推送分段
+        recognizer = LocalFileRecognizer(
+            model_name=job.model,
+            initial_prompt=job.prompt,
+            backend=job.backend,
+            streaming=True,
+            stream_window=120,
+            audio_progress_callback=self._progress_callback(job),
+            segment_callback=on_segment,
+        )
+        job.set_status(STATUS_TRANSCRIBING)
+        with self._infer_lock:
+            job.text = recognizer.process_file(job.source)
+        job.output_file = recognizer.last_output_file
+
+    # ---- 指标 ----
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for job in self.jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+            uptime = time.time() - self._started
+            return {
+                "queue_depth": self._queue.qsize(),
+                "running": self._running,
+                "jobs": by_status,
+                "audio_seconds": round(self._audio_seconds, 1),
+                "uptime": round(uptime, 1),
+                "throughput": round(self._audio_seconds / uptime, 3) if uptime > 0 else 0.0,
+            }
+
+    def prometheus_text(self):
+        stats = self.stats()
+        lines = [
+            "# HELP b2t_service_queue_depth Jobs waiting for a worker.",
+            "# TYPE b2t_service_queue_depth gauge",
+            f"b2t_service_queue_depth {stats['queue_depth']}",
+            "# HELP b2t_service_jobs_running Jobs currently being processed.",
+            "# TYPE b2t_service_jobs_running gauge",
+            f"b2t_service_jobs_running {stats['running']}",
+            "# HELP b2t_service_jobs Jobs kept in memory by status.",
+            "# TYPE b2t_service_jobs gauge",
+        ]
+        for status, count in sorted(stats["jobs"].items()):
+            lines.append(f'b2t_service_jobs{{status="{status}"}} {count}')
+        lines += [
+            "# HELP b2t_service_audio_seconds_total Seconds of audio transcribed by finished jobs.",
+            "# TYPE b2t_service_audio_seconds_total counter",
+            f"b2t_service_audio_seconds_total {stats['audio_seconds']}",
+        ]
+        return metrics.prometheus_text() + "\n".join(lines) + "\n"
+
+
+def create_app(service):
+    """创建 FastAPI 应用"""
+    from typing import Optional
+
+    from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from pydantic import BaseModel
+
+    app = FastAPI(title="Bili2text")
+
+    class JobRequest(BaseModel):
+        bv: Optional[str] = None
+        path: Optional[str] = None
+        model: Optional[str] = None
+        backend: Optional[str] = None
+        prompt: str = ""
+
+    def _get_job(job_id):
+        job = service.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        return job
+
+    @app.post("/jobs")
+    def create_job(request: JobRequest):
+        if bool(request.bv) == bool(request.path):
+            raise HTTPException(status_code=400, detail="bv 和 path 需且仅需提供一个")
+        if request.path:
+            if not os.path.isfile(request.path):
+                raise HTTPException(status_code=400, detail=f"文件不存在: {request.path}")
+            job = service.submit(KIND_FILE, request.path, request.model, request.backend, request.prompt)
+        else:
+            job = service.submit(KIND_BV, request.bv, request.model, request.backend, request.prompt)
+        return job.to_dict()
+
+    @app.post("/jobs/upload")
+    def upload_job(file: UploadFile = File(...), model: Optional[str] = Form(None),
+                   backend: Optional[str] = Form(None), prompt: str = Form("")):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        name = os.path.basename(file.filename or "upload")
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex[:8]}_{name}")
+        # 分块写入磁盘，不把整个文件读入内存
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f, 1 << 20)
+        return service.submit(KIND_FILE, path, model, backend, prompt).to_dict()
+
+    @app.get("/jobs")
+    def list_jobs():
+        return service.list()
+
+    @app.get("/jobs/{job_id}")
+    def get_job(job_id: str):
+        return _get_job(job_id).to_dict(with_text=True)
+
+    @app.get("/jobs/{job_id}/events")
+    def job_events(job_id: str):
+        job = _get_job(job_id)
+
+        def stream():
+            sent = 0
+            while True:
+                events, finished = job.wait_events(sent, timeout=15)
+                if not events:
+                    if finished:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                for event, data in events:
+                    yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+                sent += len(events)
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def prometheus():
+        return PlainTextResponse(service.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/stats")
+    def stats():
+        return service.stats()
+
+    @app.get("/healthz")
+    def healthz():
+        return {"ok": True, "model_loaded": model_cache.is_loaded(service.model, service.backend)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bili2text 转写服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", default="base", help="默认模型（启动时预热）")
+    parser.add_argument("--backend", default=BACKEND_OPENAI, help="默认后端 openai / faster")
+    parser.add_argument("--workers", type=int, default=2, help="任务工作线程数")
+    parser.add_argument("--max-models", type=int, default=model_cache.MAX_MODELS,
+                        help="同时常驻内存的模型数")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    model_cache.MAX_MODELS = args.max_models
+    service = TranscriptionService(args.model, args.backend, args.workers)
+    service.start()
+    uvicorn.run(create_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
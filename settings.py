@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+用户设置 - 记住 GUI 上次使用的模型、后端等选项（settings.json，不纳入版本控制）
+"""
+
+import json
+import os
+
+SETTINGS_FILE = "settings.json"
+
+
+def load_settings():
+    """读取设置，文件不存在或损坏时返回空字典"""
+    try:
+        with open(SETTINGS_FILE, encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_settings(**updates):
+    """合并写入设置（原子替换）"""
+    data = load_settings()
+    data.update(updates)
+    tmp_path = f"{SETTINGS_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, SETTINGS_FILE)
+    except OSError as e:
+        print(f"保存设置失败: {e}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+分片调度 - 本地识别忙不过来时把部分分片交给讯飞云端，最后按分片顺序合并
+
+本地工作线程从队首按顺序取分片，并实时统计实时率（识别耗时 / 音频时长）；
+云端线程只在"本地剩余积压预计耗时"超过 max_local_wait 时从队尾取分片，
+云端累计音频时长受 budget_seconds 限制。云端失败的分片退回本地队列
+
+用法：
+    scheduler = SliceScheduler(local_fn, remote_fn, RoutingPolicy(max_local_wait=120, budget_seconds=1800))
+    texts = scheduler.run(slice_paths, on_text=lambda index, text, route: ...)
+
+local_fn / remote_fn 均为 fn(path) -> text，可替换为本地模拟实现进行测试
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+
+ROUTE_LOCAL = "local"
+ROUTE_REMOTE = "remote"
+
+# exAudio.split_mp3 默认分片长度（秒），无法探测时长时使用
+DEFAULT_SLICE_SECONDS = 45.0
+
+
+class RoutingPolicy:
+    def __init__(self, max_local_wait=120.0, budget_seconds=0.0, remote_workers=4,
+                 initial_rtf=1.0, rtf_smoothing=0.3, max_remote_failures=3):
+        """
+        :param max_local_wait: 本地积压预计耗时超过该值（秒）时才分流到云端
+        :param budget_seconds: 云端累计可处理的音频时长（秒），0 表示不使用云端
+        :param remote_workers: 同时在云端处理的分片数
+        :param initial_rtf: 本地尚未完成任何分片时假定的实时率
+        :param rtf_smoothing: 实时率指数平滑系数（越大越看重最近的分片）
+        :param max_remote_failures: 云端连续失败达到该次数后停止分流
+        """
+        self.max_local_wait = max_local_wait
+        self.budget_seconds = budget_seconds
+        self.remote_workers = remote_workers
+        self.initial_rtf = initial_rtf
+        self.rtf_smoothing = rtf_smoothing
+        self.max_remote_failures = max_remote_failures
+
+    @property
+    def enabled(self):
+        return self.budget_seconds > 0 and self.remote_workers > 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        从环境变量读取策略：
+        B2T_REMOTE_BUDGET（云端音频秒数预算，默认 0 即关闭）、B2T_REMOTE_MAX_WAIT、B2T_REMOTE_WORKERS
+        """
+        return cls(max_local_wait=float(os.environ.get("B2T_REMOTE_MAX_WAIT", 120)),
+                   budget_seconds=float(os.environ.get("B2T_REMOTE_BUDGET", 0)),
+                   remote_workers=int(os.environ.get("B2T_REMOTE_WORKERS", 4)))
+
+
+class SliceScheduler:
+    def __init__(self, local_fn, remote_fn=None, policy=None, local_workers=1, duration_fn=None):
+        """
+        :param local_fn: 本地识别 fn(path) -> text（whisper 模型非线程安全，local_workers 默认 1）
+        :param remote_fn: 云端识别 fn(path) -> text，None 时只用本地
+        :param policy: RoutingPolicy
+        :param local_workers: 本地工作线程数
+        :param duration_fn: 获取分片时长 fn(path) -> 秒数或 None，默认使用 ffprobe
+        """
+        self.local_fn = local_fn
+        self.remote_fn = remote_fn
+        self.policy = policy or RoutingPolicy()
+        self.local_workers = max(local_workers, 1)
+        self.duration_fn = duration_fn
+
+        self._cond = threading.Condition()
+        self._pending = deque()  # (index, path, seconds)
+        self._pending_seconds = 0.0
+        self._local_busy_seconds = 0.0  # 本地正在处理的分片时长
+        self._rtf = self.policy.initial_rtf
+        self._remote_used = 0.0
+        self._remote_inflight = 0
+        self._remote_failures = 0
+        self._results = {}
+        self._routes = {}
+        self._next_emit = 0
+        self._on_text = None
+
+    # ---- 统计 ----
+
+    @property
+    def rtf(self):
+        """本地实时率（平滑后）"""
+        return self._rtf
+
+    def projected_local_wait(self):
+        """本地完成当前积压（含正在处理的分片）预计还需多少秒"""
+        return (self._pending_seconds + self._local_busy_seconds) * self._rtf / self.local_workers
+
+    def stats(self):
+        routes = list(self._routes.values())
+        return {
+            "local": routes.count(ROUTE_LOCAL),
+            "remote": routes.count(ROUTE_REMOTE),
+            "remote_seconds": round(self._remote_used, 1),
+            "local_rtf": round(self._rtf, 3),
+        }
+
+    # ---- 调度 ----
+
+    def run(self, slice_paths, on_text=None):
+        """
+        识别全部分片，阻塞直到完成
+        :param slice_paths: 分片路径列表（顺序即输出顺序）
+        :param on_text: fn(index, text, route)，按分片顺序依次调用（前面的分片完成后才会回调后面的）
+        :return: 文本列表，与 slice_paths 一一对应；失败的分片为空字符串
+        """
+        self._on_text = on_text
+        if self.duration_fn is None:
+            from local_file_recognition import probe_duration
+            self.duration_fn = probe_duration
+        for i, path in enumerate(slice_paths):
+            seconds = self.duration_fn(path) or DEFAULT_SLICE_SECONDS
+            self._pending.append((i, path, seconds))
+            self._pending_seconds += seconds
+
+        use_remote = self.remote_fn is not None and self.policy.enabled
+        # 任务是线程局部的：工作线程内的 transcribe 等阶段要记录到调用方的任务
+        job = metrics.current_job()
+        with metrics.span("schedule", slices=len(slice_paths)) as s:
+            threads = [threading.Thread(target=self._run_bound, args=(job, self._local_worker), daemon=True)
+                       for _ in range(self.local_workers)]
+            if use_remote:
+                threads += [threading.Thread(target=self._run_bound, args=(job, self._remote_worker), daemon=True)
+                            for _ in range(self.policy.remote_workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            for key, value in self.stats().items():
+                s.set(key, value)
+
+        print(f"分片调度完成: {self.stats()}")
+        return [self._results.get(i, "") for i in range(len(slice_paths))]
+
+    @staticmethod
+    def _run_bound(job, worker):
+        with metrics.bind_job(job):
+            worker()
+
+    def _local_worker(self):
+        while True:
+            with self._cond:
+                # 云端处理中的分片失败后会退回队列，等它们结束再退出
+                while not self._pending and self._remote_inflight:
+                    self._cond.wait()
+                if not self._pending:
+                    self._cond.notify_all()
+                    return
+                index, path, seconds = self._pending.popleft()
+                self._pending_seconds -= seconds
+                self._local_busy_seconds += seconds
+                self._cond.notify_all()
+
+            start = time.perf_counter()
+            try:
+                text = self.local_fn(path)
+            except Exception as e:
+                print(f"分片 {path} 本地识别失败: {e}")
+                text = ""
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                self._local_busy_seconds -= seconds
+                if seconds > 0:
+                    alpha = self.policy.rtf_smoothing
+                    self._rtf = (1 - alpha) * self._rtf + alpha * (elapsed / seconds)
+                self._finish(index, text, ROUTE_LOCAL)
+
+    def _should_spill(self, seconds):
+        return (self._remote_failures < self.policy.max_remote_failures
+                and self._remote_used + seconds <= self.policy.budget_seconds
+                and self.projected_local_wait() > self.policy.max_local_wait)
+
+    def _remote_worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        return
+                    _, _, seconds = self._pending[-1]
+                    if self._should_spill(seconds):
+                        break
+                    if (self._remote_failures >= self.policy.max_remote_failures
+                            or self._remote_used + seconds > self.policy.budget_seconds):
+                        return
+                    # 本地积压变化（取走分片/更新实时率）时会被唤醒
+                    self._cond.wait(timeout=1.0)
+                index, path, seconds = self._pending.pop()
+                self._pending_seconds -= seconds
+                self._remote_used += seconds
+                self._remote_inflight += 1
+
+            try:
+                text = self.remote_fn(path)
+            except Exception as e:
+                print(f"分片 {path} 云端识别失败，退回本地: {e}")
+                with self._cond:
+                    self._remote_inflight -= 1
+                    self._remote_used -= seconds
+                    self._remote_failures += 1
+                    self._pending.append((index, path, seconds))
+                    self._pending_seconds += seconds
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                self._remote_inflight -= 1
+                self._remote_failures = 0
+                self._finish(index, text, ROUTE_REMOTE)
+
+    def _finish(self, index, text, route):
+        """记录结果并按顺序回调（持有 _cond 时调用）"""
+        self._results[index] = text
+        self._routes[index] = route
+        self._cond.notify_all()
+        if self._on_text is None:
+            return
+        while self._next_emit in self._results:
+            i = self._next_emit
+            self._next_emit += 1
+            try:
+                self._on_text(i, self._results[i], self._routes[i])
+            except Exception as e:
+                print(f"分片结果回调出错: {e}")
@@ -1,17 +1,50 @@
-import whisper
 import os
+import json
+import metrics
+import model_cache
+from whisper_backend import BACKEND_OPENAI
+from slice_scheduler import SliceScheduler, RoutingPolicy, ROUTE_REMOTE
+from language_detect import resolve_language
+from mel_features import recording_features, slice_window
+import two_pass
+from two_pass import TwoPassPolicy
 
 whisper_model = None
+# 两遍识别（B2T_TWO_PASS），第一遍使用的模型
+two_pass_policy = None
+fast_model = None
+# 两遍识别期间固定在模型缓存中的 (模型名, 后端)，下次 load_whisper 时解除
+_pinned = []
 
 def is_cuda_available():
-    return whisper.torch.cuda.is_available()
+    import torch
+    return torch.cuda.is_available()
 
-def load_whisper(model="tiny"):
-    global whisper_model
-    whisper_model = whisper.load_model(model, device="cuda" if is_cuda_available() else "cpu")
-    print("Whisper模型："+model)
+def load_whisper(model="tiny", backend=BACKEND_OPENAI):
+    global whisper_model, two_pass_policy, fast_model
+    # 上一次加载的两遍识别模型不再使用，缓存回到 MAX_MODELS 以内
+    while _pinned:
+        model_cache.unpin(*_pinned.pop())
+    fast_model = None
+    two_pass_policy = TwoPassPolicy.from_env()
+    if two_pass_policy is not None:
+        # 两个模型在下次加载前都要用到，先固定再加载，第一遍模型不会把准确模型换出缓存
+        for name in [model, *two_pass_policy.pinned_models()]:
+            model_cache.pin(name, backend)
+            _pinned.append((name, backend))
+    # backend: openai (openai-whisper) 或 faster (faster-whisper int8)
+    # 经由共享缓存加载：GUI 已预热的模型直接复用（加载时记录 model_load 阶段）
+    whisper_model = model_cache.get(model, backend)
+    print(f"Whisper模型：{model} (后端: {whisper_model.name})")
+    if two_pass_policy is not None:
+        fast_model = two_pass_policy.load_fast_model(whisper_model, backend)
+        print(f"两遍识别：第一遍 {two_pass_policy.fast_model or '贪心解码'}，低置信度分段用 {model} 重新识别")
 
-def run_analysis(filename, model="tiny", prompt=""):
+def run_analysis(filename, model="tiny", prompt="", language=None, text_callback=None):
+    """
+    识别 audio/slice/{filename} 下的全部分片，按分片顺序逐个追加写入 outputs/{filename}.txt
+    :param text_callback: fn(text)，每个分片的文本写入文件后回调（GUI 边识别边显示）
+    """
     global whisper_model
     print("正在加载Whisper模型...")
     # 读取列表中的音频文件
@@ -28,15 +61,98 @@ def run_analysis(filename, model="tiny", prompt=""):
 
     audio_list.sort(key=lambda x: int(x.split(".")[0])) # 将 audio_list 按照切片序号排序
 
+    # 整个任务只检测一次语种（language 可明确指定），各分片不再单独检测
+    language = resolve_language(whisper_model, [f"audio/slice/{filename}/{fn}" for fn in audio_files],
+                                override=language)
+
+    # 整段录音的 mel 只计算一次（有磁盘缓存），各分片直接取对应时间段；两遍识别自行解码音频
+    features = recording_features(filename, whisper_model) if two_pass_policy is None else None
+
+    policy = RoutingPolicy.from_env()
+    if policy.enabled:
+        # 本地积压过多时把队尾分片交给讯飞云端，结果仍按分片顺序写入
+        run_hybrid_analysis(filename, audio_files, prompt, policy, language=language, features=features,
+                            text_callback=text_callback)
+        return
+
     i = 1
     for fn in audio_files:
         print(f"正在转换第{i}/{len(audio_files)}个音频... {fn}")
-        # 识别音频
-        result = whisper_model.transcribe(f"audio/slice/{filename}/{fn}", initial_prompt=prompt)
-        print("".join([i["text"] for i in result["segments"] if i is not None]))
+        text = _transcribe_slice(f"audio/slice/{filename}/{fn}", prompt, language, features)
+        print(text)
 
         with open(f"outputs/{filename}.txt", "a", encoding="utf-8") as f:
-            f.write("".join([i["text"] for i in result["segments"] if i is not None]))
+            f.write(text)
             f.write("\n")
+        if text_callback:
+            text_callback(text)
         i += 1
-    
\ No newline at end of file
+
+def _transcribe_slice(slice_path, prompt="", language=None, features=None):
+    # 束搜索参数只用于两遍识别的第二遍（低置信度分段）
+    options = two_pass.ACCURATE_OPTIONS if two_pass_policy is not None else {}
+    text, _ = transcribe_slice(whisper_model, slice_path, prompt, language, features,
+                               policy=two_pass_policy, fast_model=fast_model, **options)
+    return text
+
+def transcribe_slice(model, slice_path, prompt="", language=None, features=None, policy=None, fast_model=None,
+                     **options):
+    """
+    识别一个分片（run_analysis、job_queue 工作进程和 service 共用），记录 transcribe 阶段
+    :param model: 识别后端
+    :param slice_path: 分片路径（audio/slice/{folder}/{序号}.mp3）
+    :param prompt: 初始提示词
+    :param language: 整个任务统一的语种（resolve_language 的结果），None 时由 Whisper 自行检测
+    :param features: 整段录音的预计算 mel（recording_features 的结果），None 时分片自行计算
+    :param policy: 两遍识别策略，None 表示单遍识别
+    :param fast_model: 两遍识别第一遍使用的模型
+    :param options: 其他 transcribe 参数（beam_size / vad_filter / verbose 等）
+    :return: (文本, transcribe 结果)
+    """
+    with metrics.span("transcribe", slice=os.path.basename(slice_path),
+                      bytes_in=metrics.file_size(slice_path)) as s:
+        # 识别音频
+        if policy is not None:
+            result = two_pass.transcribe(slice_path, model, policy, fast_model,
+                                         initial_prompt=prompt, language=language, **options)
+        else:
+            result = model.transcribe(slice_path, mel=slice_window(features, slice_path),
+                                      initial_prompt=prompt, language=language, **options)
+        text = "".join([i["text"] for i in result["segments"] if i is not None])
+        s.set("audio_seconds", result.get("duration", 0))
+        s.set("bytes_out", len(text.encode("utf-8")))
+    return text, result
+
+def run_hybrid_analysis(filename, audio_files, prompt="", policy=None, remote_fn=None, language=None,
+                        features=None, text_callback=None):
+    """
+    本地 + 讯飞云端混合识别
+    :param filename: 分片目录名（audio/slice/{filename}）
+    :param audio_files: 已排序的分片文件名
+    :param policy: RoutingPolicy，默认从环境变量读取
+    :param remote_fn: 云端识别 fn(path) -> text，默认使用讯飞客户端
+    :param language: 本地识别固定使用的语种，None 时由 Whisper 逐片检测
+    :param features: 整段录音的预计算 mel（mel_features.MelFeatures），None 时各分片自行计算
+    :param text_callback: fn(text)，按分片顺序每写入一个分片回调一次
+    """
+    if remote_fn is None:
+        import xunfei
+        client = xunfei.get_client()
+
+        def remote_fn(path):
+            result = client.transcribe(path)
+            return xunfei.extract_and_format_transcription_from_string(json.dumps(result))
+
+    total = len(audio_files)
+
+    def on_text(index, text, route):
+        print(f"第{index + 1}/{total}个音频完成（{'云端' if route == ROUTE_REMOTE else '本地'}）: {text}")
+        with open(f"outputs/{filename}.txt", "a", encoding="utf-8") as f:
+            f.write(text)
+            f.write("\n")
+        if text_callback:
+            text_callback(text)
+
+    scheduler = SliceScheduler(lambda path: _transcribe_slice(path, prompt, language, features), remote_fn,
+                               policy or RoutingPolicy.from_env())
+    scheduler.run([f"audio/slice/{filename}/{fn}" for fn in audio_files], on_text=on_text)
@@ -0,0 +1,23 @@
+import progress
+
+
+def test_backend_reports_are_relative_to_the_current_piece():
+    calls = []
+    with progress.report_progress(lambda done, total: calls.append((done, total)), min_interval=0) as reporter:
+        progress.report(10.0, total_seconds=30.0)
+        reporter.advance(30.0)
+        progress.report(5.0)
+    progress.report(99.0)  # 上报器已注销，不再回调
+
+    assert calls == [(10.0, 30.0), (30.0, 30.0), (35.0, 30.0)]
+
+
+def test_progress_never_goes_backwards():
+    calls = []
+    with progress.report_progress(lambda done, total: calls.append(done), total_seconds=60, min_interval=0) as reporter:
+        progress.report(30.0, force=True)
+        reporter.advance(28.0)  # 窗口末尾 2 秒留给下一个窗口重识
+        progress.report(1.0)
+        progress.report(4.0)
+
+    assert calls == [30.0, 30.0, 30.0, 32.0]
@@ -0,0 +1,40 @@
+import json
+
+import metrics
+import speech2text
+from slice_scheduler import RoutingPolicy
+
+
+class FakeModel:
+    """按分片返回固定结果的识别模型"""
+
+    def transcribe(self, audio, **options):
+        return {"text": "本地", "segments": [{"text": "本地"}], "duration": 45.0}
+
+
+def test_hybrid_job_report_contains_worker_spans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "outputs").mkdir()
+    monkeypatch.setattr(speech2text, "whisper_model", FakeModel())
+    monkeypatch.setattr(speech2text, "two_pass_policy", None)
+
+    def remote_fn(path):
+        with metrics.span("remote_transcribe", file=path):
+            return "云端"
+
+    # 预计等待始终超过 0 秒，队尾分片会分流到云端
+    policy = RoutingPolicy(max_local_wait=0, budget_seconds=1000, remote_workers=1)
+    files = [f"{i}.mp3" for i in range(1, 7)]
+    job = metrics.start_job("hybrid_test")
+    speech2text.run_hybrid_analysis("job", files, policy=policy, remote_fn=remote_fn)
+    report_file = metrics.finish_job(job)
+
+    with open(report_file, encoding="utf-8") as f:
+        report = json.load(f)
+    stages = report["stages"]
+    assert stages["schedule"]["count"] == 1
+    local = stages.get("transcribe", {}).get("count", 0)
+    remote = stages.get("remote_transcribe", {}).get("count", 0)
+    assert local >= 1
+    assert local + remote == len(files)
+    assert report["rtf"] is not None
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import local_file_recognition
+import speech2text
+import two_pass
+from two_pass import TwoPassPolicy
+
+
+class RecordingModel:
+    """记录每次 transcribe 的参数；第一遍给出低置信度分段"""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append(options)
+        first = len(self.calls) == 1
+        segment = {"start": 0.0, "end": len(audio) / two_pass.SAMPLE_RATE, "text": "文本",
+                   "avg_logprob": -2.0 if first else -0.1}
+        return {"text": segment["text"], "segments": [segment]}
+
+
+def test_second_pass_receives_beam_options(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(local_file_recognition, "load_audio",
+                        lambda path: np.zeros(5 * two_pass.SAMPLE_RATE, dtype=np.float32))
+    monkeypatch.setattr(speech2text, "whisper_model", model)
+    monkeypatch.setattr(speech2text, "two_pass_policy", TwoPassPolicy())
+    monkeypatch.setattr(speech2text, "fast_model", None)
+
+    speech2text._transcribe_slice("1.mp3", prompt="提示", language="zh")
+
+    fast, accurate = model.calls
+    assert "beam_size" not in fast and "best_of" not in fast
+    assert accurate["beam_size"] == 5 and accurate["best_of"] == 5
+
+
+def test_same_model_without_beam_options_is_rejected():
+    with pytest.raises(ValueError):
+        two_pass.transcribe(np.zeros(16000, dtype=np.float32), RecordingModel(), TwoPassPolicy(), language="zh")
+
+
+def test_fast_model_is_pinned_only_for_the_job(monkeypatch):
+    import model_cache
+
+    monkeypatch.setattr(model_cache, "load_backend", lambda name, backend: f"{name}-model")
+    monkeypatch.setattr(model_cache, "_models", model_cache.OrderedDict())
+    monkeypatch.setattr(model_cache, "MAX_MODELS", 1)
+    policy = TwoPassPolicy(fast_model="tiny")
+
+    with model_cache.pinned("large-v3", *policy.pinned_models()):
+        model = model_cache.get("large-v3")
+        assert policy.load_fast_model(model, "openai") == "tiny-model"
+        assert model_cache.is_loaded("large-v3") and model_cache.is_loaded("tiny")
+
+    assert model_cache.MAX_MODELS == 1
+    assert len(model_cache._models) == 1
@@ -0,0 +1,126 @@
+import importlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip("requests")
+
+import xunfei
+
+
+def _order_result(text):
+    best = {"st": {"rt": [{"ws": [{"cw": [[{"w": text}]]}]}]}}
+    return json.dumps({"lattice": [{"json_1best": json.dumps(best)}]})
+
+
+class StubServer:
+    """本地模拟的 raasr 接口：上传返回订单号，查询返回以文件名为内容的结果"""
+
+    def __init__(self, fail_uploads=None, fail_results=0):
+        """
+        :param fail_uploads: {文件名: 返回 500 的次数}
+        :param fail_results: 前几次 getResult 返回 503
+        """
+        self.fail_uploads = dict(fail_uploads or {})
+        self.fail_results = fail_results
+        self.uploads = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, payload = stub.handle(url.path, query, body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"http://127.0.0.1:{self.server.server_port}/v2/api"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, path, query, body):
+        with self.lock:
+            if path.endswith("/upload"):
+                name = query["fileName"]
+                if self.fail_uploads.get(name, 0) > 0:
+                    self.fail_uploads[name] -= 1
+                    return 500, {}
+                assert int(query["fileSize"]) == len(body)
+                self.uploads.append(name)
+                return 200, {"code": "000000", "content": {"orderId": name, "taskEstimateTime": 0}}
+            if self.fail_results > 0:
+                self.fail_results -= 1
+                return 503, {}
+            return 200, {"code": "000000", "content": {
+                "orderInfo": {"status": xunfei.STATUS_DONE},
+                "orderResult": _order_result(query["orderId"])}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def slices(tmp_path):
+    paths = []
+    for i in range(1, 4):
+        path = tmp_path / f"{i}.mp3"
+        path.write_bytes(b"audio" * i)
+        paths.append(str(path))
+    return paths
+
+
+def _client(host=None, **kwargs):
+    return xunfei.XunfeiClient("appid", "secret", host=host, rate_limit=None, poll_initial=0,
+                               retry_backoff=0.01, **kwargs)
+
+
+def test_transcribe_slices_against_stub_host_retries_transient_errors(slices):
+    server = StubServer(fail_uploads={"2.mp3": 2}, fail_results=1)
+    try:
+        with _client(server.host) as client:
+            texts = client.transcribe_slices(slices)
+    finally:
+        server.close()
+    assert texts == ["1.mp3", "2.mp3", "3.mp3"]
+    assert sorted(server.uploads) == ["1.mp3", "2.mp3", "3.mp3"]
+
+
+def test_failed_slice_raises_instead_of_being_dropped(slices):
+    server = StubServer(fail_uploads={"2.mp3": 10})
+    calls = []
+    try:
+        with _client(server.host, max_retries=1) as client:
+            with pytest.raises(xunfei.SliceFailures) as info:
+                client.transcribe_slices(slices, callback=lambda *args: calls.append(args))
+    finally:
+        server.close()
+    assert info.value.texts == ["1.mp3", None, "3.mp3"]
+    assert list(info.value.errors) == [1]
+    assert len(calls) == 3
+
+
+def test_host_from_environment(slices, monkeypatch):
+    server = StubServer()
+    monkeypatch.setenv("B2T_XUNFEI_HOST", server.host)
+    try:
+        importlib.reload(xunfei)
+        with _client() as client:
+            assert client.host == server.host
+            assert client.transcribe_slices(slices[:1]) == ["1.mp3"]
+    finally:
+        server.close()
+        monkeypatch.delenv("B2T_XUNFEI_HOST")
+        importlib.reload(xunfei)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+识别结果视图 - 多小时转写稿的分页显示
+Text 控件中最多保留 max_lines 行，磁盘上的结果文件始终是完整内容：
+- load_file(): 建立行偏移索引后只读取一页，滚动到顶部/底部时再加载相邻页，并裁掉另一端
+- append(): 识别过程中增量追加，超过上限时移除最早的行
+- add_provisional() / replace_provisional(): 双模型实时识别时先显示灰色预览行，定稿后原位替换
+"""
+
+import tkinter as tk
+from array import array
+from tkinter import ttk, scrolledtext
+
+PROVISIONAL_TAG = "provisional"
+_MARK_PREFIX = "prov_"
+
+
+class TranscriptView(ttk.Frame):
+    def __init__(self, master, height=10, width=70, page_lines=500, max_lines=2000):
+        """
+        :param master: 父控件
+        :param height: 文本框高度（行）
+        :param width: 文本框宽度（字符）
+        :param page_lines: 从文件每次加载的行数
+        :param max_lines: 文本框中最多保留的行数
+        """
+        super().__init__(master)
+        self.page_lines = page_lines
+        self.max_lines = max(max_lines, page_lines * 2)
+
+        self.text = scrolledtext.ScrolledText(self, height=height, width=width)
+        self.text.pack(fill='both', expand=True)
+        self.text.configure(yscrollcommand=self._on_yscroll)
+
+        self.text.tag_configure(PROVISIONAL_TAG, foreground='gray')
+
+        self.info_label = ttk.Label(self, text="", font=('Arial', 9), foreground='gray')
+        self.info_label.pack(anchor='e')
+
+        self._path = None
+        self._offsets = None  # 每行起始字节偏移，末尾多一个文件长度
+        self._top = 0  # 文本框第一行对应的文件行号
+        self._bottom = 0  # 文本框最后一行之后的文件行号
+        self._dropped = 0  # 追加模式下已移出视图的行数
+        self._paging = False
+
+    # ---- 公共接口 ----
+
+    def clear(self):
+        """清空视图（不影响磁盘文件）"""
+        self._drop_marks(tk.END)
+        self.text.delete(1.0, tk.END)
+        self._path = None
+        self._offsets = None
+        self._top = self._bottom = self._dropped = 0
+        self.info_label.config(text="")
+
+    def append(self, text, see_end=True, tags=()):
+        """追加文本（主线程）；超过 max_lines 时移除最早的行"""
+        if self._path is not None:
+            # 文件分页模式下追加：保留当前内容，切换回追加模式
+            self._dropped += self._top
+            self._path = None
+            self._offsets = None
+        at_bottom = self.text.yview()[1] >= 0.999
+        self.text.insert(tk.END, text, tags)
+
+        excess = self._line_count() - self.max_lines
+        if excess > 0:
+            self._drop_marks(f"{excess + 1}.0")
+            self.text.delete(1.0, f"{excess + 1}.0")
+            self._dropped += excess
+            self.info_label.config(text=f"较早的 {self._dropped} 行已移出视图，完整内容见输出文件")
+
+        # 用户向上翻看时不强制滚到底部
+        if see_end and at_bottom:
+            self.text.see(tk.END)
+
+    def add_provisional(self, key, line, see_end=True):
+        """
+        追加一行临时预览（灰色），稍后由 replace_provisional 原位替换
+        :param key: 预览标识（如窗口序号）
+        :param line: 预览文本，None 时只记录位置（定稿文本仍会出现在这里）
+        """
+        mark = f"{_MARK_PREFIX}{key}"
+        self.text.mark_set(mark, 'end-1c')
+        self.text.mark_gravity(mark, 'left')
+        if line:
+            self.append(line + "\n", see_end, (PROVISIONAL_TAG, mark))
+
+    def replace_provisional(self, keys, line, see_end=True):
+        """
+        用定稿文本替换一组预览行，插入到第一行预览的位置
+        :param keys: 预览标识列表
+        :param line: 定稿文本，None 时只删除预览
+        """
+        marks = [f"{_MARK_PREFIX}{key}" for key in keys]
+        existing = [m for m in marks if m in self.text.mark_names()]
+        if not existing:
+            # 预览已被清空或移出视图
+            return
+        position = self.text.index(existing[0])
+        for mark in marks:
+            ranges = self.text.tag_ranges(mark)
+            for start, end in reversed(list(zip(ranges[0::2], ranges[1::2]))):
+                self.text.delete(start, end)
+        if line:
+            self.text.insert(position, line + "\n")
+            # 同一位置上还没定稿的预览（无预览文本的窗口）应排在这段定稿文本之后
+            end = self.text.index(f"{position}+{len(line) + 1}c")
+            for mark in self.text.mark_names():
+                if (mark.startswith(_MARK_PREFIX) and mark not in existing
+                        and self.text.compare(mark, '==', position)):
+                    self.text.mark_set(mark, end)
+        for mark in existing:
+            self.text.mark_unset(mark)
+            self.text.tag_delete(mark)
+        if see_end and self.text.yview()[1] >= 0.999:
+            self.text.see(tk.END)
+
+    def _drop_marks(self, before):
+        """移除即将被删除区域内的预览位置"""
+        for mark in self.text.mark_names():
+            if mark.startswith(_MARK_PREFIX) and self.text.compare(mark, '<', before):
+                self.text.mark_unset(mark)
+                self.text.tag_delete(mark)
+
+    @property
+    def truncated(self):
+        """追加模式下是否已有行被移出视图"""
+        return self._dropped > 0
+
+    def load_file(self, path, at_end=False):
+        """
+        分页显示磁盘上的结果文件
+        :param path: 文件路径
+        :param at_end: True 时显示最后一页（例如实时识别结束后），否则显示第一页
+        """
+        self.clear()
+        self._path = path
+        self._offsets = self._index_lines(path)
+        total = self._total_lines()
+        if at_end:
+            self._top = self._bottom = max(total - self.page_lines, 0)
+        self._load_next()
+        self.text.see(tk.END if at_end else 1.0)
+
+    # ---- 分页 ----
+
+    @staticmethod
+    def _index_lines(path, block_size=1 << 20):
+        """扫描文件得到每行起始字节偏移（不保留文本内容）"""
+        offsets = array('q', [0])
+        position = 0
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                start = 0
+                while True:
+                    idx = block.find(b'\n', start)
+                    if idx < 0:
+                        break
+                    offsets.append(position + idx + 1)
+                    start = idx + 1
+                position += len(block)
+        if offsets[-1] != position:
+            offsets.append(position)  # 最后一行没有换行符
+        return offsets
+
+    def _total_lines(self):
+        return len(self._offsets) - 1 if self._offsets else 0
+
+    def _read_lines(self, first, last):
+        """读取文件中 [first, last) 行"""
+        with open(self._path, 'rb') as f:
+            f.seek(self._offsets[first])
+            data = f.read(self._offsets[last] - self._offsets[first])
+        return data.decode('utf-8', errors='replace')
+
+    def _line_count(self):
+        return int(self.text.index('end-1c').split('.')[0])
+
+    def _load_next(self):
+        total = self._total_lines()
+        if self._bottom >= total:
+            return
+        last = min(self._bottom + self.page_lines, total)
+        self.text.insert(tk.END, self._read_lines(self._bottom, last))
+        self._bottom = last
+
+        # 裁掉顶部多余的行，并保持当前可见位置不跳动
+        excess = (self._bottom - self._top) - self.max_lines
+        if excess > 0:
+            first_visible = int(self.text.index('@0,0').split('.')[0])
+            self.text.delete(1.0, f"{excess + 1}.0")
+            self._top += excess
+            self.text.yview(f"{max(first_visible - excess, 1)}.0")
+        self._update_info()
+
+    def _load_previous(self):
+        if self._top <= 0:
+            return
+        first = max(self._top - self.page_lines, 0)
+        inserted = self._top - first
+        first_visible = int(self.text.index('@0,0').split('.')[0])
+        self.text.insert(1.0, self._read_lines(first, self._top))
+        self._top = first
+        self.text.yview(f"{first_visible + inserted}.0")
+
+        # 裁掉底部多余的行
+        excess = (self._bottom - self._top) - self.max_lines
+        if excess > 0:
+            keep = self._bottom - self._top - excess
+            self.text.delete(f"{keep + 1}.0", tk.END)
+            self._bottom -= excess
+        self._update_info()
+
+    def _on_yscroll(self, first, last):
+        self.text.vbar.set(first, last)
+        if self._path is None or self._paging:
+            return
+        if float(first) <= 0.0 and self._top > 0:
+            self._schedule_page(self._load_previous)
+        elif float(last) >= 1.0 and self._bottom < self._total_lines():
+            self._schedule_page(self._load_next)
+
+    def _schedule_page(self, loader):
+        # 滚动回调中不直接改内容，避免递归触发
+        self._paging = True
+
+        def run():
+            try:
+                loader()
+            finally:
+                self._paging = False
+
+        self.after_idle(run)
+
+    def _update_info(self):
+        total = self._total_lines()
+        if total > self._bottom - self._top:
+            self.info_label.config(text=f"显示第 {self._top + 1}-{self._bottom} 行，共 {total} 行（滚动加载更多）")
+        else:
+            self.info_label.config(text="")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+两遍识别 - 先用快速设置（小模型或贪心解码）识别整段，只对低置信度的分段用大模型/束搜索重新识别
+
+低置信度分段（任一条件满足）：
+- avg_logprob 低于 logprob_threshold
+- compression_ratio 高于 compression_ratio_threshold（重复、幻觉）
+- no_speech_prob 高于 no_speech_threshold（可能是把噪声识别成了文字）
+
+相邻的低置信度分段合并为一个区间，区间两端向外扩展 pad 秒（不越过相邻的可信分段），
+第二遍只识别这些区间，结果按区间起点平移后替换原分段。
+第二遍记录为 retranscribe 阶段，任务报告中的 retranscribe_fraction 即需要第二遍的音频比例
+"""
+
+import os
+
+import metrics
+import model_cache
+
+SAMPLE_RATE = 16000
+
+# 只在第二遍使用的解码参数（第一遍由 fast_options 去掉）
+BEAM_OPTIONS = ("beam_size", "best_of", "patience")
+# 调用方没有自己的准确识别参数时，第二遍使用的束搜索参数
+ACCURATE_OPTIONS = dict(beam_size=5, best_of=5)
+
+
+class TwoPassPolicy:
+    def __init__(self, fast_model=None, logprob_threshold=-0.7, no_speech_threshold=0.6,
+                 compression_ratio_threshold=2.4, merge_gap=1.0, pad=0.3):
+        """
+        :param fast_model: 第一遍使用的模型名；None 表示沿用同一模型，只把束搜索换成贪心解码
+        :param logprob_threshold: 平均对数概率低于该值的分段重新识别
+        :param no_speech_threshold: 无语音概率高于该值的分段重新识别
+        :param compression_ratio_threshold: 压缩比高于该值的分段重新识别
+        :param merge_gap: 间隔小于该秒数的低置信度分段合并为一个区间
+        :param pad: 区间两端扩展的秒数
+        """
+        self.fast_model = fast_model
+        self.logprob_threshold = logprob_threshold
+        self.no_speech_threshold = no_speech_threshold
+        self.compression_ratio_threshold = compression_ratio_threshold
+        self.merge_gap = merge_gap
+        self.pad = pad
+
+    @classmethod
+    def from_env(cls, default=None):
+        """
+        B2T_TWO_PASS=greedy（同一模型，第一遍贪心解码）、第一遍模型名（如 base）或 off（关闭）
+        B2T_TWO_PASS_LOGPROB 可调整置信度阈值
+        :param default: 未设置 B2T_TWO_PASS 时使用的策略
+        :return: TwoPassPolicy，关闭时返回 None
+        """
+        value = os.environ.get("B2T_TWO_PASS", "").strip()
+        if not value:
+            policy = default
+        elif value == "off":
+            policy = None
+        else:
+            policy = cls(fast_model=None if value == "greedy" else value)
+        if policy is None:
+            return None
+        if os.environ.get("B2T_TWO_PASS_LOGPROB"):
+            policy.logprob_threshold = float(os.environ["B2T_TWO_PASS_LOGPROB"])
+        return policy
+
+    def is_uncertain(self, segment):
+        """分段是否需要第二遍"""
+        return (segment.get("avg_logprob", 0.0) < self.logprob_threshold
+                or segment.get("compression_ratio", 0.0) > self.compression_ratio_threshold
+                or segment.get("no_speech_prob", 0.0) > self.no_speech_threshold)
+
+    def validate(self, options):
+        """
+        检查第二遍是否比第一遍更"贵"：同一模型且没有束搜索参数时，第二遍只是用相同设置再识别一次，
+        徒增耗时而不会提高置信度
+        :param options: 准确识别参数
+        """
+        if not self.fast_model and not any(key in options for key in BEAM_OPTIONS):
+            raise ValueError("两遍识别需要第一遍使用更小的模型，或为第二遍提供 beam_size / best_of 等束搜索参数")
+
+    def load_fast_model(self, model, backend):
+        """
+        第一遍使用的模型（经由 model_cache）
+        两个模型需要同时常驻时，调用方在任务期间用 model_cache.pinned(准确模型, *policy.pinned_models()) 固定，
+        否则 MAX_MODELS=1 时加载第一遍模型会把准确模型换出缓存
+        :param model: 第二遍（准确）模型对象
+        """
+        if not self.fast_model:
+            return model
+        return model_cache.get(self.fast_model, backend)
+
+    def pinned_models(self):
+        """除准确模型外，任务期间需要固定在缓存中的模型名"""
+        return [self.fast_model] if self.fast_model else []
+
+
+def fast_options(options):
+    """第一遍参数：去掉束搜索相关参数，各后端退回默认的贪心解码"""
+    return {key: value for key, value in options.items() if key not in BEAM_OPTIONS}
+
+
+def uncertain_spans(segments, policy, duration):
+    """
+    低置信度分段合并后的重新识别区间
+    :return: [(起点秒, 终点秒, 第一个分段下标, 最后一个分段下标)]
+    """
+    spans = []
+    for i, seg in enumerate(segments):
+        if not policy.is_uncertain(seg):
+            continue
+        if spans and seg["start"] - segments[spans[-1][1]]["end"] <= policy.merge_gap:
+            spans[-1][1] = i
+        else:
+            spans.append([i, i])
+
+    result = []
+    for first, last in spans:
+        # 向外扩展，但不越过相邻的可信分段
+        lower = segments[first - 1]["end"] if first > 0 else 0.0
+        upper = segments[last + 1]["start"] if last + 1 < len(segments) else duration
+        start = max(segments[first]["start"] - policy.pad, lower)
+        end = min(segments[last]["end"] + policy.pad, upper)
+        if end > start:
+            result.append((start, end, first, last))
+    return result
+
+
+def transcribe(audio, model, policy, fast_model=None, **options):
+    """
+    两遍识别
+    :param audio: 文件路径或 16kHz float32 数组
+    :param model: 第二遍（准确）模型
+    :param policy: TwoPassPolicy
+    :param fast_model: 第一遍模型，None 时与 model 相同
+    :param options: 准确识别参数（beam_size / best_of 等只用于第二遍）
+    :return: 与 transcribe 相同结构的结果字典，另有 redone_seconds（第二遍识别的音频秒数）
+    """
+    policy.validate(options)
+    if isinstance(audio, str):
+        # 只解码一次，两遍共用
+        from local_file_recognition import load_audio
+        audio = load_audio(audio)
+    duration = len(audio) / SAMPLE_RATE
+
+    result = (fast_model or model).transcribe(audio, **fast_options(options))
+    segments = list(result.get("segments", []))
+    spans = uncertain_spans(segments, policy, duration)
+    if not spans:
+        result["redone_seconds"] = 0.0
+        return result
+
+    redone = 0.0
+    merged = []
+    cursor = 0
+    prompt = options.get("initial_prompt")
+    for start, end, first, last in spans:
+        merged.extend(segments[cursor:first])
+        cursor = last + 1
+        span_seconds = end - start
+        with metrics.span("retranscribe", audio_seconds=span_seconds) as s:
+            chunk = audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)]
+            # 前文作为提示，保持区间识别的上下文
+            context = "".join(seg["text"] for seg in merged[-3:]).strip()
+            span_options = dict(options)
+            if context:
+                span_options["initial_prompt"] = f"{prompt or ''}{context}"
+            retry = model.transcribe(chunk, **span_options)
+            s.set("segments", last - first + 1)
+        for seg in retry.get("segments", []):
+            seg = dict(seg)
+            seg["start"] = min(seg["start"] + start, end)
+            seg["end"] = min(seg["end"] + start, end)
+            seg["second_pass"] = True
+            merged.append(seg)
+        redone += span_seconds
+    merged.extend(segments[cursor:])
+
+    for i, seg in enumerate(merged):
+        seg["id"] = i
+    result["segments"] = merged
+    result["text"] = "".join(seg["text"] for seg in merged)
+    result["duration"] = result.get("duration", duration)
+    result["redone_seconds"] = redone
+    print(f"[two_pass] 重新识别 {len(spans)} 个区间，共 {redone:.1f}/{duration:.1f} 秒")
+    return result
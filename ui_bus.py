@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+界面更新总线 - 工作线程只投递事件，由 Tk 主线程通过 after() 定时批量执行
+Tk 不是线程安全的，识别/录音线程不应直接操作控件或调用 root.update()
+
+合并规则（同一批次内）：
+- 带 key 的事件只执行最后一个（进度条数值、状态文字等只关心最新值）
+- 对同一文本框连续的 append() 合并为一次 insert
+"""
+
+import queue
+import tkinter as tk
+
+
+class UIEventBus:
+    def __init__(self, root, interval=30, max_batch=5000):
+        """
+        :param root: Tk 根窗口
+        :param interval: 批量执行间隔（毫秒）
+        :param max_batch: 单批最多处理的事件数，避免积压时长时间占用主线程
+        """
+        self.root = root
+        self.interval = interval
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self.root.after(self.interval, self._drain)
+
+    def post(self, fn, *args, key=None, **kwargs):
+        """
+        投递一次界面调用（任意线程）
+        :param fn: 在主线程执行的函数，如 label.config
+        :param key: 合并键，同批次内相同 key 只执行最后一次
+        """
+        self._queue.put((key, fn, args, kwargs))
+
+    def append(self, widget, text, see_end=True):
+        """向文本框末尾追加文本（任意线程），连续追加会合并为一次 insert"""
+        self._queue.put((_APPEND, widget, text, see_end))
+
+    def show(self, fn, *args, **kwargs):
+        """
+        弹出模态对话框（任意线程），如 messagebox.showinfo
+        对话框单独调度，不阻塞同批次及之后的界面更新
+        """
+        self.post(self.root.after, 0, lambda: fn(*args, **kwargs))
+
+    def close(self):
+        """停止调度（窗口销毁前调用）"""
+        self._closed = True
+
+    def _drain(self):
+        if self._closed:
+            return
+
+        batch = []
+        try:
+            while len(batch) < self.max_batch:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if batch:
+            self._run_batch(batch)
+
+        try:
+            self.root.after(self.interval, self._drain)
+        except tk.TclError:
+            # 窗口已销毁
+            self._closed = True
+
+    def _run_batch(self, batch):
+        # 每个 key 最后一次出现的位置
+        last_index = {}
+        for i, event in enumerate(batch):
+            if event[0] is not None and event[0] is not _APPEND:
+                last_index[event[0]] = i
+
+        pending_widget = None
+        pending_text = []
+        pending_see = False
+
+        def flush_append():
+            if pending_widget is not None and pending_text:
+                self._call(_insert_text, pending_widget, "".join(pending_text), pending_see)
+
+        for i, event in enumerate(batch):
+            if event[0] is _APPEND:
+                _, widget, text, see_end = event
+                if widget is not pending_widget:
+                    flush_append()
+                    pending_widget, pending_text, pending_see = widget, [], False
+                pending_text.append(text)
+                pending_see = pending_see or see_end
+                continue
+
+            flush_append()
+            pending_widget, pending_text, pending_see = None, [], False
+
+            key, fn, args, kwargs = event
+            if key is not None and last_index[key] != i:
+                continue
+            self._call(fn, *args, **kwargs)
+
+        flush_append()
+
+    @staticmethod
+    def _call(fn, *args, **kwargs):
+        try:
+            fn(*args, **kwargs)
+        except tk.TclError:
+            # 控件已销毁等情况，忽略
+            pass
+        except Exception as e:
+            print(f"[ui] 界面更新出错: {e}")
+
+
+# append 事件标记
+_APPEND = object()
+
+
+def _insert_text(widget, text, see_end):
+    # 自带追加逻辑的控件（如 TranscriptView 需要限制缓冲行数）交给控件处理
+    append = getattr(widget, "append", None)
+    if append is not None:
+        append(text, see_end)
+        return
+    widget.insert(tk.END, text)
+    if see_end:
+        widget.see(tk.END)
@@ -4,6 +4,8 @@ import shlex
 import glob
 import subprocess
 
+import metrics
+
 YTDLP = "/usr/local/bin/yt-dlp"  # yt-dlp 绝对路径
 
 def _extract_bv(s: str) -> str:
@@ -25,14 +27,16 @@ def download_bilibili(url_or_bv: str, out_root: str = "bilibili_video", need_coo
     if need_cookies:
         cmd += f" --cookies-from-browser {shlex.quote(browser)}"
 
-    proc = subprocess.run(cmd, shell=True)
-    if proc.returncode != 0:
-        raise RuntimeError("下载失败：yt-dlp 返回非零状态码")
-
     folder = os.path.join(out_root, bv)
-    media_files = glob.glob(os.path.join(folder, "*.*"))
-    if not (os.path.isdir(folder) and media_files):
-        raise FileNotFoundError(f"下载目录无媒体文件：{folder}")
+    with metrics.span("download", bv=bv) as s:
+        proc = subprocess.run(cmd, shell=True)
+        if proc.returncode != 0:
+            raise RuntimeError("下载失败：yt-dlp 返回非零状态码")
+
+        media_files = glob.glob(os.path.join(folder, "*.*"))
+        if not (os.path.isdir(folder) and media_files):
+            raise FileNotFoundError(f"下载目录无媒体文件：{folder}")
+        s.set("bytes_out", metrics.file_size(folder))
 
     for xml in glob.glob(os.path.join(folder, "*.xml")):
         try:
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+识别后端模块 - 统一 openai-whisper 与 faster-whisper (CTranslate2) 的加载和调用
+两种后端的 transcribe 返回相同结构的结果字典：
+{"text": str, "segments": [{"id", "start", "end", "text", "avg_logprob", ...}],
+ "language": str, "duration": 音频秒数}
+调用方（LocalFileRecognizer / ChunkedFileRecognizer / speech2text）无需关心具体后端
+detect_language(audio) 只做语种检测，返回 (语种代码, 概率)
+transcribe(audio, mel=...) 可直接使用预计算的 log-mel（见 mel_features），跳过解码和特征提取
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import progress
+
+BACKEND_OPENAI = "openai"
+BACKEND_FASTER = "faster"
+
+# GUI 下拉框显示名 -> 后端标识
+BACKEND_LABELS = {
+    "openai-whisper": BACKEND_OPENAI,
+    "faster-whisper int8": BACKEND_FASTER,
+}
+
+# openai-whisper 专有、faster-whisper 不接受的参数
+_OPENAI_ONLY_OPTIONS = {'fp16', 'verbose'}
+# faster-whisper 专有、openai-whisper 不接受的参数
+_FASTER_ONLY_OPTIONS = {'vad_filter', 'vad_parameters'}
+
+
+class PromptCache:
+    """
+    提示词 token 缓存：同一模型 + 同一提示词只编码一次，之后的分片/实时窗口直接复用 token 序列
+    （解码器对提示词的注意力状态依赖音频的交叉注意力，无法跨音频复用，可复用的是编码结果）
+    """
+
+    def __init__(self, encode, max_entries=32):
+        """
+        :param encode: fn(text) -> token 列表
+        :param max_entries: 最多缓存的提示词数（实时识别的提示词随上下文变化，只保留最近的）
+        """
+        self.encode = encode
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def get(self, prompt):
+        """
+        :param prompt: 提示词文本
+        :return: token 列表（与后端内部对 " " + prompt.strip() 的编码结果相同）
+        """
+        with self._lock:
+            tokens = self._entries.get(prompt)
+            if tokens is not None:
+                self._entries.move_to_end(prompt)
+                self.hits += 1
+                return tokens
+        start = time.perf_counter()
+        tokens = self.encode(" " + prompt.strip())
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.misses += 1
+            self.encode_seconds += elapsed
+            self._entries[prompt] = tokens
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return tokens
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "encode_seconds": self.encode_seconds}
+
+
+# 当前线程下一次特征提取直接返回的预计算 mel（见 _install_openai_mel_hook / _MelExtractor）
+_mel = threading.local()
+
+
+class _mel_input:
+    """with 块内本线程的特征提取直接返回预计算的 mel"""
+
+    def __init__(self, mel):
+        self.mel = mel
+
+    def __enter__(self):
+        _mel.value = self.mel
+
+    def __exit__(self, *exc):
+        _mel.value = None
+
+
+def _pending_mel():
+    return getattr(_mel, "value", None)
+
+
+def _install_openai_mel_hook():
+    """
+    替换 whisper.transcribe 模块中的 log_mel_spectrogram：设置了预计算 mel 的线程直接取用，
+    其他线程照常计算（只安装一次，对未使用预计算特征的调用没有影响）
+    """
+    import importlib
+    import torch
+
+    module = importlib.import_module("whisper.transcribe")
+    original = module.log_mel_spectrogram
+    if getattr(original, "_b2t_mel_hook", False):
+        return
+
+    def log_mel_spectrogram(audio, n_mels=80, padding=0, device=None):
+        mel = _pending_mel()
+        if mel is None:
+            return original(audio, n_mels, padding, device)
+        return torch.from_numpy(mel)
+
+    log_mel_spectrogram._b2t_mel_hook = True
+    module.log_mel_spectrogram = log_mel_spectrogram
+
+
+class _MelExtractor:
+    """包装 faster-whisper 的 FeatureExtractor：设置了预计算 mel 的线程直接取用"""
+
+    def __init__(self, extractor):
+        self._extractor = extractor
+
+    def __call__(self, waveform, *args, **kwargs):
+        mel = _pending_mel()
+        if mel is None:
+            return self._extractor(waveform, *args, **kwargs)
+        return mel
+
+    def __getattr__(self, name):
+        return getattr(self._extractor, name)
+
+
+# faster-whisper WhisperModel -> PromptCache（模型释放后自动移除）
+_prompt_caches = weakref.WeakKeyDictionary()
+
+
+def prompt_tokens(model, prompt):
+    """
+    faster-whisper 模型的提示词 token（transcribe 的 initial_prompt 接受 token 序列）
+    :param model: faster_whisper.WhisperModel
+    :param prompt: 提示词文本
+    :return: token 列表
+    """
+    cache = _prompt_caches.get(model)
+    if cache is None:
+        # 只引用分词器，缓存不能持有模型本身，否则模型无法随 model_cache 淘汰而释放
+        tokenizer = model.hf_tokenizer
+        cache = _prompt_caches.setdefault(
+            model, PromptCache(lambda text: tokenizer.encode(text, add_special_tokens=False).ids))
+    return cache.get(prompt)
+
+
+def prompt_cache_stats():
+    """各模型提示词缓存的累计命中情况（供 benchmark 统计每个分片节省的时间）"""
+    total = {"hits": 0, "misses": 0, "encode_seconds": 0.0}
+    for cache in list(_prompt_caches.values()):
+        for key, value in cache.stats().items():
+            total[key] += value
+    return total
+
+
+def backend_from_label(label):
+    """将 GUI 显示名转换为后端标识（未知名称按原样返回）"""
+    return BACKEND_LABELS.get(label, label)
+
+
+class OpenAIWhisperBackend:
+    """openai-whisper 后端（PyTorch）"""
+
+    name = BACKEND_OPENAI
+
+    def __init__(self, model_name, device=None):
+        """
+        :param model_name: 模型名称 (tiny, base, small, medium, large, large-v2, large-v3)
+        :param device: 运行设备，None 时自动选择 cuda/cpu
+        """
+        import whisper
+
+        if device is None:
+            device = "cuda" if whisper.torch.cuda.is_available() else "cpu"
+
+        self.model_name = model_name
+        self.device = device
+        self.model = whisper.load_model(model_name, device=device)
+        _install_openai_mel_hook()
+
+    @property
+    def n_mels(self):
+        return self.model.dims.n_mels
+
+    def mel_filters(self):
+        """mel 滤波器组，形状 (n_mels, 201)"""
+        import whisper
+
+        return whisper.audio.mel_filters("cpu", self.n_mels).numpy()
+
+    def transcribe(self, audio, mel=None, **options):
+        """
+        识别音频
+        :param audio: 文件路径或 16kHz float32 数组；提供 mel 时可为 None
+        :param mel: 预计算的 log-mel（mel_features.MelFeatures.window），提供时不再解码音频和计算特征
+        :param options: openai-whisper transcribe 参数
+        :return: 结果字典
+        """
+        import numpy as np
+        import whisper
+
+        for key in _FASTER_ONLY_OPTIONS:
+            options.pop(key, None)
+
+        if mel is not None:
+            # transcribe 只用音频计算 mel，预计算 mel 已包含末尾的 30 秒静音帧
+            with _mel_input(mel):
+                result = self.model.transcribe(np.zeros(0, dtype=np.float32), **options)
+            result["duration"] = (mel.shape[-1] - whisper.audio.N_FRAMES) / whisper.audio.FRAMES_PER_SECOND
+        else:
+            # 先解码再识别（与 transcribe 内部做法相同），以便返回音频时长
+            if isinstance(audio, str):
+                audio = whisper.load_audio(audio)
+            result = self.model.transcribe(audio, **options)
+            result["duration"] = len(audio) / whisper.audio.SAMPLE_RATE
+        # openai-whisper 没有逐窗口的回调，整次识别结束时上报
+        progress.report(result["duration"], total_seconds=result["duration"], force=True)
+        return result
+
+    def detect_language(self, audio):
+        """
+        只做语种检测（取前 30 秒），不解码文本
+        :param audio: 16kHz float32 数组
+        :return: (语种代码, 概率)
+        """
+        import whisper
+
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=self.model.dims.n_mels)
+        _, probs = self.model.detect_language(mel.to(self.model.device))
+        language = max(probs, key=probs.get)
+        return language, probs[language]
+
+
+class FasterWhisperBackend:
+    """faster-whisper 后端（CTranslate2，CPU 上默认 int8 量化）"""
+
+    name = BACKEND_FASTER
+
+    def __init__(self, model_name, device=None, compute_type=None, cpu_threads=0):
+        """
+        :param model_name: 模型名称 (tiny, base, small, medium, large-v2, large-v3)
+        :param device: 运行设备，None 时自动选择 cuda/cpu
+        :param compute_type: 计算精度，None 时 GPU 用 float16、CPU 用 int8
+        :param cpu_threads: CPU 线程数，0 表示由 CTranslate2 自动决定
+        """
+        import torch
+        from faster_whisper import WhisperModel
+
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        if compute_type is None:
+            compute_type = "float16" if device == "cuda" else "int8"
+
+        self.model_name = model_name
+        self.device = device
+        self.compute_type = compute_type
+        self.model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads
+        )
+        self.model.feature_extractor = _MelExtractor(self.model.feature_extractor)
+
+    @property
+    def n_mels(self):
+        return self.model.feature_extractor.mel_filters.shape[0]
+
+    def mel_filters(self):
+        """mel 滤波器组，形状 (n_mels, 201)"""
+        return self.model.feature_extractor.mel_filters
+
+    def transcribe(self, audio, mel=None, **options):
+        """
+        识别音频，参数沿用 openai-whisper 命名，结果转换为 openai-whisper 的字典结构
+        每得到一个分段按其结束时间上报进度（见 progress.report）
+        :param audio: 文件路径或 16kHz float32 数组；提供 mel 时可为 None
+        :param mel: 预计算的 log-mel，提供时不再解码音频和计算特征（开启 vad_filter 时需要原始音频，忽略 mel）
+        :param options: openai-whisper 风格的 transcribe 参数
+        :return: 结果字典
+        """
+        import numpy as np
+
+        if mel is not None and options.get('vad_filter'):
+            if audio is None:
+                raise ValueError("开启 vad_filter 时需要原始音频，不能只提供 mel")
+            mel = None
+        if mel is not None:
+            # 音频只用于计算时长，用等长的空数组占位
+            audio = np.zeros((mel.shape[-1] - 3000) * 160, dtype=np.float32)
+
+        for key in _OPENAI_ONLY_OPTIONS:
+            options.pop(key, None)
+
+        # 提示词只编码一次，之后直接传 token 序列
+        if isinstance(options.get('initial_prompt'), str) and options['initial_prompt'].strip():
+            options['initial_prompt'] = prompt_tokens(self.model, options['initial_prompt'])
+
+        # 参数名映射
+        if 'logprob_threshold' in options:
+            options['log_prob_threshold'] = options.pop('logprob_threshold')
+        # openai-whisper 默认贪心解码，保持一致
+        options.setdefault('beam_size', 1)
+
+        with _mel_input(mel):
+            segments_iter, info = self.model.transcribe(audio, **options)
+
+        segments = []
+        texts = []
+        # 分段是惰性生成的，每解码出一段就上报到该段结束的位置
+        for seg in segments_iter:
+            segments.append({
+                "id": seg.id,
+                "seek": seg.seek,
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text,
+                "tokens": list(seg.tokens),
+                "temperature": getattr(seg, 'temperature', None),
+                "avg_logprob": seg.avg_logprob,
+                "compression_ratio": seg.compression_ratio,
+                "no_speech_prob": seg.no_speech_prob,
+            })
+            texts.append(seg.text)
+            progress.report(min(seg.end, info.duration), total_seconds=info.duration)
+        progress.report(info.duration, total_seconds=info.duration, force=True)
+
+        return {"text": "".join(texts), "segments": segments, "language": info.language,
+                "duration": info.duration}
+
+    def detect_language(self, audio):
+        """
+        只做语种检测（取前 30 秒），不解码文本
+        transcribe 的分段是惰性生成的，不迭代就不会解码，info 中已有检测结果
+        :param audio: 16kHz float32 数组
+        :return: (语种代码, 概率)
+        """
+        _, info = self.model.transcribe(audio[:30 * 16000])
+        return info.language, info.language_probability
+
+
+def load_backend(model_name, backend=BACKEND_OPENAI, **kwargs):
+    """
+    按名称加载识别后端
+    :param model_name: 模型名称
+    :param backend: 后端标识 (openai / faster) 或 GUI 显示名
+    :param kwargs: 传给后端构造函数的参数（device, compute_type 等）
+    :return: 具有 transcribe(audio, **options) 方法的后端对象
+    """
+    backend = backend_from_label(backend)
+    if backend == BACKEND_FASTER:
+        return FasterWhisperBackend(model_name, **kwargs)
+    if backend == BACKEND_OPENAI:
+        return OpenAIWhisperBackend(model_name, **kwargs)
+    raise ValueError(f"未知的识别后端: {backend}")
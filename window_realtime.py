@@ -4,21 +4,27 @@ Bili2text GUI界面 - 支持B站视频识别和实时音频识别
 """
 
 import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox, filedialog
+from tkinter import ttk, messagebox, filedialog
 import threading
+import os
+import importlib.util
 from utils import download_bilibili
-from exAudio import *
-from speech2text import *
-from realtime_recognition import RealtimeRecognizer
-from local_file_recognition import LocalFileRecognizer
 from audio_recorder import AudioRecorder
 from audio_recorder_chunked import ChunkedAudioRecorder
-from chunked_file_recognition import ChunkedFileRecognizer
+from whisper_backend import BACKEND_LABELS, BACKEND_OPENAI, backend_from_label
+from settings import load_settings, save_settings
+from ui_bus import UIEventBus
+from transcript_view import TranscriptView
+import model_cache
+import metrics
+import profiling
 import subprocess
 import shutil
-import time
 from datetime import datetime
 
+# 双模型实时识别时用于即时预览的模型
+PREVIEW_MODEL = "tiny"
+
 
 class Bili2TextGUI:
     def __init__(self, root):
@@ -29,8 +35,8 @@ class Bili2TextGUI:
 
         # 实时识别相关
         self.recognizer = None
+        self._rt_pins = []  # 实时识别期间固定在模型缓存中的模型名
         self.is_realtime_recording = False
-        self.update_thread = None
 
         # 录音/识别相关
         self.audio_recorder = None
@@ -44,8 +50,16 @@ class Bili2TextGUI:
         self._last_output_path = None  # 最近一次识别的输出文件路径
         self._recognition_running = False  # 识别线程是否在跑
         self._pending_session = None  # 排队等待识别的 chunk_files
+        self._settings = load_settings()
+        self._prewarm_after_id = None  # 模型切换的去抖定时器
+        # 工作线程的界面更新统一经由 ui 总线在主线程批量执行
+        self.ui = UIEventBus(self.root)
 
         self.setup_ui()
+        self.root.after_idle(self._load_audio_devices_async)
+        # 启动时在后台预热上次使用的模型
+        if self._settings.get("model"):
+            self._schedule_prewarm()
 
     def setup_ui(self):
         """设置UI界面"""
@@ -54,10 +68,21 @@ class Bili2TextGUI:
         global_frame.pack(pady=(10, 0), padx=10, fill='x')
 
         ttk.Label(global_frame, text="Whisper模型:").pack(side='left', padx=(0, 5))
-        self.model_var = tk.StringVar(value="medium")
-        ttk.Combobox(global_frame, textvariable=self.model_var,
-                     values=["tiny", "base", "small", "medium", "large", "large-v2", "large-v3"],
-                     state="readonly", width=12).pack(side='left', padx=(0, 15))
+        self.model_var = tk.StringVar(value=self._settings.get("model", "medium"))
+        model_combo = ttk.Combobox(global_frame, textvariable=self.model_var,
+                                   values=["tiny", "base", "small", "medium", "large", "large-v2", "large-v3"],
+                                   state="readonly", width=12)
+        model_combo.pack(side='left', padx=(0, 15))
+        model_combo.bind('<<ComboboxSelected>>', self._on_model_selected)
+
+        # 推理后端（仅作用于文件识别；faster-whisper int8 在 CPU 上快数倍）
+        ttk.Label(global_frame, text="后端:").pack(side='left', padx=(0, 5))
+        self.backend_var = tk.StringVar(value=self._settings.get("backend", "openai-whisper"))
+        backend_combo = ttk.Combobox(global_frame, textvariable=self.backend_var,
+                                     values=list(BACKEND_LABELS.keys()),
+                                     state="readonly", width=18)
+        backend_combo.pack(side='left', padx=(0, 15))
+        backend_combo.bind('<<ComboboxSelected>>', self._on_model_selected)
 
         ttk.Label(global_frame, text="关键词提示:").pack(side='left', padx=(0, 5))
         self.keyword_var = tk.StringVar()
@@ -66,18 +91,35 @@ class Bili2TextGUI:
         ttk.Label(global_frame, text="(可选)",
                   font=('Arial', 9), foreground='gray').pack(side='left')
 
+        # 模型预热状态
+        self.model_status_label = ttk.Label(global_frame, text="",
+                                            font=('Arial', 9), foreground='gray')
+        self.model_status_label.pack(side='right')
+
         # === 音频波形 ===
         self.waveform_canvas = tk.Canvas(self.root, height=36, highlightthickness=0)
         self.waveform_canvas.pack(fill='x', padx=10, pady=(5, 0))
 
         self.waveform_bars = 60
-        self.waveform_data = [0.0] * self.waveform_bars
         self._waveform_active = False
+        self._waveform_levels = None  # 每柱 RMS（float32 数组，首次开始波形时分配）
+        self._waveform_seq = 0  # 音频回调每写一次 +1，用于判断是否需要重绘
+        self._waveform_drawn = None  # 上次绘制时的 (seq, 宽, 高, active)
+        self._waveform_layout = None  # 上次布局的 (宽, 高)
+        # 柱子只创建一次，之后只更新坐标和颜色
+        self._waveform_items = [
+            self.waveform_canvas.create_rectangle(0, 0, 0, 0, fill='#d0d0d0', outline='')
+            for _ in range(self.waveform_bars)
+        ]
+        self._waveform_heights = [None] * self.waveform_bars
+        self._waveform_colors = ['#d0d0d0'] * self.waveform_bars
         self._draw_waveform()
 
         # === Notebook ===
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=(5, 10))
+        # 实时识别固定使用 openai-whisper，切换标签页时预热对应后端
+        self.notebook.bind('<<NotebookTabChanged>>', self._on_tab_changed)
 
         # Tab 1: 文件识别（整合 BV + 录音 + 本地文件）
         self.file_tab_frame = ttk.Frame(self.notebook)
@@ -163,9 +205,9 @@ class Bili2TextGUI:
 
         ttk.Label(device_frame, text="录音设备:").pack(side='left', padx=5)
 
-        self.audio_devices = ChunkedAudioRecorder.get_audio_devices()
-        self.record_device_var = tk.StringVar(
-            value=self.audio_devices[0] if self.audio_devices else "default")
+        # 设备列表由 ffmpeg 枚举（较慢），窗口显示后在后台填充
+        self.audio_devices = ["default"]
+        self.record_device_var = tk.StringVar(value="default")
 
         self.device_combo = ttk.Combobox(device_frame,
                                          textvariable=self.record_device_var,
@@ -223,8 +265,9 @@ class Bili2TextGUI:
 
         ttk.Label(result_frame, text="识别结果:").pack(anchor='w')
 
-        self.file_result_text = scrolledtext.ScrolledText(result_frame, height=10, width=70)
-        self.file_result_text.pack(fill='both', expand=True, pady=5)
+        # 结果只在视图中保留有限行数，完整内容以磁盘上的输出文件为准
+        self.file_result_view = TranscriptView(result_frame, height=10, width=70)
+        self.file_result_view.pack(fill='both', expand=True, pady=5)
 
         # 保存 + 清理按钮
         save_frame = ttk.Frame(self.file_tab_frame)
@@ -292,7 +335,8 @@ class Bili2TextGUI:
             if not bv:
                 messagebox.showerror("错误", "请输入BV号")
                 return
-            thread = threading.Thread(target=self._bv_conversion_thread, args=(bv,))
+            thread = threading.Thread(target=self._bv_conversion_thread,
+                                      args=(bv, self._collect_options()))
             thread.daemon = True
             thread.start()
 
@@ -300,7 +344,9 @@ class Bili2TextGUI:
             if not (hasattr(self, 'chunk_files') and self.chunk_files):
                 messagebox.showerror("错误", "请先录制音频")
                 return
-            thread = threading.Thread(target=self._local_recognition_thread)
+            self._recognition_running = True
+            thread = threading.Thread(target=self._local_recognition_thread,
+                                      args=(self._collect_options(),))
             thread.daemon = True
             thread.start()
 
@@ -312,19 +358,36 @@ class Bili2TextGUI:
             if not os.path.exists(file_path):
                 messagebox.showerror("错误", "文件不存在")
                 return
-            thread = threading.Thread(target=self._local_recognition_thread)
+            self._recognition_running = True
+            thread = threading.Thread(target=self._local_recognition_thread,
+                                      args=(self._collect_options(),))
             thread.daemon = True
             thread.start()
 
+    def _collect_options(self):
+        """在主线程读取界面选项，工作线程只使用这份快照，不再访问 Tk 变量"""
+        return {
+            "model": self.model_var.get(),
+            "backend": self.backend_var.get(),
+            "keyword": self.keyword_var.get().strip(),
+            "managed": self.managed_mode_var.get(),
+            "input_mode": self.input_mode_var.get(),
+            "file_path": self.file_path_var.get().strip(),
+        }
+
     # ---- BV 转换 ----
 
-    def _bv_conversion_thread(self, bv):
-        """BV号下载+识别线程"""
+    def _bv_conversion_thread(self, bv, options):
+        """BV号下载+识别线程（界面更新全部经由 self.ui 投递到主线程）"""
+        ui = self.ui
+        model = options["model"]
+        backend = options["backend"]
+        metrics.start_job(f"bv_{bv.split('/')[-1]}", source=bv, model=model, backend=backend)
         try:
-            self.file_start_btn.config(state='disabled')
-            self.file_progress.start()
-            self.file_result_text.delete(1.0, tk.END)
-            self.file_save_btn.config(state='disabled')
+            ui.post(self.file_start_btn.config, state='disabled')
+            ui.post(self.file_progress.start)
+            ui.post(self.file_result_view.clear)
+            ui.post(self.file_save_btn.config, state='disabled')
 
             self._log_result("开始下载视频...")
             folder = download_bilibili(bv)
@@ -333,34 +396,35 @@ class Bili2TextGUI:
             bv = bv.split('/')[-1]
 
             self._log_result("提取和分割音频...")
+            # 重依赖（moviepy / whisper / torch）在首次使用时才导入，窗口启动不受影响
+            from exAudio import process_audio_split
+            from speech2text import load_whisper, run_analysis
             foldername = process_audio_split(bv)
 
-            model = self.model_var.get()
-            self._log_result(f"加载{model}模型...")
-            load_whisper(model)
+            self._log_result(f"加载{model}模型（{backend}）...")
+            load_whisper(model, backend=backend)
 
             self._log_result("开始语音识别...")
-            keyword = self.keyword_var.get().strip()
+            # 每个分片写入结果文件后即追加显示，完成后再换成分页显示的结果文件
+            def on_text(text):
+                ui.append(self.file_result_view, text + "\n")
+
+            keyword = options["keyword"]
             if keyword:
-                run_analysis(foldername, prompt=keyword)
+                run_analysis(foldername, prompt=keyword, text_callback=on_text)
             else:
-                run_analysis(foldername)
+                run_analysis(foldername, text_callback=on_text)
 
             output_path = f"outputs/{foldername}.txt"
             self._last_output_path = output_path
             self._log_result(f"转换完成！文件保存在: {output_path}")
+            report_file = metrics.finish_job()
+            if report_file:
+                self._log_result(f"性能报告: {report_file}")
 
-            # 读取结果到文本框
-            try:
-                with open(output_path, 'r', encoding='utf-8') as f:
-                    result_content = f.read()
-                self.file_result_text.delete(1.0, tk.END)
-                self.file_result_text.insert(tk.END, result_content)
-                self.file_result_text.see(1.0)
-                self.local_result = result_content
-                self.file_save_btn.config(state='normal')
-            except Exception:
-                pass
+            # 分页显示结果文件（不把整个文件读入内存）
+            if os.path.exists(output_path):
+                ui.post(self._show_file_result, output_path)
 
             # 记录可清理的中间文件
             self._cleanable_paths = [
@@ -369,89 +433,120 @@ class Bili2TextGUI:
                 f"audio/slice/{foldername}"
             ]
 
-            if self.managed_mode_var.get():
+            if options["managed"]:
                 self._log_result("托管模式：自动清理中间文件...")
                 self._do_clean_files()
                 self._send_notification("BV转换完成", f"结果已保存到 {output_path}")
             else:
-                self.file_clean_btn.config(state='normal')
+                ui.post(self.file_clean_btn.config, state='normal')
 
             self._update_file_status("转换完成")
-            messagebox.showinfo("完成", f"转换完成！\n文件保存在: {output_path}")
+            ui.show(messagebox.showinfo, "完成", f"转换完成！\n文件保存在: {output_path}")
 
         except Exception as e:
+            if metrics.current_job():
+                metrics.finish_job(status="failed")
             self._log_result(f"错误: {str(e)}")
             self._update_file_status("错误")
-            messagebox.showerror("错误", str(e))
+            ui.show(messagebox.showerror, "错误", str(e))
 
         finally:
-            self.file_progress.stop()
-            self.file_start_btn.config(state='normal')
+            ui.post(self.file_progress.stop)
+            ui.post(self.file_start_btn.config, state='normal')
+
+    def _show_file_result(self, output_path):
+        """结果视图切换为分页显示输出文件（主线程）"""
+        try:
+            self.file_result_view.load_file(output_path)
+        except OSError as e:
+            self.file_result_view.append(f"读取结果文件失败: {e}\n")
+        self.file_save_btn.config(state='normal')
 
     # ---- 本地/录音识别 ----
 
-    def _local_recognition_thread(self):
-        """本地文件/录音识别线程"""
+    def _set_progress(self, value):
+        """确定进度条数值（任意线程，高频调用会被合并）"""
+        self.ui.post(self.file_progress.config, value=value, key=(self.file_progress, 'value'))
+
+    def _on_audio_progress(self, done_seconds, total_seconds):
+        """识别进度回调（识别线程，最高 10 Hz）"""
+        if total_seconds:
+            self._set_progress(int(min(done_seconds / total_seconds, 1.0) * 1000))
+
+    def _on_file_segment(self, segment):
+        """识别分段回调（识别线程）：边识别边追加到结果区，完成后再换成分页显示的输出文件"""
+        text = segment.get('text', '').strip()
+        if text:
+            minutes, seconds = divmod(int(segment.get('start', 0)), 60)
+            hours, minutes = divmod(minutes, 60)
+            self.ui.append(self.file_result_view, f"[{hours:02d}:{minutes:02d}:{seconds:02d}] {text}\n")
+
+    def _set_record_status(self, text, **kwargs):
+        """录音状态文字（任意线程）；带颜色的更新单独合并，不会被纯文字更新覆盖掉颜色"""
+        self.ui.post(self.record_status_label.config, text=text,
+                     key=(self.record_status_label, 'text') + tuple(sorted(kwargs)), **kwargs)
+
+    def _local_recognition_thread(self, options):
+        """本地文件/录音识别线程（界面更新全部经由 self.ui 投递到主线程）"""
+        ui = self.ui
         self._recognition_running = True
         # snapshot chunk_files 到局部变量，不依赖 self.chunk_files（可能被新录音覆盖）
         snapshot_chunks = list(self.chunk_files) if self.chunk_files else None
+        managed = options["managed"]
 
         try:
-            self.file_start_btn.config(state='disabled')
-            self.browse_btn.config(state='disabled')
-            self.file_progress.start()
+            ui.post(self.file_start_btn.config, state='disabled')
+            ui.post(self.browse_btn.config, state='disabled')
+            ui.post(self.file_progress.start)
 
-            model = self.model_var.get()
-            keyword = self.keyword_var.get().strip()
+            model = options["model"]
+            backend = options["backend"]
+            keyword = options["keyword"]
             initial_prompt = f"以下是普通话的句子。这是关于{keyword}的内容。" if keyword else ""
 
-            self.file_result_text.delete(1.0, tk.END)
+            ui.post(self.file_result_view.clear)
 
             if snapshot_chunks and len(snapshot_chunks) > 1:
+                from chunked_file_recognition import ChunkedFileRecognizer
+
                 # 分段识别
                 num_chunks = len(snapshot_chunks)
-                self.record_status_label.config(
-                    text=f"识别状态: 准备识别{num_chunks}个分段...")
+                self._set_record_status(f"识别状态: 准备识别{num_chunks}个分段...")
                 self._update_file_status("正在进行分段识别...")
 
-                # 切换为确定进度条（精度 1000，帧级更新）
-                self.file_progress.stop()
-                self.file_progress.config(mode='determinate', maximum=1000, value=0)
+                # 切换为确定进度条（精度 1000，按已识别音频秒数更新）
+                ui.post(self.file_progress.stop)
+                ui.post(self.file_progress.config, mode='determinate', maximum=1000, value=0)
 
-                managed = self.managed_mode_var.get()
                 self._cleanable_paths = list(snapshot_chunks)
 
-                # 帧级进度回调
-                def on_frame_progress(chunk_idx, total_chunks, current_frames, total_frames):
-                    chunk_share = 1000 / total_chunks
-                    base = (chunk_idx - 1) * chunk_share
-                    within = (current_frames / total_frames * chunk_share) if total_frames > 0 else 0
-                    self.file_progress.config(value=int(base + within))
-
                 # 重复检测 + 段完成回调
                 self._repetitive_streak = 0
 
                 def on_chunk_done(idx, total, text):
-                    self.file_progress.config(value=int(idx / total * 1000))
                     if self._is_repetitive(text):
                         self._repetitive_streak += 1
                         if self._repetitive_streak >= 2:
                             self._update_file_status("检测到连续重复，已中止识别")
-                            self.root.after(0, lambda: messagebox.showwarning(
-                                "识别异常",
-                                "连续多段识别结果出现大量重复词句，\n"
-                                "可能是录音出了问题，已自动中止。\n"
-                                "建议重新录制。"))
+                            ui.show(messagebox.showwarning,
+                                    "识别异常",
+                                    "连续多段识别结果出现大量重复词句，\n"
+                                    "可能是录音出了问题，已自动中止。\n"
+                                    "建议重新录制。")
                             return False
                         self._update_file_status(f"第{idx}段可能存在重复，继续检查下一段...")
                     else:
                         self._repetitive_streak = 0
+                    # 每段识别完即追加显示
+                    if text.strip():
+                        ui.append(self.file_result_view, text.strip() + "\n")
                     return True
 
                 chunked_recognizer = ChunkedFileRecognizer(
                     model_name=model,
                     initial_prompt=initial_prompt,
-                    progress_callback=self._update_file_status
+                    progress_callback=self._update_file_status,
+                    backend=backend
                 )
 
                 self.local_result = chunked_recognizer.process_chunks(
@@ -459,119 +554,127 @@ class Bili2TextGUI:
                     save_to_file=True,
                     delete_after=managed,
                     chunk_callback=on_chunk_done,
-                    frame_callback=on_frame_progress
+                    audio_progress_callback=self._on_audio_progress
                 )
 
                 self._last_output_path = chunked_recognizer.last_output_file
 
                 if managed:
                     if self.local_result and self.local_result.strip():
-                        self.record_status_label.config(
-                            text=f"识别状态: 完成（已识别{num_chunks}段，文件已清理）")
+                        self._set_record_status(f"识别状态: 完成（已识别{num_chunks}段，文件已清理）")
                         self._cleanable_paths = []
                     else:
                         # 识别失败，文件未删除
-                        self.record_status_label.config(
-                            text=f"识别状态: 失败（文件已保留，可手动清理）")
-                        self.file_clean_btn.config(state='normal')
+                        self._set_record_status(f"识别状态: 失败（文件已保留，可手动清理）")
+                        ui.post(self.file_clean_btn.config, state='normal')
                 else:
-                    self.record_status_label.config(
-                        text=f"识别状态: 完成（已识别{num_chunks}段）")
-                    self.file_clean_btn.config(state='normal')
+                    self._set_record_status(f"识别状态: 完成（已识别{num_chunks}段）")
+                    ui.post(self.file_clean_btn.config, state='normal')
 
             elif snapshot_chunks and len(snapshot_chunks) == 1:
                 # 单个录音分段
-                self.record_status_label.config(text="识别状态: 正在识别...")
+                self._set_record_status("识别状态: 正在识别...")
                 self._update_file_status("正在识别...")
                 self._cleanable_paths = list(snapshot_chunks)
 
                 # 确定进度条
-                self.file_progress.stop()
-                self.file_progress.config(mode='determinate', maximum=1000, value=0)
+                ui.post(self.file_progress.stop)
+                ui.post(self.file_progress.config, mode='determinate', maximum=1000, value=0)
 
+                from local_file_recognition import LocalFileRecognizer
                 self.local_recognizer = LocalFileRecognizer(
                     model_name=model,
                     initial_prompt=initial_prompt,
-                    progress_callback=self._update_file_status
+                    progress_callback=self._update_file_status,
+                    backend=backend,
+                    audio_progress_callback=self._on_audio_progress,
+                    segment_callback=self._on_file_segment
                 )
 
-                self.local_result = self._transcribe_with_progress(
-                    lambda: self.local_recognizer.process_file(
-                        snapshot_chunks[0], save_to_file=True))
+                self.local_result = self.local_recognizer.process_file(
+                    snapshot_chunks[0], save_to_file=True)
 
                 self._last_output_path = self.local_recognizer.last_output_file
 
                 # 重复检测
                 if self.local_result and self._is_repetitive(self.local_result):
-                    self.root.after(0, lambda: messagebox.showwarning(
-                        "识别异常",
-                        "识别结果出现大量重复词句，\n"
-                        "可能是录音出了问题。建议重新录制。"))
+                    ui.show(messagebox.showwarning,
+                            "识别异常",
+                            "识别结果出现大量重复词句，\n"
+                            "可能是录音出了问题。建议重新录制。")
 
-                if self.managed_mode_var.get():
-                    if self.local_result and self.local_result.strip():
-                        self._do_clean_files()
-                    else:
-                        self.file_clean_btn.config(state='normal')
+                if managed and self.local_result and self.local_result.strip():
+                    self._do_clean_files()
                 else:
-                    self.file_clean_btn.config(state='normal')
+                    ui.post(self.file_clean_btn.config, state='normal')
 
             else:
                 # 本地文件模式
-                file_path = self.file_path_var.get().strip()
+                file_path = options["file_path"]
                 self._update_file_status("正在识别...")
 
                 # 确定进度条
-                self.file_progress.stop()
-                self.file_progress.config(mode='determinate', maximum=1000, value=0)
+                ui.post(self.file_progress.stop)
+                ui.post(self.file_progress.config, mode='determinate', maximum=1000, value=0)
 
+                from local_file_recognition import LocalFileRecognizer
                 self.local_recognizer = LocalFileRecognizer(
                     model_name=model,
                     initial_prompt=initial_prompt,
-                    progress_callback=self._update_file_status
+                    progress_callback=self._update_file_status,
+                    backend=backend,
+                    audio_progress_callback=self._on_audio_progress,
+                    segment_callback=self._on_file_segment
                 )
 
-                self.local_result = self._transcribe_with_progress(
-                    lambda: self.local_recognizer.process_file(
-                        file_path, save_to_file=True))
+                self.local_result = self.local_recognizer.process_file(
+                    file_path, save_to_file=True)
 
                 self._last_output_path = self.local_recognizer.last_output_file
 
-            # 显示结果
-            self.file_result_text.insert(tk.END, self.local_result)
-            self.file_result_text.see(1.0)
-            self.file_save_btn.config(state='normal')
+            # 显示结果：优先分页显示输出文件
+            if self._last_output_path and os.path.exists(self._last_output_path):
+                ui.post(self._show_file_result, self._last_output_path)
+            else:
+                # 换成完整结果，去掉识别过程中追加的分段
+                ui.post(self.file_result_view.clear)
+                ui.append(self.file_result_view, self.local_result or "")
+                ui.post(self.file_save_btn.config, state='normal')
 
             self._update_file_status("识别完成")
-            if self.input_mode_var.get() == "record":
-                self.record_status_label.config(text="录音状态: 识别完成")
+            if options["input_mode"] == "record":
+                self._set_record_status("录音状态: 识别完成")
 
-            if self.managed_mode_var.get():
+            if managed:
                 self._send_notification("识别完成", "录音已自动识别，结果已保存到 outputs 目录")
 
-            messagebox.showinfo("完成", "文件识别完成！\n结果已自动保存到 outputs 目录")
+            ui.show(messagebox.showinfo, "完成", "文件识别完成！\n结果已自动保存到 outputs 目录")
 
         except Exception as e:
             self._update_file_status("错误")
-            if self.input_mode_var.get() == "record":
-                self.record_status_label.config(text="录音状态: 错误")
-            messagebox.showerror("错误", str(e))
+            if options["input_mode"] == "record":
+                self._set_record_status("录音状态: 错误")
+            ui.show(messagebox.showerror, "错误", str(e))
 
         finally:
-            self._recognition_running = False
-            self.file_start_btn.config(state='normal')
-            self.browse_btn.config(state='normal')
-            self.file_progress.stop()
-            self.file_progress.config(mode='indeterminate', value=0)
-
-            # 检查排队的 session
-            if self._pending_session:
-                self.chunk_files = self._pending_session
-                self._pending_session = None
-                self.root.after(0, self._start_file_action)
-
-            # 刷新录制按钮状态
-            self.root.after(0, self._update_record_btn_state)
+            ui.post(self._on_local_recognition_done)
+
+    def _on_local_recognition_done(self):
+        """识别线程结束后的收尾（主线程）"""
+        self._recognition_running = False
+        self.file_start_btn.config(state='normal')
+        self.browse_btn.config(state='normal')
+        self.file_progress.stop()
+        self.file_progress.config(mode='indeterminate', value=0)
+
+        # 检查排队的 session
+        if self._pending_session:
+            self.chunk_files = self._pending_session
+            self._pending_session = None
+            self.root.after(0, self._start_file_action)
+
+        # 刷新录制按钮状态
+        self._update_record_btn_state()
 
     # ---- 录音相关 ----
 
@@ -618,7 +721,7 @@ class Bili2TextGUI:
 
         self._stop_waveform()
         self.record_status_label.config(text="录音状态: 正在保存...")
-        self.root.update()
+        self.root.update_idletasks()
 
         chunk_files = self.audio_recorder.stop_recording(merge=False)
         self.audio_recorder = None
@@ -663,18 +766,29 @@ class Bili2TextGUI:
         self._update_record_btn_state()
 
     def _update_record_duration(self, duration):
-        """更新录音时长显示"""
-        self.record_status_label.config(text=f"录音状态: 录制中 {duration}")
-        self.root.update()
+        """更新录音时长显示（录音线程回调）"""
+        self._set_record_status(f"录音状态: 录制中 {duration}")
 
     def refresh_audio_devices(self):
         """刷新音频设备列表"""
-        self.audio_devices = ChunkedAudioRecorder.get_audio_devices()
-        self.device_combo['values'] = self.audio_devices
-        if self.audio_devices:
-            self.record_device_var.set(self.audio_devices[0])
+        self._set_audio_devices(ChunkedAudioRecorder.get_audio_devices(), reset=True)
         messagebox.showinfo("刷新完成", f"找到 {len(self.audio_devices)} 个音频设备")
 
+    def _load_audio_devices_async(self):
+        """后台枚举录音设备，完成后回到主线程填充下拉框"""
+        def worker():
+            devices = ChunkedAudioRecorder.get_audio_devices()
+            self.ui.post(self._set_audio_devices, devices)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _set_audio_devices(self, devices, reset=False):
+        """更新设备下拉框；用户已选的设备仍存在时保持不变"""
+        self.audio_devices = devices
+        self.device_combo['values'] = devices
+        if devices and (reset or self.record_device_var.get() not in devices):
+            self.record_device_var.set(devices[0])
+
     def browse_file(self):
         """浏览选择文件"""
         file_path = filedialog.askopenfilename(
@@ -693,54 +807,72 @@ class Bili2TextGUI:
     # ---- 波形相关 ----
 
     def _on_audio_level(self, audio_array):
-        """音频波形回调（从后端线程调用），接收单声道 numpy 数组"""
-        if not self._waveform_active:
+        """音频波形回调（从后端线程调用），接收单声道 numpy 数组，计算每柱 RMS"""
+        levels = self._waveform_levels
+        if not self._waveform_active or levels is None:
             return
         import numpy as np
         n = self.waveform_bars
-        # 均匀抽样，取绝对值作为柱高
-        indices = np.linspace(0, len(audio_array) - 1, n, dtype=int)
-        self.waveform_data = [abs(float(audio_array[i])) for i in indices]
+        per_bar = len(audio_array) // n
+        if per_bar == 0:
+            return
+        # 按柱分组求平方和，结果直接写入预分配数组
+        blocks = audio_array[:per_bar * n].reshape(n, per_bar)
+        np.einsum('ij,ij->i', blocks, blocks, out=levels, casting='same_kind')
+        levels /= per_bar
+        np.sqrt(levels, out=levels)
+        self._waveform_seq += 1
 
     def _draw_waveform(self):
-        """定时重绘波形 Canvas — 中轴对称，实时反映当前音频"""
+        """定时刷新波形 Canvas — 中轴对称；数据和尺寸都没变时跳过本帧"""
         canvas = self.waveform_canvas
-        canvas.delete('all')
-
         w = canvas.winfo_width() or 760
         h = canvas.winfo_height() or 36
-        mid_y = h / 2
+        state = (self._waveform_seq, w, h, self._waveform_active)
+        if state != self._waveform_drawn:
+            self._waveform_drawn = state
+            self._render_waveform(w, h)
+        self.root.after(66, self._draw_waveform)
 
+    def _render_waveform(self, w, h):
+        """只更新高度或颜色有变化的柱子"""
+        canvas = self.waveform_canvas
+        mid_y = h / 2
         bar_w = 3
         total_w = self.waveform_bars * bar_w + (self.waveform_bars - 1) * 2
         x_offset = (w - total_w) / 2  # 居中
 
-        for i, level in enumerate(self.waveform_data):
-            # 归一化：乘以放大系数，限幅到 mid_y
-            bar_h = min(level * 300, mid_y - 1)
-            bar_h = max(bar_h, 1)
-
-            x = x_offset + i * (bar_w + 2)
-
-            if self._waveform_active and level > 0.005:
-                color = '#4a9eff'
-            else:
-                color = '#d0d0d0'
-
-            canvas.create_rectangle(x, mid_y - bar_h, x + bar_w, mid_y + bar_h,
-                                    fill=color, outline='')
-
-        self.root.after(66, self._draw_waveform)
+        levels = self._waveform_levels
+        active = self._waveform_active and levels is not None
+        layout_changed = self._waveform_layout != (w, h)
+        self._waveform_layout = (w, h)
+
+        for i, item in enumerate(self._waveform_items):
+            level = float(levels[i]) if active else 0.0
+            # 归一化：乘以放大系数，限幅到 mid_y；按整像素比较，细微变化不重绘
+            bar_h = int(max(min(level * 300, mid_y - 1), 1))
+            if layout_changed or bar_h != self._waveform_heights[i]:
+                x = x_offset + i * (bar_w + 2)
+                canvas.coords(item, x, mid_y - bar_h, x + bar_w, mid_y + bar_h)
+                self._waveform_heights[i] = bar_h
+
+            color = '#4a9eff' if active and level > 0.005 else '#d0d0d0'
+            if color != self._waveform_colors[i]:
+                canvas.itemconfigure(item, fill=color)
+                self._waveform_colors[i] = color
 
     def _start_waveform(self):
         """开始波形显示"""
+        if self._waveform_levels is None:
+            import numpy as np
+            self._waveform_levels = np.zeros(self.waveform_bars, dtype=np.float32)
+        else:
+            self._waveform_levels.fill(0)
         self._waveform_active = True
-        self.waveform_data = [0.0] * self.waveform_bars
 
     def _stop_waveform(self):
         """停止波形显示"""
         self._waveform_active = False
-        self.waveform_data = [0.0] * self.waveform_bars
 
     def _toggle_audio_test(self):
         """切换音频测试：开始/停止麦克风音量检测"""
@@ -784,16 +916,14 @@ class Bili2TextGUI:
     # ---- 辅助方法 ----
 
     def _update_file_status(self, message):
-        """更新文件识别状态"""
-        self.file_status_label.config(text=f"状态: {message}")
-        self.root.update()
+        """更新文件识别状态（任意线程）"""
+        self.ui.post(self.file_status_label.config, text=f"状态: {message}",
+                     key=(self.file_status_label, 'text'))
 
     def _log_result(self, message):
-        """带时间戳写入结果文本框"""
+        """带时间戳写入结果文本框（任意线程）"""
         timestamp = datetime.now().strftime('%H:%M:%S')
-        self.file_result_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.file_result_text.see(tk.END)
-        self.root.update()
+        self.ui.append(self.file_result_view, f"[{timestamp}] {message}\n")
 
     def _clean_source_files(self):
         """清理文件按钮回调（Tab 1）"""
@@ -823,7 +953,7 @@ class Bili2TextGUI:
                 self.record_status_label.config(text="录音状态: 未开始",
                                                 foreground='black')
                 self.file_start_btn.config(state='disabled')
-                self.file_result_text.delete(1.0, tk.END)
+                self.file_result_view.clear()
 
             messagebox.showinfo("清理完成", "中间文件已清理")
 
@@ -863,25 +993,6 @@ class Bili2TextGUI:
             self.rt_clean_btn.config(state='disabled')
             messagebox.showinfo("清理完成", "输出文件已清理")
 
-    def _transcribe_with_progress(self, transcribe_fn):
-        """包装识别调用，捕获 whisper 内部 tqdm 进度到 GUI 进度条"""
-        import tqdm as _tqdm_mod
-        from tqdm import tqdm as _orig_tqdm
-        progress_bar = self.file_progress
-
-        class _ProgressTqdm(_orig_tqdm):
-            def update(self, n=1):
-                super().update(n)
-                if self.total and self.total > 0:
-                    progress_bar.config(value=int(self.n / self.total * 1000))
-
-        _saved_cls = _tqdm_mod.tqdm
-        _tqdm_mod.tqdm = _ProgressTqdm
-        try:
-            return transcribe_fn()
-        finally:
-            _tqdm_mod.tqdm = _saved_cls
-
     def _is_repetitive(self, text):
         """检测文本是否存在大量重复（Whisper 幻觉特征）"""
         if len(text) < 20:
@@ -957,6 +1068,26 @@ class Bili2TextGUI:
                                            variable=self.rt_silence_detect_var)
         rt_silence_check.grid(row=2, column=0, columnspan=2, pady=5)
 
+        self.rt_dual_var = tk.BooleanVar(value=False)
+        rt_dual_check = ttk.Checkbutton(settings_frame,
+                                        text=f"双模型（{PREVIEW_MODEL} 即时预览，所选模型在后台定稿）",
+                                        variable=self.rt_dual_var,
+                                        command=self._update_rt_auto_switch_state)
+        rt_dual_check.grid(row=3, column=0, columnspan=2, pady=5)
+
+        self.rt_isolate_var = tk.BooleanVar(value=False)
+        rt_isolate_check = ttk.Checkbutton(settings_frame,
+                                           text="独立进程识别（大模型时录音和波形不卡顿）",
+                                           variable=self.rt_isolate_var)
+        rt_isolate_check.grid(row=4, column=0, columnspan=2, pady=5)
+
+        self.rt_auto_switch_var = tk.BooleanVar(value=False)
+        self.rt_auto_switch_check = ttk.Checkbutton(settings_frame,
+                                                    text="自动切换模型（延迟过大时换用更小的模型，恢复后换回）",
+                                                    variable=self.rt_auto_switch_var)
+        self.rt_auto_switch_check.grid(row=5, column=0, columnspan=2, pady=5)
+        self._update_rt_auto_switch_state()
+
         control_frame = ttk.Frame(self.realtime_frame)
         control_frame.pack(pady=10)
 
@@ -985,8 +1116,8 @@ class Bili2TextGUI:
         text_label = ttk.Label(self.realtime_frame, text="识别结果:")
         text_label.pack(pady=5)
 
-        self.realtime_text = scrolledtext.ScrolledText(self.realtime_frame, height=15, width=70)
-        self.realtime_text.pack(pady=5, padx=20, fill='both', expand=True)
+        self.realtime_view = TranscriptView(self.realtime_frame, height=15, width=70)
+        self.realtime_view.pack(pady=5, padx=20, fill='both', expand=True)
 
     def setup_about_tab(self):
         """设置关于标签页"""
@@ -1019,84 +1150,235 @@ GitHub: https://github.com/lanbinleo/bili2text
     # ---- Tab 2: 实时识别方法（不动） ----
 
     def start_realtime_recognition(self):
-        """开始实时识别"""
-        try:
-            model = self.model_var.get()
-            device = self.device_var.get()
-            if device == "自动检测" or device == "自动检测BlackHole":
-                device = None
+        """开始实时识别（模型加载和声卡初始化在后台线程进行，不阻塞界面）"""
+        model = self.model_var.get()
+        device = self.device_var.get()
+        if device == "自动检测" or device == "自动检测BlackHole":
+            device = None
+
+        keyword = self.keyword_var.get().strip()
+        if keyword:
+            prompt = f"以下是普通话的内容。这是关于{keyword}的内容。"
+        else:
+            prompt = ""
+
+        enable_filter = self.enable_filter_var.get()
+        # 所选模型本身就是预览模型时没有必要双模型
+        dual = self.rt_dual_var.get() and model != PREVIEW_MODEL
+        # 独立进程模式下模型在子进程中加载，不使用本进程的模型缓存
+        isolate = self.rt_isolate_var.get()
+
+        silence_kwargs = {}
+        if self.rt_silence_detect_var.get():
+            silence_kwargs = dict(
+                silence_warning_threshold=10,
+                silence_stop_threshold=30,
+                on_silence_warning=self._on_rt_silence_warning,
+                on_silence_stop=self._on_rt_silence_stop,
+                on_speech_resumed=self._on_rt_speech_resumed,
+            )
 
-            keyword = self.keyword_var.get().strip()
-            if keyword:
-                prompt = f"以下是普通话的内容。这是关于{keyword}的内容。"
-            else:
-                prompt = ""
+        dual_kwargs = {}
+        if dual:
+            dual_kwargs = dict(
+                provisional_callback=self._on_realtime_provisional,
+                final_callback=self._on_realtime_final,
+            )
 
-            enable_filter = self.enable_filter_var.get()
+        switch_kwargs = {}
+        if self.rt_auto_switch_var.get() and not dual:
+            switch_kwargs = dict(auto_switch=True)
+            if not isolate:
+                switch_kwargs["model_loader"] = lambda name: self._load_rt_fallback(name, model)
 
+        self.realtime_start_btn.config(state='disabled')
+        if not isolate and model_cache.is_loaded(model, BACKEND_OPENAI) and \
+                (not dual or model_cache.is_loaded(PREVIEW_MODEL, BACKEND_OPENAI)):
+            self.status_label.config(text="状态: 正在启动...")
+        else:
             self.status_label.config(text="状态: 正在加载模型...")
-            self.root.update()
 
-            silence_kwargs = {}
-            if self.rt_silence_detect_var.get():
-                silence_kwargs = dict(
-                    silence_warning_threshold=10,
-                    silence_stop_threshold=30,
-                    on_silence_warning=self._on_rt_silence_warning,
-                    on_silence_stop=self._on_rt_silence_stop,
-                    on_speech_resumed=self._on_rt_speech_resumed,
+        pins = []
+
+        def worker():
+            try:
+                from realtime_recognition import RealtimeRecognizer
+                # 双模型模式下识别线程直接使用的是预览模型
+                model_name = PREVIEW_MODEL if dual else model
+                if isolate:
+                    loaded = None
+                    if dual:
+                        dual_kwargs["final_model"] = model
+                else:
+                    if dual:
+                        # 预览和定稿两个模型在识别期间固定在缓存中，停止后缓存回到 MAX_MODELS 以内
+                        for name in (model, PREVIEW_MODEL):
+                            model_cache.pin(name, BACKEND_OPENAI)
+                            pins.append(name)
+                    loaded = model_cache.get(model, BACKEND_OPENAI).model
+                    if dual:
+                        dual_kwargs["final_model"] = loaded
+                        loaded = model_cache.get(PREVIEW_MODEL, BACKEND_OPENAI).model
+                recognizer = RealtimeRecognizer(
+                    model_name=model_name,
+                    model=loaded,
+                    isolate_inference=isolate,
+                    device_name=device,
+                    initial_prompt=prompt,
+                    enable_hallucination_filter=enable_filter,
+                    level_callback=self._on_audio_level,
+                    text_callback=self._on_realtime_text,
+                    status_callback=self._on_realtime_status,
+                    **silence_kwargs,
+                    **dual_kwargs,
+                    **switch_kwargs
                 )
+                recognizer.start_recording()
+            except Exception as e:
+                error = str(e)
+                self._unpin_rt_models(pins)
+                self.ui.post(self._on_realtime_start_failed, error)
+                return
+            self.ui.post(self._on_realtime_started, recognizer, pins)
 
-            self.recognizer = RealtimeRecognizer(
-                model_name=model,
-                device_name=device,
-                initial_prompt=prompt,
-                enable_hallucination_filter=enable_filter,
-                level_callback=self._on_audio_level,
-                **silence_kwargs
-            )
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _update_rt_auto_switch_state(self):
+        """双模型模式下识别线程跑的是最小的预览模型，无从降级，自动切换不可用"""
+        if self.rt_dual_var.get():
+            self.rt_auto_switch_var.set(False)
+            self.rt_auto_switch_check.config(state='disabled')
+        else:
+            self.rt_auto_switch_check.config(state='normal')
+
+    @staticmethod
+    def _load_rt_fallback(name, selected):
+        """
+        自动切换时加载模型：所选模型经模型缓存（换回时复用缓存中的副本），
+        更小的备用模型不经缓存，避免 MAX_MODELS=1 时把所选模型换出缓存
+        """
+        if name == selected:
+            return model_cache.get(name, BACKEND_OPENAI).model
+        from whisper_backend import load_backend
+        return load_backend(name, BACKEND_OPENAI).model
+
+    def _on_realtime_started(self, recognizer, pins=()):
+        """后台启动完成（主线程）"""
+        self.recognizer = recognizer
+        self._rt_pins = list(pins)
+        self.is_realtime_recording = True
+        self._start_waveform()
+
+        self.realtime_stop_btn.config(state='normal')
+        self.status_label.config(text="状态: 正在识别...")
+
+    @staticmethod
+    def _unpin_rt_models(pins):
+        """解除实时识别固定的模型（任意线程）"""
+        for name in pins:
+            model_cache.unpin(name, BACKEND_OPENAI)
+
+    def _on_realtime_start_failed(self, error):
+        """后台启动失败（主线程）"""
+        self.realtime_start_btn.config(state='normal')
+        messagebox.showerror("错误", f"启动识别失败: {error}")
+        self.status_label.config(text="状态: 错误")
+
+    # ---- 模型预热 ----
+
+    def _prewarm_backend(self):
+        """当前标签页要用的后端：实时识别固定 openai-whisper，文件识别按下拉框"""
+        if self.notebook.index('current') == 1:
+            return BACKEND_OPENAI
+        return backend_from_label(self.backend_var.get())
+
+    def _on_model_selected(self, event=None):
+        """模型/后端下拉框变化：记住选择，并在短暂去抖后后台预热"""
+        self._settings.update(model=self.model_var.get(), backend=self.backend_var.get())
+        save_settings(model=self._settings["model"], backend=self._settings["backend"])
+        self._schedule_prewarm()
+
+    def _on_tab_changed(self, event=None):
+        # 首次运行（用户尚未选择过模型）不做预热
+        if self._settings.get("model"):
+            self._schedule_prewarm()
+
+    def _schedule_prewarm(self):
+        # 用户连续切换时只预热最后选中的模型
+        if self._prewarm_after_id is not None:
+            self.root.after_cancel(self._prewarm_after_id)
+        self._prewarm_after_id = self.root.after(500, self._prewarm_model)
+
+    def _prewarm_model(self):
+        """后台预加载当前选择的模型到共享缓存"""
+        self._prewarm_after_id = None
+        model = self.model_var.get()
+        backend = self._prewarm_backend()
+        if model_cache.is_loaded(model, backend):
+            self.model_status_label.config(text=f"模型 {model} 已就绪")
+            return
 
-            self.recognizer.start_recording()
-            self.is_realtime_recording = True
-            self._start_waveform()
+        self.model_status_label.config(text=f"正在预加载 {model}...")
 
-            self.realtime_start_btn.config(state='disabled')
-            self.realtime_stop_btn.config(state='normal')
-            self.status_label.config(text="状态: 正在识别...")
+        def on_done(model_name, backend_name, error):
+            if error is not None:
+                text = f"模型 {model_name} 加载失败"
+            else:
+                text = f"模型 {model_name} 已就绪"
+            self.ui.post(self.model_status_label.config, text=text)
 
-            self.update_thread = threading.Thread(target=self._update_realtime_text)
-            self.update_thread.daemon = True
-            self.update_thread.start()
+        model_cache.prewarm(model, backend, callback=on_done)
 
-        except Exception as e:
-            messagebox.showerror("错误", f"启动识别失败: {str(e)}")
-            self.status_label.config(text="状态: 错误")
+    def stop_realtime_recognition(self, on_stopped=None):
+        """
+        停止实时识别：等待识别线程（双模型模式下还有定稿线程处理剩余音频）在后台进行，界面不卡顿
+        :param on_stopped: 停止完成后在主线程中调用 fn()（如退出程序），此时不再弹出完成提示
+        """
+        recognizer = self.recognizer
+        self.recognizer = None
+        pins, self._rt_pins = self._rt_pins, []
+        self.is_realtime_recording = False
+        self._stop_waveform()
+        # 停止完成前两个按钮都不可用
+        self.realtime_stop_btn.config(state='disabled')
 
-    def stop_realtime_recognition(self):
-        """停止实时识别"""
-        output_file = None
-        clean_output_file = None
+        if recognizer is None:
+            self._on_realtime_stopped(None, None, on_stopped)
+            return
 
-        if self.recognizer:
-            if hasattr(self.recognizer, 'output_file'):
-                output_file = self.recognizer.output_file
-            if hasattr(self.recognizer, 'clean_output_file'):
-                clean_output_file = self.recognizer.clean_output_file
+        output_file = getattr(recognizer, 'output_file', None)
+        clean_output_file = getattr(recognizer, 'clean_output_file', None)
+        if getattr(recognizer, 'final_model', None) is not None:
+            self.status_label.config(text="状态: 正在停止（定稿模型处理剩余音频）...")
+        else:
+            self.status_label.config(text="状态: 正在停止...")
 
-            self.recognizer.stop_recording()
-            self.is_realtime_recording = False
+        def worker():
+            try:
+                recognizer.stop_recording()
+                recognizer.cleanup()
+            except Exception as e:
+                print(f"停止实时识别出错: {e}")
+            # 定稿线程已处理完剩余音频，不再需要同时常驻两个模型
+            self._unpin_rt_models(pins)
+            self.ui.post(self._on_realtime_stopped, output_file, clean_output_file, on_stopped)
 
-            if self.update_thread:
-                self.update_thread.join(timeout=2)
+        threading.Thread(target=worker, daemon=True).start()
 
-            self.recognizer.cleanup()
-            self.recognizer = None
+    def _on_realtime_stopped(self, output_file, clean_output_file, on_stopped=None):
+        """后台停止完成（主线程）"""
+        if on_stopped is not None:
+            on_stopped()
+            return
 
-        self._stop_waveform()
         self.realtime_start_btn.config(state='normal')
-        self.realtime_stop_btn.config(state='disabled')
         self.status_label.config(text="状态: 已停止")
 
+        # 视图中较早的行已被移出时，改为分页显示完整的输出文件
+        # （经 ui 总线投递，排在已投递的识别文本之后）
+        if output_file and os.path.exists(output_file):
+            self.ui.post(self._show_realtime_file, output_file)
+
         # 记录可清理的输出文件
         rt_files = [f for f in [output_file, clean_output_file] if f]
         if rt_files:
@@ -1109,19 +1391,30 @@ GitHub: https://github.com/lanbinleo/bili2text
                 f"📝 带时间戳版本:\n{output_file}\n\n"
                 f"📄 干净版本(无时间戳):\n{clean_output_file}")
 
-    def _update_realtime_text(self):
-        """更新实时识别文本"""
-        while self.is_realtime_recording:
-            if self.recognizer:
-                new_texts = self.recognizer.get_latest_text()
-                for text in new_texts:
-                    self.realtime_text.insert(tk.END, text + "\n")
-                    self.realtime_text.see(tk.END)
-            time.sleep(0.5)
+    def _show_realtime_file(self, output_file):
+        if self.realtime_view.truncated:
+            self.realtime_view.load_file(output_file, at_end=True)
+
+    def _on_realtime_text(self, text):
+        """识别线程回调：新句子经 ui 总线追加到文本框，同批次多句合并为一次插入"""
+        self.ui.append(self.realtime_view, text + "\n")
+
+    def _on_realtime_status(self, status):
+        """识别线程回调：状态栏显示当前窗口长度和实时率"""
+        self.ui.post(self.status_label.config, text=f"状态: 正在识别 · {status}",
+                     key=(self.status_label, 'text'))
+
+    def _on_realtime_provisional(self, window_id, line):
+        """双模型：预览模型的临时结果（灰色显示）"""
+        self.ui.post(self.realtime_view.add_provisional, window_id, line)
+
+    def _on_realtime_final(self, window_ids, line):
+        """双模型：定稿结果原位替换对应窗口的预览"""
+        self.ui.post(self.realtime_view.replace_provisional, window_ids, line)
 
     def clear_realtime_text(self):
         """清空实时识别文本"""
-        self.realtime_text.delete(1.0, tk.END)
+        self.realtime_view.clear()
 
     # ---- 系统通知 ----
     def _send_notification(self, title, message):
@@ -1137,15 +1430,14 @@ GitHub: https://github.com/lanbinleo/bili2text
     # ---- 录音静音检测回调 ----
     def _on_silence_warning(self, duration):
         """录音: 静音警告"""
-        self.root.after(0, lambda: self.record_status_label.config(
-            text=f"录音状态: 静音警告! 已静音 {int(duration)} 秒",
-            foreground='orange'))
+        self._set_record_status(f"录音状态: 静音警告! 已静音 {int(duration)} 秒",
+                                foreground='orange')
         self._send_notification("录音静音警告",
                                 f"已静音 {int(duration)} 秒，30 秒后将自动停止")
 
     def _on_silence_stop(self, duration):
         """录音: 静音自动停止"""
-        self.root.after(0, lambda: self._do_silence_stop_recording(duration))
+        self.ui.post(self._do_silence_stop_recording, duration)
         self._send_notification("录音已自动停止",
                                 f"持续静音 {int(duration)} 秒，录音已自动停止")
 
@@ -1202,27 +1494,26 @@ GitHub: https://github.com/lanbinleo/bili2text
 
     def _on_speech_resumed(self):
         """录音: 声音恢复"""
-        self.root.after(0, lambda: self.record_status_label.config(
-            text="录音状态: 录制中（声音已恢复）",
-            foreground='green'))
+        self._set_record_status("录音状态: 录制中（声音已恢复）", foreground='green')
 
     # ---- Tab 2 静音检测回调 ----
     def _on_rt_silence_warning(self, duration):
         """Tab 2: 静音警告"""
-        self.root.after(0, lambda: self.status_label.config(
-            text=f"状态: 静音警告! 已静音 {int(duration)} 秒",
-            foreground='orange'))
+        self.ui.post(self.status_label.config, text=f"状态: 静音警告! 已静音 {int(duration)} 秒",
+                     foreground='orange', key=(self.status_label, 'text'))
         self._send_notification("实时识别静音警告",
                                 f"已静音 {int(duration)} 秒，30 秒后将自动停止")
 
     def _on_rt_silence_stop(self, duration):
         """Tab 2: 静音自动停止"""
-        self.root.after(0, lambda: self._do_rt_silence_stop(duration))
+        self.ui.post(self._do_rt_silence_stop, duration)
         self._send_notification("实时识别已自动停止",
                                 f"持续静音 {int(duration)} 秒，识别已自动停止")
 
     def _do_rt_silence_stop(self, duration):
         """在主线程中执行停止实时识别"""
+        if self.recognizer is None:
+            return  # 已手动停止（可能仍在后台收尾）
         self.status_label.config(
             text=f"状态: 已自动停止（静音 {int(duration)} 秒）",
             foreground='red')
@@ -1230,16 +1521,15 @@ GitHub: https://github.com/lanbinleo/bili2text
 
     def _on_rt_speech_resumed(self):
         """Tab 2: 声音恢复"""
-        self.root.after(0, lambda: self.status_label.config(
-            text="状态: 正在识别...",
-            foreground='black'))
+        self.ui.post(self.status_label.config, text="状态: 正在识别...",
+                     foreground='black', key=(self.status_label, 'text'))
 
 
 def main():
     """主函数"""
-    try:
-        import pyaudio
-    except ImportError:
+    profiling.start_from_env("window_realtime")
+    # 只检查是否安装，不在启动时加载
+    if importlib.util.find_spec("pyaudio") is None:
         messagebox.showerror("缺少依赖",
                              "请先安装pyaudio:\npip install pyaudio\n\n"
                              "macOS用户可能需要:\nbrew install portaudio\npip install pyaudio")
@@ -1254,8 +1544,9 @@ def main():
             app._test_monitor = None
         if app.is_realtime_recording:
             if messagebox.askokcancel("退出", "正在进行实时识别，确定要退出吗？"):
-                app.stop_realtime_recognition()
-                root.destroy()
+                # 窗口先隐藏，识别线程（及定稿线程）在后台收尾，写完输出文件后再退出
+                root.withdraw()
+                app.stop_realtime_recognition(on_stopped=root.destroy)
         elif app.audio_recorder and app.audio_recorder.recording:
             if messagebox.askokcancel("退出", "正在录音中，确定要退出吗？"):
                 app.stop_recording()
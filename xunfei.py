@@ -1,110 +1,293 @@
 # -*- coding: utf-8 -*-
+"""
+讯飞录音文件转写（raasr v2）客户端
+
+XunfeiClient 复用一个连接池化的 requests.Session，上传时直接流式发送文件（不整体读入内存），
+多个分片并发提交，所有请求经过同一个限频器；查询结果按订单预估时间起步、指数退避轮询，
+不再对每个分片固定 sleep(5)；网络错误和 429/5xx 响应按指数退避重试，重试用尽的分片报错而不是丢弃
+
+接口地址可通过 host 参数或环境变量 B2T_XUNFEI_HOST 指定（例如本地模拟服务 http://127.0.0.1:8000）
+"""
 import base64
 import hashlib
 import hmac
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
 import requests
-import urllib
+from requests.adapters import HTTPAdapter
 
-lfasr_host = 'https://raasr.xfyun.cn/v2/api'
+import metrics
+
+lfasr_host = os.environ.get("B2T_XUNFEI_HOST", 'https://raasr.xfyun.cn/v2/api')
 # 请求的接口名
 api_upload = '/upload'
 api_get_result = '/getResult'
 
+# 请填写您自己的appid和KEY（也可通过环境变量设置）
+XUNFEI_APPID = os.environ.get("XUNFEI_APPID", "1a1c1793")
+XUNFEI_SECRET_KEY = os.environ.get("XUNFEI_SECRET_KEY", "***")
 
-class RequestApi(object):
-    def __init__(self, appid, secret_key, upload_file_path):
+# 订单状态
+STATUS_DONE = 4
+STATUS_FAILED = -1
+
+# 可重试的 HTTP 状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class SliceFailures(Exception):
+    """部分分片重试后仍转写失败"""
+
+    def __init__(self, texts, errors):
+        """
+        :param texts: 与输入分片一一对应的文本，失败的分片为 None
+        :param errors: {分片序号: 异常}
+        """
+        super().__init__(f"讯飞转写失败: {len(errors)}/{len(texts)} 个分片（序号 "
+                         f"{', '.join(str(i + 1) for i in sorted(errors))}）")
+        self.texts = texts
+        self.errors = errors
+
+
+class RateLimiter:
+    """线程安全的限频器：相邻两次请求至少间隔 1/rate 秒"""
+
+    def __init__(self, rate):
+        """
+        :param rate: 每秒最多请求数，None 或 <=0 表示不限
+        """
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class XunfeiClient:
+    def __init__(self, appid=XUNFEI_APPID, secret_key=XUNFEI_SECRET_KEY, host=None,
+                 max_workers=8, rate_limit=5.0, poll_initial=1.0, poll_max=30.0,
+                 timeout=300.0, request_timeout=60, max_retries=3, retry_backoff=2.0):
+        """
+        :param appid: 讯飞开放平台 appid
+        :param secret_key: 讯飞开放平台 secret_key
+        :param host: 接口地址，默认取 lfasr_host
+        :param max_workers: 同时处理的分片数
+        :param rate_limit: 所有线程合计每秒最多请求数（上传和查询共用）
+        :param poll_initial: 首次查询前的最短等待（秒）
+        :param poll_max: 查询间隔上限（秒）
+        :param timeout: 单个订单等待结果的最长时间（秒）
+        :param request_timeout: 单次 HTTP 请求超时（秒）
+        :param max_retries: 网络错误或 429/5xx 响应时的最多重试次数
+        :param retry_backoff: 第一次重试前的等待（秒），之后每次翻倍
+        """
         self.appid = appid
         self.secret_key = secret_key
-        self.upload_file_path = upload_file_path
-        self.ts = str(int(time.time()))
-        self.signa = self.get_signa()
-
-    def get_signa(self):
-        appid = self.appid
-        secret_key = self.secret_key
-        m2 = hashlib.md5()
-        m2.update((appid + self.ts).encode('utf-8'))
-        md5 = m2.hexdigest()
-        md5 = bytes(md5, encoding='utf-8')
+        self.host = (host or lfasr_host).rstrip('/')
+        self.max_workers = max_workers
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.limiter = RateLimiter(rate_limit)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_workers, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _signed_params(self):
+        """每次请求重新生成 ts 和 signa，避免长任务中签名过期"""
+        ts = str(int(time.time()))
+        md5 = hashlib.md5((self.appid + ts).encode('utf-8')).hexdigest()
         # 以secret_key为key, 上面的md5为msg， 使用hashlib.sha1加密结果为signa
-        signa = hmac.new(secret_key.encode('utf-8'), md5, hashlib.sha1).digest()
-        signa = base64.b64encode(signa)
-        signa = str(signa, 'utf-8')
-        return signa
-
-
-    def upload(self):
-        print("上传部分：")
-        upload_file_path = self.upload_file_path
-        file_len = os.path.getsize(upload_file_path)
-        file_name = os.path.basename(upload_file_path)
-
-        param_dict = {}
-        param_dict['appId'] = self.appid
-        param_dict['signa'] = self.signa
-        param_dict['ts'] = self.ts
-        param_dict["fileSize"] = file_len
-        param_dict["fileName"] = file_name
-        param_dict["duration"] = "200"
-        print("upload参数：", param_dict)
-        data = open(upload_file_path, 'rb').read(file_len)
-
-        response = requests.post(url =lfasr_host + api_upload+"?"+urllib.parse.urlencode(param_dict),
-                                headers = {"Content-type":"application/json"},data=data)
-        print("upload_url:",response.request.url)
-        result = json.loads(response.text)
-        print("upload resp:", result)
-        return result
+        signa = hmac.new(self.secret_key.encode('utf-8'), md5.encode('utf-8'), hashlib.sha1).digest()
+        return {'appId': self.appid, 'signa': base64.b64encode(signa).decode('utf-8'), 'ts': ts}
 
+    def _post(self, api, params, data=None):
+        """
+        发送请求，网络错误和 429/5xx 响应按指数退避重试
+        :param data: 请求体；文件对象在重试前回到开头重新发送
+        """
+        attempt = 0
+        while True:
+            self.limiter.wait()
+            try:
+                response = self.session.post(url=self.host + api + "?" + urlencode(params),
+                                             headers={"Content-type": "application/json"},
+                                             data=data, timeout=self.request_timeout)
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                error = requests.HTTPError(f"{response.status_code} {response.reason}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise error
+            delay = self.retry_backoff * 2 ** attempt
+            attempt += 1
+            print(f"讯飞请求 {api} 失败（{error}），{delay:g} 秒后第 {attempt} 次重试")
+            time.sleep(delay)
+            if hasattr(data, "seek"):
+                data.seek(0)
 
-    def get_result(self):
-        uploadresp = self.upload()
-        orderId = uploadresp['content']['orderId']
-        param_dict = {}
-        param_dict['appId'] = self.appid
-        param_dict['signa'] = self.signa
-        param_dict['ts'] = self.ts
-        param_dict['orderId'] = orderId
-        param_dict['resultType'] = "transfer,predict"
-        print("")
-        print("查询部分：")
-        print("get result参数：", param_dict)
-        status = 3
-        # 建议使用回调的方式查询结果，查询接口有请求频率限制
-        while status == 3:
-            response = requests.post(url=lfasr_host + api_get_result + "?" + urllib.parse.urlencode(param_dict),
-                                     headers={"Content-type": "application/json"})
-            # print("get_result_url:",response.request.url)
-            result = json.loads(response.text)
-            print(result)
-            status = result['content']['orderInfo']['status']
-            print("status=",status)
-            if status == 4:
-                break
-            time.sleep(5)
-        print("get_result resp:",result)
-        return result
+    def upload(self, upload_file_path, duration="200"):
+        """
+        流式上传音频文件
+        :return: (orderId, 预估耗时毫秒)
+        """
+        params = self._signed_params()
+        params["fileSize"] = os.path.getsize(upload_file_path)
+        params["fileName"] = os.path.basename(upload_file_path)
+        params["duration"] = duration
+        with open(upload_file_path, 'rb') as f:
+            result = self._post(api_upload, params, data=f)
+        content = result.get('content') or {}
+        if 'orderId' not in content:
+            raise Exception(f"讯飞上传失败: {result.get('code')} {result.get('descInfo')}")
+        return content['orderId'], content.get('taskEstimateTime')
 
+    def get_result(self, order_id, estimate_ms=None):
+        """
+        轮询订单结果：首次等待取预估时间（不超过 poll_max），之后间隔逐次翻倍
+        :param order_id: 订单号
+        :param estimate_ms: 上传接口返回的预估耗时（毫秒）
+        :return: getResult 响应
+        """
+        delay = self.poll_initial
+        if estimate_ms:
+            delay = max(delay, estimate_ms / 1000.0)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            time.sleep(min(delay, self.poll_max))
+            params = self._signed_params()
+            params['orderId'] = order_id
+            params['resultType'] = "transfer,predict"
+            result = self._post(api_get_result, params)
+            order_info = (result.get('content') or {}).get('orderInfo') or {}
+            status = order_info.get('status')
+            if status == STATUS_DONE:
+                return result
+            if status == STATUS_FAILED or result.get('code') not in (None, '000000'):
+                raise Exception(f"讯飞转写失败: 订单 {order_id} {result.get('descInfo')} "
+                                f"failType={order_info.get('failType')}")
+            if time.monotonic() >= deadline:
+                raise Exception(f"讯飞转写超时: 订单 {order_id}")
+            delay = min(delay * 2, self.poll_max)
 
+    def transcribe(self, upload_file_path):
+        """上传并等待单个文件的转写结果（原始响应）"""
+        with metrics.span("remote_transcribe", file=os.path.basename(upload_file_path),
+                          bytes_in=metrics.file_size(upload_file_path)):
+            order_id, estimate_ms = self.upload(upload_file_path)
+            return self.get_result(order_id, estimate_ms)
+
+    def transcribe_slices(self, slice_paths, callback=None):
+        """
+        并发转写多个分片，按输入顺序返回文本
+        :param slice_paths: 分片路径列表（顺序即输出顺序）
+        :param callback: fn(index, path, text, error)，每个分片完成时调用（工作线程中；失败时 text 为 None）
+        :return: 文本列表，与 slice_paths 一一对应
+        :raises SliceFailures: 有分片重试后仍失败（其余分片照常完成，结果见异常的 texts）
+        """
+        errors = {}
+
+        def run(index, path):
+            try:
+                result = self.transcribe(path)
+                text = extract_and_format_transcription_from_string(json.dumps(result))
+                error = None
+            except Exception as e:
+                print(f"分片 {path} 转写失败: {e}")
+                text, error = None, e
+                errors[index] = e
+            if callback:
+                callback(index, path, text, error)
+            return text
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(run, i, path) for i, path in enumerate(slice_paths)]
+            texts = [f.result() for f in futures]
+        if errors:
+            raise SliceFailures(texts, errors)
+        return texts
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client():
+    """进程内共享的客户端（共享连接池和限频器）"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = XunfeiClient()
+        return _default_client
+
+
+class RequestApi(object):
+    """兼容旧接口：单个文件上传并查询"""
+
+    def __init__(self, appid, secret_key, upload_file_path, host=None):
+        self.client = XunfeiClient(appid, secret_key, host=host, max_workers=1)
+        self.upload_file_path = upload_file_path
+
+    def get_result(self):
+        try:
+            return self.client.transcribe(self.upload_file_path)
+        finally:
+            self.client.close()
 
 
 # 输入讯飞开放平台的appid，secret_key和待转写的文件路径
 def doRequest(folder, filename):
-    api = RequestApi(appid="1a1c1793",
-                     secret_key="***", # 请填写您自己的appid和KEY
-                     upload_file_path=rf"audio/slice/{folder}/{filename}")
-
-    res = api.get_result()
+    res = get_client().transcribe(rf"audio/slice/{folder}/{filename}")
     print(res)
     return res
 
-import json
+
+def transcribe_folder(folder, callback=None):
+    """
+    并发转写 audio/slice/{folder} 下的全部分片，按分片编号拼接
+    :param folder: 分片目录名
+    :param callback: 见 XunfeiClient.transcribe_slices
+    :return: 完整文本
+    :raises SliceFailures: 有分片转写失败（不会返回缺了分片的文本）
+    """
+    slice_dir = f"audio/slice/{folder}"
+    names = sorted(os.listdir(slice_dir), key=lambda n: int(os.path.splitext(n)[0]))
+    texts = get_client().transcribe_slices([os.path.join(slice_dir, n) for n in names], callback)
+    return "\n".join(t for t in texts if t)
+
+
 def extract_and_format_transcription_from_string(json_string):
     """
-    This function takes a JSON string as input, parses it, 
+    This function takes a JSON string as input, parses it,
     extracts the transcription result, and formats it into a paragraph.
 
     :param json_string: JSON string containing response data
@@ -122,7 +305,7 @@ def extract_and_format_transcription_from_string(json_string):
     for lattice in order_result.get("lattice", []):
         json_1best_str = lattice.get("json_1best", "{}")
         json_1best = json.loads(json_1best_str)
-        
+
         # Extract and process each word
         for rt in json_1best.get("st", {}).get("rt", []):
             sentence = ''.join([cw[0]["w"] for ws in rt["ws"] for cw in ws["cw"]])